@@ -0,0 +1,84 @@
+"""
+Сверка бэкендов инференса (eager, torch.compile, torch.export) на крошечной
+SigLIP-конфигурации со случайными весами.
+
+    python -m app.bench.backend_parity [--backends eager export] [--compile-mode max-autotune]
+
+Печатает расхождение вероятностей с eager и время прогона каждого бэкенда;
+код выхода 1, если расхождение превышает допуск.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import torch
+
+from app.bench.common import tiny_siglip_config
+from app.core.backends import BACKENDS, create_backend
+from app.core.model import DeepfakeSigLIP
+from app.core.precision import resolve_precision
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bench.backend_parity")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--compile-mode", default=None)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 3, 8],
+                        help="Разные размеры батча проверяют динамическую размерность batch.")
+    parser.add_argument("--tolerance", type=float, default=1e-4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    torch.manual_seed(args.seed)
+    config = tiny_siglip_config()
+    model = DeepfakeSigLIP(config=config)
+    torch.nn.init.normal_(model.classifier.weight, std=0.5)
+
+    policy = resolve_precision("fp32", "cpu", torch.float32)
+    model = policy.finalize_model(policy.prepare_model(model))
+
+    size = config.vision_config.image_size
+    inputs = [torch.randn(bs, 3, size, size) for bs in args.batch_sizes]
+    example = torch.randn(2, 3, size, size)
+
+    reference: Optional[List[torch.Tensor]] = None
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in dict.fromkeys(["eager"] + args.backends):
+            started = time.perf_counter()
+            runner = create_backend(
+                model,
+                name,
+                policy,
+                example,
+                artifact_path=str(Path(tmp) / "tiny.pt2"),
+                compile_mode=args.compile_mode,
+            )
+            setup = time.perf_counter() - started
+            if runner.name != name:
+                print(f"{name:>8}: недоступен на этой машине")
+                failed = True
+                continue
+
+            started = time.perf_counter()
+            with torch.no_grad():
+                probs = [torch.sigmoid(runner(x).float()).squeeze(-1) for x in inputs]
+            elapsed = time.perf_counter() - started
+
+            if reference is None:
+                reference = probs
+            diff = max(float((a - b).abs().max()) for a, b in zip(probs, reference))
+            status = "OK" if diff <= args.tolerance else "FAIL"
+            failed = failed or diff > args.tolerance
+            print(f"{name:>8}: max|dp|={diff:.2e} {status}  подготовка {setup:.2f} с, прогон {elapsed * 1000:.1f} мс")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Подбор полосы неуверенности каскада разрешений по размеченной выборке.
+
+    python -m app.bench.cascade --folder /data/labelled [--low-side 256] [--bands 0.05 0.1 0.2 0.3]
+
+Для каждой полосы печатается доля элементов, ушедших на полное разрешение,
+пропускная способность, ускорение, доля меток, отличающихся от полного
+разрешения при --threshold, и AUC, если задан --folder с real/ и fake/.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from app.bench.common import load_images, load_labelled_folder, roc_auc
+from app.bench.precision import _synthetic_frames
+from app.core.preprocess import is_image_path
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bench.cascade")
+    parser.add_argument("--folder", type=Path, default=None,
+                        help="Каталог real/ и fake/ с изображениями (иначе синтетика).")
+    parser.add_argument("--low-side", type=int, default=256)
+    parser.add_argument("--bands", nargs="+", type=float, default=[0.05, 0.1, 0.15, 0.2, 0.3])
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--side", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--precision", default=None)
+    args = parser.parse_args(argv)
+
+    from app.core.inference import CascadeConfig, DeepfakeClassifier
+
+    labels: Optional[List[int]] = None
+    if args.folder is not None:
+        items = [(p, y) for p, y in load_labelled_folder(args.folder) if is_image_path(p)]
+        images = load_images([p for p, _ in items])
+        labels = [y for _, y in items]
+    else:
+        images = _synthetic_frames(args.frames, args.side)
+
+    clf = DeepfakeClassifier(precision=args.precision)
+
+    def measure():
+        clf.predict_batch(images[: args.batch_size], batch_size=args.batch_size)  # прогрев
+        best, probs = float("inf"), []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            with clf.cascade_scope(args.threshold) as stats:
+                probs = clf.predict_batch(images, batch_size=args.batch_size)
+            best = min(best, time.perf_counter() - started)
+        return len(images) / best, probs, stats
+
+    base_speed, reference, _ = measure()
+    print(f"{'полоса':>7} {'на полном':>10} {'изобр/с':>9} {'ускор.':>7} {'max|dp|':>9} {'метки':>7}"
+          + ("   AUC" if labels else ""))
+    line = f"{'-':>7} {'100.0%':>10} {base_speed:>9.2f} {1.0:>6.2f}x {0.0:>9.5f} {0.0:>6.1%}"
+    print(line + (f"  {roc_auc(labels, reference):.4f}" if labels else ""))
+
+    for band in args.bands:
+        clf.cascade = CascadeConfig(low_side=args.low_side, band=band)
+        speed, probs, stats = measure()
+        drift = max(abs(a - b) for a, b in zip(probs, reference))
+        flipped = sum((a >= args.threshold) != (b >= args.threshold) for a, b in zip(probs, reference)) / len(probs)
+        line = (
+            f"{band:>7.2f} {stats.escalation_rate:>10.1%} {speed:>9.2f} {speed / base_speed:>6.2f}x "
+            f"{drift:>9.5f} {flipped:>6.1%}"
+        )
+        print(line + (f"  {roc_auc(labels, probs):.4f}" if labels else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""Общие утилиты бенчмарков: размеченные каталоги, AUC, размер модели."""
+from __future__ import annotations
+
+import io
+import time
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+import torch
+from PIL import Image as PILImage
+
+from app.core.preprocess import is_image_path
+from app.core.video import is_video_path
+
+
+# Имена подкаталогов верхнего уровня -> метка (1 — дипфейк).
+LABEL_DIRS = {"real": 0, "fake": 1, "deepfake": 1}
+
+
+def load_labelled_folder(folder: Path) -> List[Tuple[Path, int]]:
+    """Файлы из folder/real и folder/fake (рекурсивно) с метками."""
+    items: List[Tuple[Path, int]] = []
+    for sub in sorted(Path(folder).iterdir()):
+        label = LABEL_DIRS.get(sub.name.lower())
+        if label is None or not sub.is_dir():
+            continue
+        for path in sorted(sub.rglob("*")):
+            if path.is_file() and (is_image_path(path) or is_video_path(path)):
+                items.append((path, label))
+    return items
+
+
+def roc_auc(labels: Sequence[int], scores: Sequence[float]) -> float:
+    """AUC через статистику Манна–Уитни (средние ранги для равных значений)."""
+    order = sorted(range(len(scores)), key=lambda i: scores[i])
+    ranks = [0.0] * len(scores)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and scores[order[j + 1]] == scores[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[order[k]] = (i + j) / 2.0 + 1.0
+        i = j + 1
+
+    n_pos = sum(1 for y in labels if y == 1)
+    n_neg = len(labels) - n_pos
+    if n_pos == 0 or n_neg == 0:
+        return float("nan")
+    rank_sum = sum(r for r, y in zip(ranks, labels) if y == 1)
+    return (rank_sum - n_pos * (n_pos + 1) / 2.0) / (n_pos * n_neg)
+
+
+def model_size_mb(model: torch.nn.Module) -> float:
+    """Размер сериализованного state_dict (учитывает упакованные int8-веса)."""
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell() / (1024 * 1024)
+
+
+def tiny_siglip_config(image_size: int = 64, patch_size: int = 16, hidden_size: int = 32, layers: int = 2):
+    """Крошечная SigLIP-конфигурация со случайными весами для проверок без чекпоинта."""
+    from transformers import SiglipConfig
+
+    return SiglipConfig(
+        vision_config=dict(
+            hidden_size=hidden_size,
+            intermediate_size=hidden_size * 2,
+            num_hidden_layers=layers,
+            num_attention_heads=2,
+            image_size=image_size,
+            patch_size=patch_size,
+        ),
+        text_config=dict(
+            hidden_size=hidden_size,
+            intermediate_size=hidden_size * 2,
+            num_hidden_layers=1,
+            num_attention_heads=2,
+            vocab_size=100,
+            max_position_embeddings=16,
+        ),
+    )
+
+
+def make_synthetic_video(
+    path: Path,
+    seconds: float = 10.0,
+    fps: int = 30,
+    size: Tuple[int, int] = (320, 240),
+    gop: int = 250,
+    codec: str = "libx264",
+) -> Path:
+    """
+    Синтетическое видео через PyAV: движущийся градиент с номером кадра в
+    яркости первой строки (для проверки, какой кадр был выбран). gop — интервал
+    ключевых кадров.
+    """
+    import av
+    import numpy as np
+
+    width, height = size
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    yy, xx = np.mgrid[0:height, 0:width]
+    with av.open(str(path), mode="w") as container:
+        stream = container.add_stream(codec, rate=fps)
+        stream.width, stream.height = width, height
+        stream.pix_fmt = "yuv420p"
+        stream.gop_size = gop
+        if codec == "libx264":
+            stream.options = {"keyint": str(gop), "min-keyint": str(gop), "scenecut": "0", "preset": "ultrafast"}
+        for i in range(int(seconds * fps)):
+            rgb = np.empty((height, width, 3), dtype=np.uint8)
+            rgb[..., 0] = (xx + 3 * i) % 256
+            rgb[..., 1] = (yy + i) % 256
+            rgb[..., 2] = (i * 7) % 256
+            frame = av.VideoFrame.from_ndarray(rgb, format="rgb24")
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    return path
+
+
+def load_images(paths: Sequence[Path]) -> List[PILImage.Image]:
+    images = []
+    for p in paths:
+        with PILImage.open(p) as img:
+            img.load()
+            images.append(img.copy())
+    return images
+
+
+def score_items(classifier, items: Sequence[Tuple[Path, int]], batch_size: int = 16) -> Tuple[List[float], float]:
+    """Вероятности для размеченных файлов (в исходном порядке) и чистое время инференса."""
+    image_idx = [i for i, (p, _) in enumerate(items) if is_image_path(p)]
+    images = load_images([items[i][0] for i in image_idx])
+    probs: List[float] = [0.0] * len(items)
+
+    started = time.perf_counter()
+    for i, prob in zip(image_idx, classifier.predict_batch(images, batch_size=batch_size)):
+        probs[i] = prob
+    for i, (path, _) in enumerate(items):
+        if is_video_path(path):
+            probs[i] = classifier.predict_video(path, batch_size=batch_size).prob_deepfake
+    return probs, time.perf_counter() - started
@@ -0,0 +1,65 @@
+"""
+Сравнение стратегий выборки кадров OpenCV: seek (CAP_PROP_POS_FRAMES на каждую
+цель), linear (grab() подряд, retrieve() только целей) и auto.
+
+    python -m app.bench.opencv_sampling [video ...] [--repeat 3] [--max-side 768]
+
+Без аргументов генерирует синтетические видео с коротким и длинным GOP.
+Печатает время каждой стратегии, число кадров и расхождение кадров с seek.
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from app.bench.common import make_synthetic_video
+from app.core.video import _read_with_opencv
+
+
+STRATEGIES = ("seek", "linear", "auto")
+
+
+def _bench_video(path: Path, max_side: int, repeat: int) -> None:
+    reference = None
+    print(f"\n{path.name}")
+    print(f"{'стратегия':>10} {'кадров':>7} {'мин, с':>8} {'сред, с':>8} {'макс |Δ| с seek':>16}")
+    for strategy in STRATEGIES:
+        times: List[float] = []
+        frames: List[np.ndarray] = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            frames, _meta = _read_with_opencv(path, max_side, sampling=strategy)
+            times.append(time.perf_counter() - started)
+        if reference is None:
+            reference = frames
+        diff = "-"
+        if len(frames) == len(reference) and frames:
+            diff = str(max(int(np.abs(a.astype(np.int16) - b.astype(np.int16)).max()) for a, b in zip(frames, reference)))
+        print(f"{strategy:>10} {len(frames):>7} {min(times):>8.3f} {sum(times) / len(times):>8.3f} {diff:>16}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.bench.opencv_sampling")
+    parser.add_argument("videos", nargs="*", type=Path)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-side", type=int, default=768)
+    parser.add_argument("--seconds", type=float, default=20.0, help="Длина синтетических видео.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        videos = list(args.videos)
+        if not videos:
+            # Короткий GOP — выгоден seek; длинный GOP с плотной выборкой — linear.
+            for gop in (12, 300):
+                videos.append(make_synthetic_video(Path(tmp) / f"synthetic_gop{gop}.mp4", seconds=args.seconds, gop=gop))
+        for path in videos:
+            _bench_video(path, args.max_side, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Скорость и точность режимов PrecisionPolicy на текущем устройстве.
+
+    python -m app.bench.precision [--modes fp32 bf16-autocast int8] [--folder /data/labelled]
+
+Без --folder используются синтетические кадры. Для каждого режима печатается
+пропускная способность и расхождение вероятностей с fp32; режимы, которые
+устройство не поддерживает, пропускаются.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from app.bench.common import load_labelled_folder, load_images, roc_auc
+from app.core.precision import PRECISION_MODES
+from app.core.preprocess import is_image_path
+
+
+def _synthetic_frames(n: int, side: int, seed: int = 0) -> List[np.ndarray]:
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, size=(side, side, 3), dtype=np.uint8) for _ in range(n)]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bench.precision")
+    parser.add_argument("--modes", nargs="+", choices=PRECISION_MODES,
+                        default=[m for m in PRECISION_MODES if m != "auto"])
+    parser.add_argument("--folder", type=Path, default=None,
+                        help="Каталог real/ и fake/ с изображениями (иначе синтетика).")
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--side", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    from app.core.inference import DeepfakeClassifier
+
+    labels: Optional[List[int]] = None
+    if args.folder is not None:
+        items = [(p, y) for p, y in load_labelled_folder(args.folder) if is_image_path(p)]
+        images = load_images([p for p, _ in items])
+        labels = [y for _, y in items]
+    else:
+        images = _synthetic_frames(args.frames, args.side)
+
+    modes = list(dict.fromkeys(["fp32"] + args.modes))
+    reference: Optional[List[float]] = None
+    print(f"{'mode':>14} {'кадр/с':>9} {'max|dp|':>9} {'mean|dp|':>9}" + ("  AUC" if labels else ""))
+    for mode in modes:
+        clf = DeepfakeClassifier(precision=mode)
+        if clf.precision != mode:
+            print(f"{mode:>14} пропущен: не поддерживается на {clf.device}")
+            del clf
+            gc.collect()
+            continue
+
+        clf.predict_batch(images[: args.batch_size], batch_size=args.batch_size)  # прогрев
+        best = float("inf")
+        probs: List[float] = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            probs = clf.predict_batch(images, batch_size=args.batch_size)
+            best = min(best, time.perf_counter() - started)
+
+        if reference is None:
+            reference = probs
+        drift = [abs(a - b) for a, b in zip(probs, reference)]
+        line = f"{mode:>14} {len(images) / best:9.2f} {max(drift):9.5f} {sum(drift) / len(drift):9.5f}"
+        if labels:
+            line += f"  {roc_auc(labels, probs):.4f}"
+        print(line)
+
+        del clf
+        gc.collect()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
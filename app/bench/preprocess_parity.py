@@ -0,0 +1,148 @@
+"""
+Сверка TensorPreprocessor с AutoImageProcessor на одних и тех же изображениях.
+
+    python -m app.bench.preprocess_parity [каталог_с_изображениями] --tolerance 0.02
+
+Без каталога используются синтетические изображения разных размеров и режимов
+(RGB, L, RGBA, uint8-массивы). Проверять нужно на боевом чекпоинте (--ckpt):
+расхождение ресайза зависит от размера входа модели, и на игрушечном 64px оно
+почти не видно. Проверяются и максимум, и среднее расхождение; ``--model``
+дополнительно сравнивает вероятности модели. Код выхода 1, если расхождение
+превышает допуск. ``--frames N`` замеряет оба пути на батчах из N видеокадров
+типичных разрешений — так предобработка вызывается при анализе видео.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import torch
+from PIL import Image as PILImage
+from transformers import AutoImageProcessor
+
+from app.config.settings import CKPT_DIR
+from app.core.preprocess import is_image_path, normalize_image_to_rgb
+from app.core.tensor_preprocess import TensorPreprocessor
+
+
+def synthetic_images(seed: int = 0) -> List:
+    rng = np.random.default_rng(seed)
+    images: List = []
+    for h, w in [(224, 224), (480, 640), (768, 432), (97, 1301), (2000, 1500)]:
+        # Гладкий градиент + шум: ресайз проверяется не только на белом шуме.
+        yy, xx = np.mgrid[0:h, 0:w]
+        base = np.stack([xx * 255 // max(w - 1, 1), yy * 255 // max(h - 1, 1), (xx + yy) % 256], axis=2)
+        noise = rng.integers(-20, 21, size=(h, w, 3))
+        arr = np.clip(base + noise, 0, 255).astype(np.uint8)
+        images.append(arr)
+        images.append(PILImage.fromarray(arr))
+    images.append(PILImage.fromarray(images[2][:, :, 0], mode="L"))
+    rgba = np.concatenate([images[2], rng.integers(0, 256, size=images[2].shape[:2] + (1,), dtype=np.uint8)], axis=2)
+    images.append(PILImage.fromarray(rgba, mode="RGBA"))
+    return images
+
+
+def folder_images(folder: Path, limit: int) -> List:
+    images: List = []
+    for path in sorted(folder.rglob("*")):
+        if len(images) >= limit:
+            break
+        if path.is_file() and is_image_path(path):
+            with PILImage.open(path) as img:
+                img.load()
+                images.append(img.copy())
+    return images
+
+
+# Разрешения видеокадров для замера скорости (H, W).
+FRAME_SIZES = [(432, 768), (720, 1280), (1080, 1920)]
+
+
+def _reference(processor, images: List) -> torch.Tensor:
+    pil = [normalize_image_to_rgb(im if isinstance(im, PILImage.Image) else PILImage.fromarray(im)) for im in images]
+    return processor(images=pil, return_tensors="pt")["pixel_values"].float()
+
+
+def frame_timings(processor, tensor_pre: TensorPreprocessor, n_frames: int, repeats: int = 3) -> None:
+    """Время обоих путей на списке HWC uint8 кадров, как в DeepfakeClassifier._preprocess (лучшее из repeats)."""
+    rng = np.random.default_rng(0)
+    for h, w in FRAME_SIZES:
+        frames = list(rng.integers(0, 256, size=(n_frames, h, w, 3), dtype=np.uint8))
+        timings = []
+        for run in (lambda: _reference(processor, frames), lambda: tensor_pre(frames)):
+            best = float("inf")
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                run()
+                best = min(best, time.perf_counter() - t0)
+            timings.append(best)
+        print(f"{n_frames}x{h}x{w}: AutoImageProcessor {timings[0] * 1000:.1f} ms, "
+              f"TensorPreprocessor {timings[1] * 1000:.1f} ms")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bench.preprocess_parity")
+    parser.add_argument("folder", nargs="?", type=Path, default=None)
+    parser.add_argument("--limit", type=int, default=64)
+    parser.add_argument("--ckpt", default=CKPT_DIR)
+    parser.add_argument("--max-tol", type=float, default=0.08,
+                        help="Допуск на max|diff| в нормализованных единицах (1/127.5 ≈ 0.008 — один уровень яркости).")
+    parser.add_argument("--mean-tol", type=float, default=0.004)
+    parser.add_argument("--model", action="store_true",
+                        help="Сравнить вероятности DeepfakeClassifier для обоих путей предобработки.")
+    parser.add_argument("--prob-tol", type=float, default=0.01)
+    parser.add_argument("--frames", type=int, default=0,
+                        help="Замерить скорость на батчах из N видеокадров (0 — не замерять).")
+    args = parser.parse_args(argv)
+
+    images = folder_images(args.folder, args.limit) if args.folder else synthetic_images()
+    if not images:
+        print("Нет изображений для сверки.")
+        return 1
+
+    processor = AutoImageProcessor.from_pretrained(args.ckpt)
+    tensor_pre = TensorPreprocessor(args.ckpt)
+
+    t0 = time.perf_counter()
+    ref = _reference(processor, images)
+    t_ref = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    out = tensor_pre(images).clone()
+    t_new = time.perf_counter() - t0
+
+    diff = (ref - out).abs()
+    max_diff = float(diff.max())
+    mean_diff = float(diff.mean())
+    print(f"images={len(images)} shape={tuple(out.shape)}")
+    print(f"max|diff|={max_diff:.5f} (tol {args.max_tol}) mean|diff|={mean_diff:.6f} (tol {args.mean_tol})")
+    print(f"AutoImageProcessor: {t_ref * 1000:.1f} ms, TensorPreprocessor: {t_new * 1000:.1f} ms")
+
+    if args.frames > 0:
+        frame_timings(processor, tensor_pre, args.frames)
+
+    failed = max_diff > args.max_tol or mean_diff > args.mean_tol
+    if args.model:
+        from app.core.inference import DeepfakeClassifier
+
+        clf = DeepfakeClassifier(preprocess="tensor", ckpt_dir=args.ckpt)
+        probs_new = clf.predict_batch(images)
+        clf.tensor_preprocessor = None
+        probs_ref = clf.predict_batch(images)
+        prob_diff = max(abs(a - b) for a, b in zip(probs_new, probs_ref))
+        print(f"max|prob diff|={prob_diff:.5f} (tol {args.prob_tol})")
+        failed = failed or prob_diff > args.prob_tol
+
+    if failed:
+        print("FAIL: расхождение превышает допуск")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Сравнение fp32 и динамического int8 на размеченном каталоге (real/, fake/).
+
+    python -m app.bench.quantization /data/labelled --batch-size 16 --repeat 3
+
+Отчёт: дрейф вероятностей, число смен решения при пороге, AUC обоих режимов,
+пропускная способность и память (размер весов и прирост RSS при загрузке).
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from app.bench.common import load_labelled_folder, model_size_mb, roc_auc, score_items
+from app.services.memory import current_rss_mb, peak_rss_mb
+
+
+def _run_mode(precision: str, items, batch_size: int, repeat: int) -> dict:
+    from app.core.inference import DeepfakeClassifier
+
+    gc.collect()
+    rss_before = current_rss_mb()
+    clf = DeepfakeClassifier(precision=precision)
+    rss_loaded = current_rss_mb() - rss_before
+
+    score_items(clf, items[:batch_size], batch_size)  # прогрев
+    best = float("inf")
+    probs: List[float] = []
+    for _ in range(repeat):
+        probs, elapsed = score_items(clf, items, batch_size)
+        best = min(best, elapsed)
+
+    result = {
+        "precision": precision,
+        "probs": probs,
+        "seconds": best,
+        "items_per_sec": len(items) / best if best > 0 else float("inf"),
+        "model_mb": model_size_mb(clf.model),
+        "load_rss_mb": rss_loaded,
+    }
+    del clf
+    gc.collect()
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bench.quantization")
+    parser.add_argument("folder", type=Path, help="Каталог с подкаталогами real/ и fake/.")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    items = load_labelled_folder(args.folder)
+    if not items:
+        print(f"В {args.folder} нет файлов в real/ или fake/.")
+        return 1
+    labels = [y for _, y in items]
+
+    fp32 = _run_mode("fp32", items, args.batch_size, args.repeat)
+    int8 = _run_mode("int8", items, args.batch_size, args.repeat)
+
+    drift = [abs(a - b) for a, b in zip(fp32["probs"], int8["probs"])]
+    flips = sum((a >= args.threshold) != (b >= args.threshold) for a, b in zip(fp32["probs"], int8["probs"]))
+    auc_fp32 = roc_auc(labels, fp32["probs"])
+    auc_int8 = roc_auc(labels, int8["probs"])
+
+    print(f"Файлов: {len(items)} (дипфейков: {sum(labels)})")
+    print(f"Дрейф вероятностей: max={max(drift):.5f} mean={sum(drift) / len(drift):.5f}, смен решения: {flips}")
+    print(f"AUC: fp32={auc_fp32:.4f} int8={auc_int8:.4f} delta={auc_int8 - auc_fp32:+.4f}")
+    for r in (fp32, int8):
+        print(
+            f"{r['precision']:>5}: {r['items_per_sec']:.2f} файл/с, веса {r['model_mb']:.1f} МБ, "
+            f"RSS при загрузке +{r['load_rss_mb']:.0f} МБ"
+        )
+    print(
+        f"Ускорение int8: x{int8['items_per_sec'] / fp32['items_per_sec']:.2f}, "
+        f"веса x{fp32['model_mb'] / int8['model_mb']:.2f} меньше; пиковый RSS процесса {peak_rss_mb():.0f} МБ"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
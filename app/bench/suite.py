@@ -0,0 +1,370 @@
+"""
+Воспроизводимый офлайн-бенчмарк декодирования, предобработки и инференса:
+без настоящих весов и медиа (крошечная SigLIP со случайными весами,
+синтетические видео PyAV в нескольких кодеках, разрешениях, длинах и GOP).
+
+    python -m app.bench.suite run --out bench.json [--quick]
+    python -m app.bench.suite compare baseline.json bench.json [--tolerance 0.15]
+    python -m app.bench.suite run --out bench.json --baseline baseline.json
+
+Метрики: кадры/с _read_with_pyav и _read_with_opencv, изображения/с
+normalize_image_to_rgb + AutoImageProcessor (и TensorPreprocessor), пропускная
+способность и задержка батча predict_batch по размерам батча и числу потоков.
+compare помечает метрики, ухудшившиеся больше чем на tolerance, и возвращает
+код выхода 1 при регрессии.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from app.bench.common import make_synthetic_video, tiny_siglip_config
+
+
+SCHEMA_VERSION = 1
+
+
+@dataclass(frozen=True)
+class VideoSpec:
+    codec: str
+    size: Tuple[int, int]
+    seconds: float
+    gop: int
+    fps: int = 30
+
+    @property
+    def name(self) -> str:
+        return f"{self.codec}_{self.size[0]}x{self.size[1]}_{self.seconds:g}s_gop{self.gop}"
+
+    @property
+    def suffix(self) -> str:
+        return ".webm" if self.codec.startswith("libvpx") else ".mp4"
+
+
+# Матрица видео: кодек x разрешение x длина x GOP (полный перебор слишком долог, берём срез).
+VIDEO_SPECS = (
+    VideoSpec("libx264", (320, 240), 10, 12),
+    VideoSpec("libx264", (320, 240), 10, 250),
+    VideoSpec("libx264", (1280, 720), 10, 250),
+    VideoSpec("libx264", (640, 360), 60, 250),
+    VideoSpec("mpeg4", (640, 360), 10, 30),
+    VideoSpec("libvpx-vp9", (640, 360), 10, 120),
+)
+
+QUICK_VIDEO_SPECS = (
+    VideoSpec("libx264", (320, 240), 4, 12),
+    VideoSpec("mpeg4", (320, 240), 4, 30),
+)
+
+
+@dataclass
+class Metric:
+    value: float
+    unit: str
+    higher_is_better: bool = True
+
+
+# ---------------------------------------------------------------------------
+# Окружение
+# ---------------------------------------------------------------------------
+
+def build_tiny_checkpoint(ckpt_dir: Path, image_size: int = 64, seed: int = 0) -> Path:
+    """Каталог чекпоинта DeepfakeSigLIP со случайными весами: config.json, model.safetensors, preprocessor_config.json."""
+    from safetensors.torch import save_file
+
+    from app.core.model import DeepfakeSigLIP
+
+    torch.manual_seed(seed)
+    config = tiny_siglip_config(image_size=image_size)
+    model = DeepfakeSigLIP(config=config)
+    torch.nn.init.normal_(model.classifier.weight, std=0.5)
+
+    ckpt_dir = Path(ckpt_dir)
+    ckpt_dir.mkdir(parents=True, exist_ok=True)
+    config.save_pretrained(ckpt_dir)
+    state = {k: v.detach().clone().contiguous() for k, v in model.state_dict().items()}
+    save_file(state, str(ckpt_dir / "model.safetensors"))
+    preprocessor = {
+        "image_processor_type": "SiglipImageProcessor",
+        "do_convert_rgb": True,
+        "do_resize": True,
+        "do_rescale": True,
+        "do_normalize": True,
+        "image_mean": [0.5, 0.5, 0.5],
+        "image_std": [0.5, 0.5, 0.5],
+        "resample": 3,
+        "rescale_factor": 1 / 255,
+        "size": {"height": image_size, "width": image_size},
+    }
+    (ckpt_dir / "preprocessor_config.json").write_text(json.dumps(preprocessor, indent=2), encoding="utf-8")
+    return ckpt_dir
+
+
+def environment() -> Dict:
+    import av
+    import cv2
+    import transformers
+
+    return {
+        "schema": SCHEMA_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "transformers": transformers.__version__,
+        "av": av.__version__,
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def _best_time(fn: Callable[[], object], repeat: int, warmup: int = 1) -> Tuple[float, List[float]]:
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return min(times), times
+
+
+# ---------------------------------------------------------------------------
+# Группы замеров
+# ---------------------------------------------------------------------------
+
+def bench_decode(video_dir: Path, specs, max_side: int, repeat: int) -> Dict[str, Metric]:
+    from app.core.video import _read_with_opencv, _read_with_pyav
+
+    results: Dict[str, Metric] = {}
+    for spec in specs:
+        path = video_dir / f"{spec.name}{spec.suffix}"
+        if not path.exists():
+            try:
+                make_synthetic_video(path, seconds=spec.seconds, fps=spec.fps, size=spec.size, gop=spec.gop, codec=spec.codec)
+            except Exception as e:
+                print(f"  {spec.name}: кодек недоступен ({e})", file=sys.stderr)
+                continue
+
+        for backend, read in (("pyav", _read_with_pyav), ("opencv", _read_with_opencv)):
+            frames: List = []
+
+            def run() -> None:
+                nonlocal frames
+                frames, _meta = read(path, max_side)
+
+            try:
+                best, _ = _best_time(run, repeat, warmup=0)
+            except Exception as e:
+                print(f"  decode.{backend}.{spec.name}: ошибка ({e})", file=sys.stderr)
+                continue
+            results[f"decode.{backend}.{spec.name}.fps"] = Metric(len(frames) / best, "frames/s")
+            print(f"  decode {backend:>6} {spec.name:<32} {len(frames):>4} кадров {len(frames) / best:>9.1f} кадр/с")
+    return results
+
+
+def _synthetic_images(n: int, sizes, seed: int = 0):
+    from PIL import Image as PILImage
+
+    rng = np.random.default_rng(seed)
+    images = []
+    for i in range(n):
+        w, h = sizes[i % len(sizes)]
+        images.append(PILImage.fromarray(rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8)))
+    return images
+
+
+def bench_preprocess(ckpt_dir: Path, n_images: int, repeat: int) -> Dict[str, Metric]:
+    from transformers import AutoImageProcessor
+
+    from app.core.preprocess import normalize_image_to_rgb
+    from app.core.tensor_preprocess import TensorPreprocessor
+
+    processor = AutoImageProcessor.from_pretrained(str(ckpt_dir))
+    tensor_pre = TensorPreprocessor(str(ckpt_dir))
+    results: Dict[str, Metric] = {}
+    for label, sizes in (("640x480", [(640, 480)]), ("mixed", [(640, 480), (1280, 720), (512, 512)])):
+        images = _synthetic_images(n_images, sizes)
+
+        def via_processor() -> None:
+            processor(images=[normalize_image_to_rgb(im) for im in images], return_tensors="pt")
+
+        def via_tensor() -> None:
+            tensor_pre(images)
+
+        for name, fn in (("processor", via_processor), ("tensor", via_tensor)):
+            best, _ = _best_time(fn, repeat)
+            results[f"preprocess.{name}.{label}.images_per_sec"] = Metric(n_images / best, "images/s")
+            print(f"  preprocess {name:>9} {label:<8} {n_images / best:>9.1f} изобр/с")
+    return results
+
+
+def bench_inference(ckpt_dir: Path, batch_sizes, thread_counts, n_images: int, repeat: int) -> Dict[str, Metric]:
+    from app.core.inference import DeepfakeClassifier
+
+    clf = DeepfakeClassifier(precision="fp32", ckpt_dir=str(ckpt_dir))
+    images = [np.array(im) for im in _synthetic_images(n_images, [(640, 480)])]
+    results: Dict[str, Metric] = {}
+    original_threads = torch.get_num_threads()
+    try:
+        for threads in thread_counts:
+            torch.set_num_threads(threads)
+            for bs in batch_sizes:
+                batch = images[:bs]
+                # Задержка одного батча и пропускная способность на n_images.
+                _, latencies = _best_time(lambda: clf.predict_batch(batch, batch_size=bs), max(repeat, 5))
+                best, _ = _best_time(lambda: clf.predict_batch(images, batch_size=bs), repeat)
+                prefix = f"inference.bs{bs}.threads{threads}"
+                results[f"{prefix}.images_per_sec"] = Metric(n_images / best, "images/s")
+                results[f"{prefix}.latency_p50_ms"] = Metric(statistics.median(latencies) * 1000, "ms", False)
+                results[f"{prefix}.latency_max_ms"] = Metric(max(latencies) * 1000, "ms", False)
+                print(
+                    f"  inference bs={bs:<3} threads={threads:<3} {n_images / best:>9.1f} изобр/с  "
+                    f"p50 {statistics.median(latencies) * 1000:.2f} мс"
+                )
+    finally:
+        torch.set_num_threads(original_threads)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Запуск и сравнение
+# ---------------------------------------------------------------------------
+
+def run_suite(
+    quick: bool = False,
+    groups=("decode", "preprocess", "inference"),
+    repeat: int = 3,
+    work_dir: Optional[Path] = None,
+    max_side: int = 768,
+    seed: int = 0,
+) -> Dict:
+    cpu = os.cpu_count() or 1
+    specs = QUICK_VIDEO_SPECS if quick else VIDEO_SPECS
+    batch_sizes = (1, 8) if quick else (1, 4, 16, 32)
+    thread_counts = sorted({1, cpu}) if quick else sorted({1, max(1, cpu // 2), cpu})
+    n_images = 32 if quick else 128
+
+    torch.manual_seed(seed)
+    metrics: Dict[str, Metric] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(work_dir) if work_dir is not None else Path(tmp)
+        ckpt_dir = build_tiny_checkpoint(root / "tiny-checkpoint", seed=seed)
+        if "decode" in groups:
+            print("Декодирование:")
+            metrics.update(bench_decode(root / "videos", specs, max_side, repeat))
+        if "preprocess" in groups:
+            print("Предобработка:")
+            metrics.update(bench_preprocess(ckpt_dir, n_images, repeat))
+        if "inference" in groups:
+            print("Инференс:")
+            metrics.update(bench_inference(ckpt_dir, batch_sizes, thread_counts, n_images, repeat))
+
+    return {
+        "environment": environment(),
+        "config": {"quick": quick, "repeat": repeat, "max_side": max_side, "seed": seed, "groups": list(groups)},
+        "metrics": {name: asdict(m) for name, m in sorted(metrics.items())},
+    }
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float = 0.15) -> Tuple[List[str], List[str]]:
+    """
+    Сравнить метрики с базовыми; возвращает (регрессии, улучшения) — строки отчёта.
+    Регрессия — ухудшение больше чем на tolerance (доля) в сторону higher_is_better.
+    """
+    base, cur = baseline.get("metrics", {}), current.get("metrics", {})
+    regressions: List[str] = []
+    improvements: List[str] = []
+    print(f"{'метрика':<52} {'база':>10} {'сейчас':>10} {'изм.':>8}")
+    for name in sorted(set(base) & set(cur)):
+        b, c = base[name]["value"], cur[name]["value"]
+        if not b:
+            continue
+        change = (c - b) / b
+        worse = -change if base[name].get("higher_is_better", True) else change
+        mark = ""
+        line = f"{name:<52} {b:>10.2f} {c:>10.2f} {change:>+7.1%}"
+        if worse > tolerance:
+            mark = "  РЕГРЕССИЯ"
+            regressions.append(line)
+        elif worse < -tolerance:
+            mark = "  улучшение"
+            improvements.append(line)
+        print(line + mark)
+
+    missing = sorted(set(base) - set(cur))
+    if missing:
+        print(f"Нет в текущем прогоне: {', '.join(missing)}")
+    if baseline.get("environment", {}).get("host") != current.get("environment", {}).get("host"):
+        print("Внимание: базовый прогон сделан на другой машине, сравнение ориентировочное.")
+    return regressions, improvements
+
+
+def _load(path: Path) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bench.suite")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Прогнать бенчмарк и записать JSON.")
+    run.add_argument("--out", type=Path, default=Path("bench.json"))
+    run.add_argument("--quick", action="store_true", help="Короткие видео и меньше конфигураций (для CI).")
+    run.add_argument("--groups", nargs="+", choices=("decode", "preprocess", "inference"),
+                     default=["decode", "preprocess", "inference"])
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--max-side", type=int, default=768)
+    run.add_argument("--work-dir", type=Path, default=None,
+                     help="Сохранять синтетические видео и чекпоинт здесь (иначе во временном каталоге).")
+    run.add_argument("--baseline", type=Path, default=None, help="Сразу сравнить с базовым JSON.")
+    run.add_argument("--tolerance", type=float, default=0.15)
+
+    cmp = sub.add_parser("compare", help="Сравнить два JSON-результата.")
+    cmp.add_argument("baseline", type=Path)
+    cmp.add_argument("current", type=Path)
+    cmp.add_argument("--tolerance", type=float, default=0.15,
+                     help="Допустимое ухудшение, доля (0.15 — 15%%).")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        regressions, _ = compare(_load(args.baseline), _load(args.current), args.tolerance)
+    else:
+        result = run_suite(
+            quick=args.quick,
+            groups=tuple(args.groups),
+            repeat=args.repeat,
+            work_dir=args.work_dir,
+            max_side=args.max_side,
+        )
+        args.out.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Результаты: {args.out} ({len(result['metrics'])} метрик)")
+        if args.baseline is None:
+            return 0
+        regressions, _ = compare(_load(args.baseline), result, args.tolerance)
+
+    if regressions:
+        print(f"Регрессий: {len(regressions)} (порог {args.tolerance:.0%})")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Скорость и сдвиг вероятностей при слиянии токенов ViT (ToMe) на текущем устройстве.
+
+    python -m app.bench.token_merging --folder /data/labelled [--ratios 0.05 0.1 0.2] [--json report.json]
+
+Для каждой доли токенов печатается пропускная способность, ускорение и
+расхождение вероятностей с точной моделью, доля изменившихся меток при
+--threshold и AUC, если задан --folder с real/ и fake/. Без --folder
+используются синтетические кадры (только скорость и сдвиг).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.bench.common import load_images, load_labelled_folder, roc_auc
+from app.bench.precision import _synthetic_frames
+from app.core.preprocess import is_image_path
+from app.core.token_merging import MAX_RATIO, merged_tokens_per_layer
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bench.token_merging")
+    parser.add_argument("--ratios", nargs="+", type=float, default=[0.02, 0.05, 0.1, 0.15, 0.2])
+    parser.add_argument("--folder", type=Path, default=None,
+                        help="Каталог real/ и fake/ с изображениями (иначе синтетика).")
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--side", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--precision", default=None)
+    parser.add_argument("--json", type=Path, default=None, help="Сохранить отчёт в JSON.")
+    args = parser.parse_args(argv)
+
+    if any(not 0.0 < r <= MAX_RATIO for r in args.ratios):
+        parser.error(f"--ratios должны быть в (0, {MAX_RATIO}]")
+
+    from app.core.inference import DeepfakeClassifier
+
+    labels: Optional[List[int]] = None
+    if args.folder is not None:
+        items = [(p, y) for p, y in load_labelled_folder(args.folder) if is_image_path(p)]
+        images = load_images([p for p, _ in items])
+        labels = [y for _, y in items]
+    else:
+        images = _synthetic_frames(args.frames, args.side)
+
+    # Модель одна: доля меняется на лету, eager-бэкенд вызывает pooled_features заново.
+    clf = DeepfakeClassifier(precision=args.precision, token_merge=0.0)
+    height, width = clf._input_size()
+    vision_config = getattr(clf.model.backbone.config, "vision_config", clf.model.backbone.config)
+    num_tokens = (height // vision_config.patch_size) * (width // vision_config.patch_size)
+    num_layers = vision_config.num_hidden_layers
+
+    rows: List[Dict] = []
+    reference: Optional[List[float]] = None
+    base_speed = 0.0
+    print(f"Токенов на входе: {num_tokens}, слоёв: {num_layers}, устройство: {clf.device}, точность: {clf.precision}")
+    print(
+        f"{'ratio':>6} {'токенов в конце':>16} {'изобр/с':>9} {'ускор.':>7} {'max|dp|':>9} {'mean|dp|':>9} {'метки':>7}"
+        + ("   AUC" if labels else "")
+    )
+    for ratio in [0.0] + list(args.ratios):
+        clf.model.token_merge_ratio = ratio
+        clf.predict_batch(images[: args.batch_size], batch_size=args.batch_size)  # прогрев
+        best = float("inf")
+        probs: List[float] = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            probs = clf.predict_batch(images, batch_size=args.batch_size)
+            best = min(best, time.perf_counter() - started)
+
+        speed = len(images) / best
+        if reference is None:
+            reference, base_speed = probs, speed
+        drift = [abs(a - b) for a, b in zip(probs, reference)]
+        flipped = sum((a >= args.threshold) != (b >= args.threshold) for a, b in zip(probs, reference)) / len(probs)
+        row = {
+            "ratio": ratio,
+            "final_tokens": num_tokens - sum(merged_tokens_per_layer(num_tokens, num_layers, ratio)),
+            "images_per_sec": round(speed, 3),
+            "speedup": round(speed / base_speed, 3),
+            "max_drift": max(drift),
+            "mean_drift": sum(drift) / len(drift),
+            "label_flip_rate": flipped,
+        }
+        if labels:
+            row["auc"] = roc_auc(labels, probs)
+        rows.append(row)
+
+        line = (
+            f"{ratio:>6.2f} {row['final_tokens']:>16} {speed:>9.2f} {row['speedup']:>6.2f}x "
+            f"{row['max_drift']:>9.5f} {row['mean_drift']:>9.5f} {flipped:>6.1%}"
+        )
+        if labels:
+            line += f"  {row['auc']:.4f}"
+        print(line)
+
+    if args.json is not None:
+        report = {
+            "ckpt_dir": str(clf.ckpt_dir),
+            "device": clf.device,
+            "precision": clf.precision,
+            "images": len(images),
+            "folder": str(args.folder) if args.folder else None,
+            "tokens": num_tokens,
+            "layers": num_layers,
+            "results": rows,
+        }
+        args.json.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Отчёт: {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,40 @@
+from __future__ import annotations
+
 import os
-import torch
+import tempfile
+from typing import TYPE_CHECKING
+
 from PIL import Image as PILImage
 from PIL import ImageFile as PILImageFile
 
 from app.services.logger import logger
 
+if TYPE_CHECKING:
+    import torch
+
 PROJECT_DIR = "./models/siglip2_deepfake-diffusion-full"
 CKPT_DIR = os.path.join(PROJECT_DIR, "checkpoint-657")
 BASE_MODEL_ID = CKPT_DIR
 
+RESULT_CACHE_PATH = os.path.join(PROJECT_DIR, "result_cache.sqlite")
+RESULT_CACHE_MAX_MB = 256
+
+# Декодированные кадры выборки видео для повторного анализа (uint8 memmap, LRU).
+FRAME_CACHE_DIR = os.path.join(PROJECT_DIR, "frame_cache")
+FRAME_CACHE_MAX_MB = 4096
+
+# Хранилище pooled-признаков backbone для пересчёта новыми головами (python -m app.features).
+FEATURE_STORE_DIR = os.path.join(PROJECT_DIR, "feature_store")
+
+# Лучшие batch_size/потоки по отпечатку машины и модели (python -m app.tune).
+AUTOTUNE_PATH = os.path.join(PROJECT_DIR, "autotune.json")
+
+INFERENCE_SOCKET_PATH = os.path.join(tempfile.gettempdir(), "deepfake-inference.sock")
+
 
 def detect_device() -> str:
+    import torch
+
     if torch.backends.mps.is_available():
         logger.info("MPS доступен — используется GPU Apple Silicon")
         return "mps"
@@ -21,7 +45,9 @@ def detect_device() -> str:
     return "cpu"
 
 
-def select_dtype(device: str) -> torch.dtype:
+def select_dtype(device: str) -> "torch.dtype":
+    import torch
+
     if device == "cuda":
         return torch.bfloat16
     if device == "mps":
@@ -29,9 +55,24 @@ def select_dtype(device: str) -> torch.dtype:
     return torch.float32
 
 
-DEVICE = detect_device()
-DTYPE = select_dtype(DEVICE)
-logger.info(f"DEVICE={DEVICE}, DTYPE={DTYPE}")
+_lazy: dict = {}
+
+
+def __getattr__(name: str):
+    # DEVICE/DTYPE вычисляются при первом обращении: импорт настроек не тянет torch.
+    if name in ("DEVICE", "DTYPE"):
+        if not _lazy:
+            _lazy["DEVICE"] = detect_device()
+            _lazy["DTYPE"] = select_dtype(_lazy["DEVICE"])
+            logger.info(f"DEVICE={_lazy['DEVICE']}, DTYPE={_lazy['DTYPE']}")
+        return _lazy[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Режим точности по умолчанию (см. app.core.precision.PRECISION_MODES); "auto" — DTYPE.
+PRECISION = os.environ.get("DEEPFAKE_PRECISION", "auto")
+
+# Доля токенов ViT, объединяемых в каждом слое (ToMe); 0 — точная модель.
+TOKEN_MERGE = float(os.environ.get("DEEPFAKE_TOKEN_MERGE", "0"))
 
 PILImageFile.LOAD_TRUNCATED_IMAGES = True
 PILImage.MAX_IMAGE_PIXELS = None
@@ -0,0 +1,271 @@
+"""
+Подбор batch_size и числа потоков torch для загруженного DeepfakeClassifier.
+
+autotune() прогоняет синтетические кадры по сетке (потоки x размер батча) и
+выбирает самую быструю конфигурацию, у которой пиковый RSS укладывается в
+бюджет памяти. Результат хранится в JSON по отпечатку машины и модели, так что
+один файл можно держать на общем диске для разнородного парка машин;
+apply_tuned() применяет сохранённую конфигурацию при старте.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import platform
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+
+from app.services.logger import logger
+from app.services.memory import current_rss_mb, memory_limit_mb, reset_peak_rss, window_peak_rss_mb
+
+
+DEFAULT_BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64, 128)
+
+# Конфигурации не медленнее лучшей на эту долю считаются равными: берётся меньший батч и меньше потоков.
+TIE_TOLERANCE = 0.03
+
+
+@dataclass
+class TuneResult:
+    fingerprint: str
+    batch_size: int
+    num_threads: int
+    interop_threads: int
+    images_per_sec: float
+    peak_rss_mb: float
+    host: Dict[str, str]
+    model: str
+    measured_at: str
+    trials: List[Dict] = field(default_factory=list)
+
+
+def _cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def available_cpus() -> int:
+    """Ядра, доступные процессу (affinity/cpuset контейнера), а не всей машины."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def host_info(device: str) -> Dict[str, str]:
+    info = {
+        "machine": platform.machine(),
+        "cpu": _cpu_model(),
+        "cpus": str(available_cpus()),
+        # Округление до ГБ: мелкие колебания доступной памяти не должны менять отпечаток.
+        "memory_gb": str(round(memory_limit_mb() / 1024)),
+        "device": device,
+        "torch": torch.__version__,
+    }
+    if device == "cuda":
+        info["gpu"] = torch.cuda.get_device_name()
+    return info
+
+
+def model_tag(classifier) -> str:
+    """Всё, что влияет на скорость модели, но не веса головы."""
+    params = sum(p.numel() for p in classifier.model.parameters())
+    height, width = classifier._input_size()
+    return (
+        f"{type(classifier).__name__}:params={params}:input={height}x{width}:prec={classifier.precision}"
+        f":backend={classifier.backend.name}:pre={classifier.preprocess}:tome={classifier.token_merge:g}"
+    )
+
+
+def fingerprint(classifier) -> str:
+    payload = json.dumps({"host": host_info(classifier.device), "model": model_tag(classifier)}, sort_keys=True)
+    return hashlib.blake2b(payload.encode(), digest_size=12).hexdigest()
+
+
+def default_thread_counts(cpus: Optional[int] = None) -> List[int]:
+    """1, 2, 4, ... и все доступные ядра."""
+    cpus = cpus or available_cpus()
+    counts = {cpus}
+    n = 1
+    while n < cpus:
+        counts.add(n)
+        n *= 2
+    return sorted(counts)
+
+
+def _synthetic_frames(n: int, frame_size: Tuple[int, int], seed: int = 0) -> List[np.ndarray]:
+    rng = np.random.default_rng(seed)
+    w, h = frame_size
+    return [rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8) for _ in range(n)]
+
+
+def _time_trial(classifier, frames: List[np.ndarray], batch_size: int, repeat: int) -> float:
+    """Лучшие изображения/с за repeat прогонов после одного прогрева."""
+    classifier._infer_batch(frames[:batch_size], batch_size)
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        classifier._infer_batch(frames, batch_size)
+        best = min(best, time.perf_counter() - started)
+    return len(frames) / best
+
+
+def autotune(
+    classifier,
+    batch_sizes: Sequence[int] = DEFAULT_BATCH_SIZES,
+    thread_counts: Optional[Sequence[int]] = None,
+    frame_size: Tuple[int, int] = (768, 432),
+    min_images: int = 32,
+    repeat: int = 2,
+    memory_budget_mb: Optional[float] = None,
+) -> TuneResult:
+    """
+    Перебрать потоки и размеры батча на синтетических кадрах frame_size.
+    Для каждого числа потоков батч растёт, пока скорость не упадёт ниже 90%
+    лучшей, не кончится память (в том числе OOM) или пиковый RSS прогона
+    (пик сбрасывается перед каждым) не превысит memory_budget_mb (по умолчанию
+    60% лимита памяти процесса).
+    Потоки подбираются только на CPU; на GPU перебирается один batch_size.
+    """
+    if memory_budget_mb is None:
+        memory_budget_mb = 0.6 * memory_limit_mb()
+    if thread_counts is None:
+        thread_counts = default_thread_counts() if classifier.device == "cpu" else [torch.get_num_threads()]
+
+    original_threads = torch.get_num_threads()
+    original_cap = classifier.oom_batch_cap
+    frames = _synthetic_frames(max(min_images, 2 * max(batch_sizes)), frame_size)
+    trials: List[Dict] = []
+
+    try:
+        for threads in thread_counts:
+            torch.set_num_threads(threads)
+            best_here = 0.0
+            for bs in sorted(batch_sizes):
+                n = max(min_images, 2 * bs)
+                trial = {"num_threads": threads, "batch_size": bs}
+                classifier.oom_batch_cap = original_cap
+                # ru_maxrss не убывает: без сброса один тяжёлый прогон «превысил бы бюджет» у всех следующих.
+                windowed = reset_peak_rss()
+                try:
+                    ips = _time_trial(classifier, frames[:n], bs, repeat)
+                except Exception as e:
+                    trial["error"] = repr(e)
+                    trials.append(trial)
+                    logger.info(f"Автотюнинг: потоков {threads}, батч {bs}: ошибка {e}")
+                    break
+                rss = window_peak_rss_mb() if windowed else current_rss_mb()
+                trial.update(images_per_sec=round(ips, 2), peak_rss_mb=round(rss, 1))
+                # _run_batches молча дробит батч при нехватке памяти — для подбора это тот же OOM.
+                if classifier.oom_batch_cap is not None and classifier.oom_batch_cap != original_cap:
+                    trial["error"] = "out of memory"
+                elif rss > memory_budget_mb:
+                    trial["error"] = f"peak RSS {rss:.0f} MB > budget {memory_budget_mb:.0f} MB"
+                trials.append(trial)
+                logger.info(
+                    f"Автотюнинг: потоков {threads}, батч {bs}: {ips:.1f} изобр/с, пиковый RSS {rss:.0f} МБ"
+                    + (f" ({trial['error']})" if "error" in trial else "")
+                )
+                if "error" in trial:
+                    break
+                if ips < 0.9 * best_here:
+                    break
+                best_here = max(best_here, ips)
+    finally:
+        classifier.oom_batch_cap = original_cap
+        torch.set_num_threads(original_threads)
+
+    ok = [t for t in trials if "error" not in t]
+    if not ok:
+        raise RuntimeError("Автотюнинг: ни одна конфигурация не отработала")
+    top = max(t["images_per_sec"] for t in ok)
+    chosen = min(
+        (t for t in ok if t["images_per_sec"] >= (1 - TIE_TOLERANCE) * top),
+        key=lambda t: (t["batch_size"], t["num_threads"]),
+    )
+    result = TuneResult(
+        fingerprint=fingerprint(classifier),
+        batch_size=chosen["batch_size"],
+        num_threads=chosen["num_threads"],
+        # Межоперационный пул нельзя менять после первой параллельной работы — фиксируем текущий.
+        interop_threads=torch.get_num_interop_threads(),
+        images_per_sec=chosen["images_per_sec"],
+        peak_rss_mb=chosen["peak_rss_mb"],
+        host=host_info(classifier.device),
+        model=model_tag(classifier),
+        measured_at=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        trials=trials,
+    )
+    logger.info(
+        f"Автотюнинг: batch_size={result.batch_size}, потоков {result.num_threads} "
+        f"({result.images_per_sec:.1f} изобр/с)"
+    )
+    return result
+
+
+def _read_all(path) -> Dict[str, Dict]:
+    path = Path(path)
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except ValueError:
+        logger.warning(f"Повреждён {path}, результаты автотюнинга будут перезаписаны")
+        return {}
+
+
+def save_tuned(result: TuneResult, path) -> None:
+    path = Path(path)
+    known = _read_all(path)
+    known[result.fingerprint] = asdict(result)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+    tmp.write_text(json.dumps(known, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def load_tuned(classifier, path) -> Optional[TuneResult]:
+    entry = _read_all(path).get(fingerprint(classifier))
+    if entry is None:
+        return None
+    try:
+        return TuneResult(**entry)
+    except TypeError as e:
+        logger.warning(f"Запись автотюнинга в {path} в старом формате, игнорируется: {e}")
+        return None
+
+
+def apply_tuned(classifier, path, threads: bool = True) -> Optional[TuneResult]:
+    """
+    Применить сохранённую для этой машины и модели конфигурацию: batch_size
+    классификатора и (threads=True) число потоков torch. None, если не найдено.
+    """
+    tuned = load_tuned(classifier, path)
+    if tuned is None:
+        logger.info(f"Автотюнинг для этой машины не найден в {path}, batch_size={classifier.batch_size}")
+        return None
+
+    classifier.batch_size = tuned.batch_size
+    if threads and classifier.device == "cpu":
+        torch.set_num_threads(tuned.num_threads)
+        if torch.get_num_interop_threads() != tuned.interop_threads:
+            try:
+                torch.set_num_interop_threads(tuned.interop_threads)
+            except RuntimeError:
+                pass
+    logger.info(
+        f"Автотюнинг ({tuned.measured_at}): batch_size={tuned.batch_size}"
+        + (f", потоков {torch.get_num_threads()}" if threads else "")
+    )
+    return tuned
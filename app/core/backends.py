@@ -0,0 +1,135 @@
+import hashlib
+import os
+from typing import Optional
+
+import torch
+import torch.nn as nn
+
+from app.core.cache import checkpoint_fingerprint
+from app.core.precision import PrecisionPolicy
+from app.services.logger import logger
+
+
+BACKENDS = ("eager", "compile", "export")
+
+EXPORT_DIRNAME = "exported"
+
+
+class EagerBackend:
+    name = "eager"
+
+    def __init__(self, model: nn.Module):
+        self.model = model
+
+    def __call__(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.model(pixel_values)
+
+
+class CompiledBackend:
+    name = "compile"
+
+    def __init__(self, model: nn.Module, mode: Optional[str] = None):
+        self.model = model
+        self.mode = mode
+        # Батчи разного размера (хвост видео) не должны вызывать перекомпиляцию на каждый размер.
+        # Размер 1 dynamo всё равно специализирует отдельным графом (0/1 specialization;
+        # mark_unbacked ломается на nn.MultiheadAttention пулинг-головы), поэтому
+        # create_backend прогревает оба графа: батч example и батч из одного кадра.
+        self._compiled = torch.compile(model, mode=mode, dynamic=True)
+
+    def __call__(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self._compiled(pixel_values)
+
+
+class ExportedBackend:
+    name = "export"
+
+    def __init__(self, module: nn.Module, path: str):
+        self.module = module
+        self.path = path
+
+    def __call__(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.module(pixel_values)
+
+
+def export_artifact_path(
+    ckpt_dir: str, policy: PrecisionPolicy, graph: str = "DeepfakeSigLIP", token_merge: float = 0.0
+) -> str:
+    """
+    Артефакт torch.export рядом с чекпоинтом. Имя зависит от весов, экспортируемого
+    модуля, точности, устройства, доли слияния токенов (меняет граф) и версии torch,
+    так что устаревший файл просто не будет найден.
+    """
+    key = (
+        f"{checkpoint_fingerprint(ckpt_dir)}:{graph}:{policy.name}:{policy.device}:"
+        f"tome={token_merge:g}:{torch.__version__}"
+    )
+    tag = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+    return os.path.join(ckpt_dir, EXPORT_DIRNAME, f"{graph.lower()}-{policy.name}-{tag}.pt2")
+
+
+def export_model(model: nn.Module, example: torch.Tensor, path: str) -> torch.export.ExportedProgram:
+    batch = torch.export.Dim("batch", min=1)
+    with torch.no_grad():
+        program = torch.export.export(model, (example,), dynamic_shapes={"pixel_values": {0: batch}})
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # torch.export.save ожидает расширение .pt2.
+    tmp_path = f"{path}.tmp-{os.getpid()}.pt2"
+    torch.export.save(program, tmp_path)
+    os.replace(tmp_path, path)
+    logger.info(f"Модель экспортирована: {path}")
+    return program
+
+
+def load_or_export(model: nn.Module, example: torch.Tensor, path: str) -> ExportedBackend:
+    program = None
+    if os.path.exists(path):
+        try:
+            program = torch.export.load(path)
+            logger.info(f"Загружен экспортированный граф: {path}")
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить {path}, экспорт заново: {e}")
+    if program is None:
+        logger.info("Экспорт модели через torch.export (однократно)...")
+        program = export_model(model, example, path)
+    return ExportedBackend(program.module(), path)
+
+
+def create_backend(
+    model: nn.Module,
+    backend: str,
+    policy: PrecisionPolicy,
+    example: torch.Tensor,
+    artifact_path: Optional[str] = None,
+    compile_mode: Optional[str] = None,
+):
+    """
+    Обёртка над forward модели. compile/export прогреваются на example сразу,
+    чтобы ошибки и время компиляции пришлись на старт; при ошибке — eager.
+    compile компилирует два графа (батч >= 2 и батч 1), поэтому старт дольше
+    eager на время двух компиляций, зато в работе перекомпиляций нет.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд: {backend}. Допустимо: {', '.join(BACKENDS)}")
+    if backend == "eager":
+        return EagerBackend(model)
+
+    try:
+        if backend == "compile":
+            runner = CompiledBackend(model, mode=compile_mode)
+        else:
+            if artifact_path is None:
+                raise ValueError("Для export нужен путь артефакта")
+            runner = load_or_export(model, example, artifact_path)
+
+        with torch.no_grad(), policy.autocast():
+            runner(example)
+            if backend == "compile" and len(example) > 1:
+                runner(example[:1].clone())  # не view: иначе guard на _base
+    except Exception as e:
+        logger.warning(f"Бэкенд {backend} недоступен, используется eager: {e}")
+        return EagerBackend(model)
+
+    logger.info(f"Бэкенд инференса: {backend}" + (f" (mode={compile_mode})" if compile_mode else ""))
+    return runner
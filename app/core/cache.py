@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from app.core.video import VideoMeta
+from app.services.logger import logger
+
+
+_HASH_CHUNK = 1 << 20
+_EVICT_EVERY = 256
+
+
+_hash_memo: "OrderedDict[tuple, str]" = OrderedDict()
+_hash_memo_lock = threading.Lock()
+_HASH_MEMO_SIZE = 1024
+
+
+def file_content_hash(path, chunk_size: int = _HASH_CHUNK) -> str:
+    """
+    Хэш содержимого файла (blake2b), не зависящий от имени и пути. Запоминается
+    по (путь, размер, mtime, inode), чтобы кэши результатов и кадров не читали
+    одно и то же видео дважды.
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns, st.st_ino)
+    with _hash_memo_lock:
+        cached = _hash_memo.get(memo_key)
+        if cached is not None:
+            _hash_memo.move_to_end(memo_key)
+            return cached
+
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            h.update(block)
+    digest = h.hexdigest()
+
+    with _hash_memo_lock:
+        _hash_memo[memo_key] = digest
+        if len(_hash_memo) > _HASH_MEMO_SIZE:
+            _hash_memo.popitem(last=False)
+    return digest
+
+
+def checkpoint_fingerprint(ckpt_dir: str) -> str:
+    """Отпечаток чекпоинта: имена, размеры и mtime файлов весов + содержимое конфигов."""
+    h = hashlib.blake2b(digest_size=12)
+    for name in sorted(os.listdir(ckpt_dir)):
+        full = os.path.join(ckpt_dir, name)
+        if not os.path.isfile(full):
+            continue
+        if name.endswith(".json"):
+            with open(full, "rb") as f:
+                h.update(name.encode() + b"\0" + f.read())
+        elif name.endswith((".safetensors", ".bin")):
+            st = os.stat(full)
+            h.update(f"{name}\0{st.st_size}\0{st.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+
+@dataclass
+class CachedResult:
+    prob_deepfake: float
+    per_frame_probs: Optional[List[float]] = None
+    meta: Optional[VideoMeta] = None
+
+
+class ResultCache:
+    """
+    Персистентный кэш сырых вероятностей (SQLite), адресуемый по содержимому.
+    Хранится prob_deepfake, а не метка, поэтому смена порога не требует пересчёта.
+    """
+
+    def __init__(self, path, max_size_mb: float = 256.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._puts_since_evict = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(str(self.path), timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                prob REAL NOT NULL,
+                frame_probs BLOB,
+                meta TEXT,
+                nbytes INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_lru ON results(last_access)")
+        self._conn.commit()
+        logger.info(f"Кэш результатов: {self.path} (лимит {max_size_mb:.0f} МБ)")
+
+    @staticmethod
+    def make_key(content_hash: str, model_fingerprint: str, variant: str = "") -> str:
+        return f"{content_hash}:{model_fingerprint}:{variant}"
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT prob, frame_probs, meta FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+
+        prob, frame_blob, meta_json = row
+        per_frame_probs = None
+        if frame_blob is not None:
+            per_frame_probs = array("f", frame_blob).tolist()
+        meta = VideoMeta(**json.loads(meta_json)) if meta_json else None
+        return CachedResult(float(prob), per_frame_probs, meta)
+
+    def put(
+        self,
+        key: str,
+        prob_deepfake: float,
+        per_frame_probs: Optional[List[float]] = None,
+        meta: Optional[VideoMeta] = None,
+    ) -> None:
+        frame_blob = array("f", per_frame_probs).tobytes() if per_frame_probs is not None else None
+        meta_json = json.dumps(asdict(meta)) if meta is not None else None
+        nbytes = len(key) + 8 + len(frame_blob or b"") + len(meta_json or "")
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (key, float(prob_deepfake), frame_blob, meta_json, nbytes, time.time()),
+            )
+            self._conn.commit()
+            self._puts_since_evict += 1
+            if self._puts_since_evict >= _EVICT_EVERY:
+                self._evict_locked()
+
+    def evict(self) -> int:
+        with self._lock:
+            return self._evict_locked()
+
+    def _evict_locked(self) -> int:
+        self._puts_since_evict = 0
+        total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+
+        # Выселяем давно не использованные записи до 90% лимита, чтобы не дёргать это на каждом put.
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        cursor = self._conn.execute("SELECT key, nbytes FROM results ORDER BY last_access ASC")
+        victims = []
+        for key, nbytes in cursor:
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= nbytes
+            removed += 1
+        self._conn.executemany("DELETE FROM results WHERE key = ?", victims)
+        self._conn.commit()
+
+        self.evictions += removed
+        logger.info(f"Кэш результатов: выселено {removed} записей.")
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM results"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": int(entries),
+            "bytes": int(total),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,92 @@
+"""
+Подавление почти одинаковых кадров выборки перед инференсом.
+
+Подпись кадра — яркость, усреднённая по блокам до сетки side x side (одна
+векторная операция на батч кадров одного размера). Кадр, чья подпись
+отличается от подписи уже встреченного кадра-представителя меньше чем на
+threshold (средняя абсолютная разница, яркость 0..1), получает вероятность
+представителя без прогона модели. Представители не обновляются, так что
+медленный дрейф сцены не склеивает далёкие кадры в один кластер.
+"""
+from __future__ import annotations
+
+from typing import Callable, List, Sequence, Tuple
+
+import numpy as np
+
+
+# ~2% средней разницы яркости: шум сжатия и мерцание статичного кадра, но не движение губ.
+DEFAULT_THRESHOLD = 0.02
+SIGNATURE_SIDE = 32
+
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def _block_means(frames: np.ndarray, side: int) -> np.ndarray:
+    """[N, H, W, 3] uint8 -> [N, side * side] средняя яркость блоков, 0..1."""
+    n, h, w = frames.shape[:3]
+    luma = frames.astype(np.float32) @ _LUMA
+    # Границы блоков по сетке side x side (размер кадра не обязан делиться на side).
+    rows = np.linspace(0, h, side + 1).astype(np.int64)
+    cols = np.linspace(0, w, side + 1).astype(np.int64)
+    sums = np.add.reduceat(luma, np.minimum(rows[:-1], h - 1), axis=1)
+    sums = np.add.reduceat(sums, np.minimum(cols[:-1], w - 1), axis=2)
+    counts = np.outer(np.maximum(np.diff(rows), 1), np.maximum(np.diff(cols), 1))
+    return (sums / counts).reshape(n, -1) / 255.0
+
+
+def frame_signatures(frames: Sequence[np.ndarray], side: int = SIGNATURE_SIDE) -> np.ndarray:
+    """Подписи кадров: [N, side * side] float32; кадры одного размера считаются одним батчем."""
+    if not len(frames):
+        return np.empty((0, side * side), dtype=np.float32)
+    shapes = {f.shape for f in frames}
+    if len(shapes) == 1:
+        return _block_means(np.stack(frames), side)
+    return np.concatenate([_block_means(np.asarray(f)[None], side) for f in frames])
+
+
+class FrameDeduplicator:
+    """Кластеры почти одинаковых кадров одного видео; одна оценка модели на кластер."""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, side: int = SIGNATURE_SIDE):
+        self.threshold = threshold
+        self.side = side
+        self._reps = np.empty((0, side * side), dtype=np.float32)
+        self._rep_probs: List[float] = []
+        self.frames = 0
+        self.skipped = 0
+
+    def assign(self, frames: Sequence[np.ndarray]) -> Tuple[List[int], List[int]]:
+        """
+        Номер кластера для каждого кадра и индексы кадров, открывших новый
+        кластер (их нужно прогнать через модель).
+        """
+        signatures = frame_signatures(frames, self.side)
+        clusters: List[int] = []
+        fresh: List[int] = []
+        for i, sig in enumerate(signatures):
+            if len(self._reps):
+                dist = np.abs(self._reps - sig).mean(axis=1)
+                best = int(dist.argmin())
+                if dist[best] < self.threshold:
+                    clusters.append(best)
+                    continue
+            clusters.append(len(self._reps))
+            fresh.append(i)
+            self._reps = np.concatenate([self._reps, sig[None]])
+            self._rep_probs.append(float("nan"))
+        self.frames += len(frames)
+        self.skipped += len(frames) - len(fresh)
+        return clusters, fresh
+
+    def predict(
+        self,
+        frames: Sequence[np.ndarray],
+        infer: Callable[[List[np.ndarray]], List[float]],
+    ) -> List[float]:
+        """Вероятности всех кадров: infer вызывается только для новых представителей."""
+        clusters, fresh = self.assign(frames)
+        if fresh:
+            for i, prob in zip(fresh, infer([frames[i] for i in fresh])):
+                self._rep_probs[clusters[i]] = prob
+        return [self._rep_probs[c] for c in clusters]
@@ -0,0 +1,211 @@
+import glob
+import hashlib
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from app.config.settings import PROJECT_DIR
+from app.core.backends import EagerBackend
+from app.core.cache import checkpoint_fingerprint
+from app.core.inference import DeepfakeClassifier, ImageInput
+from app.core.model import PooledFeatures
+from app.core.model_loader import (
+    checkpoint_weight_files,
+    iter_checkpoint_tensors,
+    iter_file_tensors,
+    load_model_from_checkpoint,
+    vision_tensor_digests,
+)
+from app.services import tracing
+from app.services.logger import logger
+
+
+COMBINE_RULES = ("mean", "logit_mean", "weighted", "max", "min", "vote")
+
+_HEAD_KEYS = ("norm.weight", "norm.bias", "classifier.weight", "classifier.bias")
+
+
+@dataclass
+class EnsemblePrediction:
+    head_names: List[str]
+    # [изображение][голова]
+    per_head_probs: List[List[float]]
+    combined_probs: List[float]
+
+
+def discover_checkpoints(project_dir: str = PROJECT_DIR) -> List[str]:
+    """Каталоги checkpoint-* с весами, по возрастанию номера шага."""
+    dirs = [d for d in glob.glob(os.path.join(project_dir, "checkpoint-*")) if checkpoint_weight_files(d)]
+
+    def step(path: str) -> int:
+        m = re.search(r"(\d+)$", path)
+        return int(m.group(1)) if m else -1
+
+    return sorted(dirs, key=step)
+
+
+def read_head(source: str) -> Dict[str, torch.Tensor]:
+    """Тензоры головы (norm + classifier) из каталога чекпоинта или отдельного файла весов головы."""
+    select = lambda k: k in _HEAD_KEYS  # noqa: E731
+    if os.path.isfile(source):
+        head = dict(iter_file_tensors(source, dtype=torch.float32, select=select))
+    else:
+        head = dict(iter_checkpoint_tensors(source, dtype=torch.float32, select=select))
+    missing = [k for k in _HEAD_KEYS if k not in head]
+    if missing:
+        raise ValueError(f"В {source} нет тензоров головы: {missing}")
+    return head
+
+
+class FusedHeads(nn.Module):
+    """
+    N голов LayerNorm(D) + Linear(D→1) как одна матрица (D, N): аффинная часть
+    LayerNorm сворачивается в веса классификатора, нормализация считается один раз.
+        logit_k = ((x - mu) / sigma) @ (g_k * w_k) + (w_k · b_k + c_k)
+    """
+
+    def __init__(self, heads: Sequence[Dict[str, torch.Tensor]], eps: float = 1e-5):
+        super().__init__()
+        self.eps = eps
+        weight = torch.stack([h["norm.weight"] * h["classifier.weight"].reshape(-1) for h in heads], dim=1)
+        bias = torch.stack(
+            [h["classifier.weight"].reshape(-1) @ h["norm.bias"] + h["classifier.bias"].reshape(()) for h in heads]
+        )
+        self.register_buffer("weight", weight)  # [D, N]
+        self.register_buffer("bias", bias)  # [N]
+
+    def forward(self, feats: torch.Tensor) -> torch.Tensor:
+        z = F.layer_norm(feats.float(), (self.weight.shape[0],), eps=self.eps)
+        return torch.addmm(self.bias, z, self.weight)  # [B, N]
+
+
+def combine_probs(
+    probs: torch.Tensor,
+    rule: str = "mean",
+    weights: Optional[torch.Tensor] = None,
+    threshold: float = 0.5,
+) -> torch.Tensor:
+    """probs: [B, N] по головам -> [B]."""
+    if rule == "mean":
+        return probs.mean(dim=1)
+    if rule == "logit_mean":
+        return torch.sigmoid(torch.logit(probs, eps=1e-6).mean(dim=1))
+    if rule == "weighted":
+        w = weights / weights.sum()
+        return probs @ w
+    if rule == "max":
+        return probs.max(dim=1).values
+    if rule == "min":
+        return probs.min(dim=1).values
+    if rule == "vote":
+        return (probs >= threshold).float().mean(dim=1)
+    raise ValueError(f"Неизвестное правило объединения: {rule}. Допустимо: {', '.join(COMBINE_RULES)}")
+
+
+class EnsembleClassifier(DeepfakeClassifier):
+    """
+    Ансамбль голов из нескольких чекпоинтов с общим backbone: ViT прогоняется
+    один раз на батч, признаки раздаются всем головам одним matmul.
+    Чекпоинты, у которых vision-backbone отличается (например, адаптерами),
+    получают собственный backbone и считаются отдельным проходом.
+    predict/predict_batch/predict_video возвращают объединённую вероятность,
+    predict_ensemble — ещё и вероятности по головам.
+    """
+
+    def __init__(
+        self,
+        ckpt_dirs: Optional[Sequence[str]] = None,
+        combine: str = "mean",
+        weights: Optional[Sequence[float]] = None,
+        vote_threshold: float = 0.5,
+        verify_backbone: bool = True,
+        **kwargs,
+    ):
+        ckpt_dirs = list(ckpt_dirs) if ckpt_dirs else discover_checkpoints()
+        if not ckpt_dirs:
+            raise ValueError(f"Не найдено чекпоинтов для ансамбля в {PROJECT_DIR}")
+        if combine not in COMBINE_RULES:
+            raise ValueError(f"Неизвестное правило объединения: {combine}. Допустимо: {', '.join(COMBINE_RULES)}")
+        if kwargs.get("cascade") is not None:
+            raise ValueError("Каскад разрешений для ансамбля не поддерживается")
+        if combine == "weighted" and (weights is None or len(weights) != len(ckpt_dirs)):
+            raise ValueError("Для combine='weighted' нужен вес на каждый чекпоинт")
+
+        self.ckpt_dirs = ckpt_dirs
+        self.head_names = [os.path.basename(os.path.normpath(d)) for d in ckpt_dirs]
+        self.combine = combine
+        self.vote_threshold = vote_threshold
+        self.combine_weights = torch.tensor(weights, dtype=torch.float32) if weights is not None else None
+
+        super().__init__(ckpt_dir=ckpt_dirs[0], **kwargs)
+
+        self.heads = FusedHeads([read_head(d) for d in ckpt_dirs], eps=self.model.norm.eps).to(self.device)
+
+        # Группы голов по backbone: (runner признаков, индексы голов).
+        self._groups: List[Tuple[object, List[int]]] = [(self.backend, [0])]
+        base_digests = vision_tensor_digests(ckpt_dirs[0]) if verify_backbone and len(ckpt_dirs) > 1 else None
+        for i, ckpt_dir in enumerate(ckpt_dirs[1:], start=1):
+            if base_digests is None or vision_tensor_digests(ckpt_dir) == base_digests:
+                self._groups[0][1].append(i)
+                continue
+            logger.warning(f"Backbone {ckpt_dir} отличается от {ckpt_dirs[0]}: отдельный проход ViT для этой головы.")
+            model = load_model_from_checkpoint(ckpt_dir, ckpt_dir, dtype=self.dtype)
+            model = self.policy.finalize_model(self.policy.prepare_model(model))
+            model.token_merge_ratio = self.token_merge
+            self._groups.append((EagerBackend(PooledFeatures(model)), [i]))
+
+        logger.info(
+            f"Ансамбль: {len(ckpt_dirs)} голов, проходов backbone на батч: {len(self._groups)}, "
+            f"объединение: {combine}"
+        )
+
+    def _backend_graph(self) -> nn.Module:
+        return PooledFeatures(self.model)
+
+    def _variant_tag(self) -> str:
+        heads = ",".join(checkpoint_fingerprint(d) for d in self.ckpt_dirs)
+        weights = "" if self.combine_weights is None else ",".join(f"{w:g}" for w in self.combine_weights.tolist())
+        digest = hashlib.blake2b(f"{heads}|{weights}|{self.vote_threshold}".encode(), digest_size=8).hexdigest()
+        return f"{super()._variant_tag()}:ensemble={self.combine}:{digest}"
+
+    @torch.no_grad()
+    def _infer_heads(self, images: Sequence[ImageInput], batch_size: int) -> torch.Tensor:
+        """Вероятности по головам: [N, число голов]."""
+
+        def run(chunk: Sequence[ImageInput]) -> torch.Tensor:
+            pixel_values = self._to_device(chunk)
+
+            logits = torch.empty(len(chunk), len(self.ckpt_dirs))
+            for runner, idxs in self._groups:
+                with tracing.span("model.forward", items=len(chunk), sync=self._device_sync), self.policy.autocast():
+                    feats = runner(pixel_values)
+                with tracing.span("model.heads", items=len(chunk)):
+                    group_logits = self.heads(feats).cpu()
+                logits[:, idxs] = group_logits[:, idxs]
+            return torch.sigmoid(logits)
+
+        out = self._run_batches(images, batch_size, run)
+        if not out:
+            return torch.empty(0, len(self.ckpt_dirs))
+        return torch.cat(out)
+
+    def _combine(self, head_probs: torch.Tensor) -> torch.Tensor:
+        return combine_probs(head_probs, self.combine, self.combine_weights, self.vote_threshold)
+
+    @torch.no_grad()
+    def _infer_batch(self, images: Sequence[ImageInput], batch_size: int) -> List[float]:
+        return [float(p) for p in self._combine(self._infer_heads(images, batch_size)).tolist()]
+
+    @torch.no_grad()
+    def predict_ensemble(self, images: Sequence[ImageInput], batch_size: Optional[int] = None) -> EnsemblePrediction:
+        head_probs = self._infer_heads(images, batch_size or self.batch_size)
+        return EnsemblePrediction(
+            head_names=list(self.head_names),
+            per_head_probs=head_probs.tolist(),
+            combined_probs=[float(p) for p in self._combine(head_probs).tolist()],
+        )
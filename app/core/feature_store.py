@@ -0,0 +1,303 @@
+"""
+Хранилище pooled-признаков backbone на диске: float16 .npy-шарды, которые
+читаются через memory-map, и SQLite-индекс «ключ -> (шард, строка)».
+
+Каталог хранилища определяется отпечатком vision-backbone, предобработкой,
+точностью и долей слияния токенов (ToMe), поэтому переобучение головы его не меняет. Ключ признаков — хэш
+содержимого файла (для кадров видео — ``<hash>#<номер кадра в выборке>``).
+Пересчёт корпуса новой головой сводится к matmul по шардам (см. rescore).
+
+Один писатель на каталог: шард сначала пишется во временный файл и
+переименовывается, а строки индекса коммитятся после этого, так что
+прерванная запись не оставляет ссылок на несуществующие признаки.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from app.services.logger import logger
+
+
+FEATURE_DTYPE = np.float16
+
+_INDEX_NAME = "index.sqlite"
+_BACKBONES_NAME = "backbones.json"
+
+
+def store_key(backbone: str, preprocess: str, precision: str, token_merge: float = 0.0) -> str:
+    """
+    Имя каталога хранилища: признаки зависят от backbone, предобработки, точности
+    и слияния токенов, но не от головы. При token_merge == 0 суффикса tome в ключе нет.
+    """
+    variant = f"{backbone}:{preprocess}:{precision}" + (f":tome={token_merge:g}" if token_merge > 0 else "")
+    digest = hashlib.blake2b(variant.encode(), digest_size=8).hexdigest()
+    tome = f"-tome{token_merge:g}" if token_merge > 0 else ""
+    return f"{backbone[:12]}-{precision}{tome}-{digest}"
+
+
+def cached_backbone_fingerprint(root, ckpt_dir: str) -> str:
+    """
+    backbone_fingerprint с кэшем в root/backbones.json по checkpoint_fingerprint:
+    хэшировать все тензоры ViT при каждом запуске дорого.
+    """
+    from app.core.cache import checkpoint_fingerprint
+    from app.core.model_loader import backbone_fingerprint
+
+    path = Path(root) / _BACKBONES_NAME
+    known: Dict[str, str] = {}
+    if path.exists():
+        try:
+            known = json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            logger.warning(f"Повреждён {path}, отпечатки backbone будут пересчитаны")
+
+    ckpt_fp = checkpoint_fingerprint(ckpt_dir)
+    if ckpt_fp not in known:
+        known[ckpt_fp] = backbone_fingerprint(ckpt_dir)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+        tmp.write_text(json.dumps(known, indent=2), encoding="utf-8")
+        os.replace(tmp, path)
+    return known[ckpt_fp]
+
+
+def list_stores(root) -> List[str]:
+    """Ключи хранилищ (подкаталоги с индексом) в root."""
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    return sorted(p.name for p in root.iterdir() if (p / _INDEX_NAME).exists())
+
+
+@dataclass
+class StoredMedia:
+    content_hash: str
+    path: str
+    kind: str
+    # Для видео — число сохранённых кадров выборки. Номера кадров в ключах
+    # frame_key(content_hash, k) могут идти с пропусками: кадры, которые не
+    # удалось декодировать, не сохраняются.
+    frames: int
+
+
+class FeatureStore:
+    def __init__(self, root, key: str, shard_rows: int = 8192):
+        self.dir = Path(root) / key
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.key = key
+        self.shard_rows = shard_rows
+
+        self._lock = threading.Lock()
+        self._pending_keys: List[str] = []
+        self._pending: List[np.ndarray] = []
+        self._pending_media: List[StoredMedia] = []
+        self._shards: Dict[int, np.ndarray] = {}
+
+        self._conn = sqlite3.connect(str(self.dir / _INDEX_NAME), timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS features (
+                key TEXT PRIMARY KEY,
+                shard INTEGER NOT NULL,
+                row INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS media (
+                content_hash TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                frames INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+        last = self._conn.execute("SELECT MAX(shard) FROM features").fetchone()[0]
+        self._next_shard = 0 if last is None else int(last) + 1
+
+    @classmethod
+    def for_classifier(cls, root, classifier, **kwargs) -> "FeatureStore":
+        backbone = cached_backbone_fingerprint(root, classifier.ckpt_dir)
+        token_merge = getattr(classifier, "token_merge", 0.0)
+        store = cls(root, store_key(backbone, classifier.preprocess, classifier.precision, token_merge), **kwargs)
+        store.set_meta(
+            backbone=backbone,
+            preprocess=classifier.preprocess,
+            precision=classifier.precision,
+            token_merge=token_merge,
+            ckpt_dir=str(classifier.ckpt_dir),
+        )
+        return store
+
+    @staticmethod
+    def frame_key(content_hash: str, index: int) -> str:
+        return f"{content_hash}#{index}"
+
+    def set_meta(self, **values) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)", [(k, str(v)) for k, v in values.items()]
+            )
+            self._conn.commit()
+
+    def meta(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT name, value FROM meta").fetchall())
+
+    def has_media(self, content_hash: str) -> bool:
+        with self._lock:
+            if any(m.content_hash == content_hash for m in self._pending_media):
+                return True
+            row = self._conn.execute("SELECT 1 FROM media WHERE content_hash = ?", (content_hash,)).fetchone()
+        return row is not None
+
+    def media(self) -> List[StoredMedia]:
+        with self._lock:
+            rows = self._conn.execute("SELECT content_hash, path, kind, frames FROM media ORDER BY path").fetchall()
+        return [StoredMedia(*row) for row in rows]
+
+    def add(self, media: StoredMedia, keys: Sequence[str], feats: np.ndarray) -> None:
+        """Признаки одного медиафайла; попадают в индекс вместе с шардом при flush()."""
+        if len(keys) != len(feats):
+            raise ValueError(f"Ключей {len(keys)}, а строк признаков {len(feats)}")
+        with self._lock:
+            self._pending_keys.extend(keys)
+            self._pending.append(np.asarray(feats, dtype=FEATURE_DTYPE))
+            self._pending_media.append(media)
+            full = len(self._pending_keys) >= self.shard_rows
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._pending_keys:
+                return
+            shard = self._next_shard
+            data = np.concatenate(self._pending)
+            path = self._shard_path(shard)
+            tmp = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+            with open(tmp, "wb") as f:
+                np.save(f, data)
+            os.replace(tmp, path)
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO features VALUES (?, ?, ?)",
+                [(key, shard, row) for row, key in enumerate(self._pending_keys)],
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?)",
+                [(m.content_hash, m.path, m.kind, m.frames) for m in self._pending_media],
+            )
+            self._conn.commit()
+            self._next_shard += 1
+            logger.info(f"Хранилище признаков: шард {path.name}, {len(data)} строк")
+            self._pending_keys, self._pending, self._pending_media = [], [], []
+
+    def _shard_path(self, shard: int) -> Path:
+        return self.dir / f"shard-{shard:05d}.npy"
+
+    def shard(self, shard: int) -> np.ndarray:
+        """Шард [rows, D] float16, отображённый в память (только чтение)."""
+        if shard not in self._shards:
+            self._shards[shard] = np.load(self._shard_path(shard), mmap_mode="r")
+        return self._shards[shard]
+
+    def locations(self) -> Dict[str, Tuple[int, int]]:
+        with self._lock:
+            return {key: (shard, row) for key, shard, row in self._conn.execute("SELECT key, shard, row FROM features")}
+
+    def shard_ids(self) -> List[int]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT shard FROM features ORDER BY shard")]
+
+    def get(self, keys: Sequence[str]) -> np.ndarray:
+        """Признаки по ключам: [len(keys), D] float32. KeyError, если ключа нет."""
+        locations = self.locations()
+        return np.stack([self.shard(locations[k][0])[locations[k][1]] for k in keys]).astype(np.float32)
+
+    def iter_shards(self) -> Iterator[Tuple[int, np.ndarray]]:
+        for shard in self.shard_ids():
+            yield shard, self.shard(shard)
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._shards.clear()
+            self._conn.close()
+
+
+def rescore(
+    store: FeatureStore,
+    head_sources: Sequence[str],
+    agg_method: str = "median_of_means",
+    chunk_count: int = 8,
+) -> Tuple[List[str], List[Tuple[StoredMedia, List[float]]]]:
+    """
+    Вероятности всех медиа хранилища для голов head_sources (каталоги
+    чекпоинтов или файлы весов головы) без прогона backbone: один
+    layer_norm + addmm на шард. Видео агрегируются как в predict_video.
+    Возвращает имена голов и пары (медиа, вероятность по каждой голове).
+    """
+    import torch
+
+    from app.core.ensemble import FusedHeads, read_head
+    from app.core.inference import _aggregate_probs
+
+    started = time.perf_counter()
+    names = [os.path.basename(os.path.normpath(src)) for src in head_sources]
+    heads = FusedHeads([read_head(src) for src in head_sources])
+
+    shard_probs: Dict[int, np.ndarray] = {}
+    rows = 0
+    with torch.no_grad():
+        for shard, feats in store.iter_shards():
+            logits = heads(torch.from_numpy(np.asarray(feats, dtype=np.float32)))
+            shard_probs[shard] = torch.sigmoid(logits).numpy()
+            rows += len(feats)
+
+    locations = store.locations()
+    # Ключи кадров каждого видео в порядке выборки, как per_frame_probs в predict_video.
+    frame_keys: Dict[str, List[Tuple[int, str]]] = {}
+    for key in locations:
+        content_hash, sep, index = key.rpartition("#")
+        if sep:
+            frame_keys.setdefault(content_hash, []).append((int(index), key))
+
+    def probs_for(key: str) -> np.ndarray:
+        shard, row = locations[key]
+        return shard_probs[shard][row]
+
+    results: List[Tuple[StoredMedia, List[float]]] = []
+    for media in store.media():
+        if media.kind == "video":
+            keys = [key for _, key in sorted(frame_keys.get(media.content_hash, []))]
+            if not keys:
+                logger.warning(f"Нет признаков кадров для {media.path}, пропуск")
+                continue
+            frames = np.stack([probs_for(key) for key in keys])
+            probs = [
+                _aggregate_probs(frames[:, i].tolist(), method=agg_method, chunk_count=chunk_count)
+                for i in range(len(names))
+            ]
+        else:
+            probs = [float(p) for p in probs_for(media.content_hash)]
+        results.append((media, probs))
+
+    logger.info(
+        f"Пересчёт {len(results)} медиа ({rows} векторов признаков) {len(names)} головами "
+        f"за {time.perf_counter() - started:.2f} с"
+    )
+    return names, results
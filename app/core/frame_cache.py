@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+from app.core.cache import file_content_hash
+from app.core.video import IndexedFrame, OpenedVideo, VideoMeta, check_cancelled, coarse_to_fine_order
+from app.services.logger import logger
+
+
+class _Recorder:
+    """Запись кадров выборки в .npy-memmap по мере декодирования; в кэш попадает только полная выборка."""
+
+    def __init__(self, cache: "FrameCache", key: str, opened: OpenedVideo):
+        self.cache = cache
+        self.key = key
+        self.opened = opened
+        self.path = cache._data_path(key)
+        self.tmp = self.path.with_name(f"{self.path.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+        self.data: Optional[np.ndarray] = None
+        self.present: List[int] = []
+
+    def _write(self, k: int, frame: np.ndarray) -> bool:
+        if self.data is None:
+            self.data = np.lib.format.open_memmap(
+                self.tmp, mode="w+", dtype=np.uint8, shape=(self.opened.expected_frames, *frame.shape)
+            )
+        if frame.shape != self.data.shape[1:] or frame.dtype != np.uint8 or not 0 <= k < len(self.data):
+            logger.warning("Кэш кадров: размер кадров меняется по ходу видео, видео не кэшируется.")
+            return False
+        self.data[k] = frame
+        self.present.append(k)
+        return True
+
+    def frames(self) -> Iterator[IndexedFrame]:
+        recording = True
+        completed = False
+        try:
+            for k, frame in self.opened.frames:
+                if recording:
+                    recording = self._write(k, frame)
+                yield k, frame
+            completed = recording and self.data is not None
+        finally:
+            close = getattr(self.opened.frames, "close", None)
+            if close is not None:
+                close()
+            data, self.data = self.data, None
+            if completed:
+                data.flush()
+                del data
+                self.cache._commit(self.key, self.tmp, self.path, self.opened, sorted(self.present))
+            else:
+                # Прерванная выборка (отмена, ранняя остановка, ошибка) зависит от причины — не кэшируем.
+                del data
+                if os.path.exists(self.tmp):
+                    os.remove(self.tmp)
+
+
+class FrameCache:
+    """
+    Дисковый кэш декодированных и уменьшенных кадров выборки: по одному
+    uint8 .npy [N, H, W, 3] на (хэш видео, параметры выборки, max_side) и
+    SQLite-индекс с LRU-выселением по суммарному размеру. Повторный анализ
+    читает кадры через memory-map без декодирования и перекодирования ffmpeg.
+    """
+
+    def __init__(self, root, max_size_mb: float = 4096.0):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(str(self.root / "index.sqlite"), timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS frames (
+                key TEXT PRIMARY KEY,
+                meta TEXT NOT NULL,
+                expected INTEGER NOT NULL,
+                present BLOB NOT NULL,
+                keyframes_only INTEGER NOT NULL,
+                nbytes INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS frames_lru ON frames(last_access)")
+        self._conn.commit()
+        logger.info(f"Кэш кадров: {self.root} (лимит {max_size_mb:.0f} МБ)")
+
+    @staticmethod
+    def make_key(content_hash: str, max_side: int, sampling: str, keyframes_only: bool) -> str:
+        # Порядок обхода (order) в ключ не входит: выборка та же, меняется только очерёдность.
+        return f"{content_hash}:max_side={max_side}:sampling={sampling}:keyframes={int(keyframes_only)}"
+
+    def key_for(self, path, max_side: int, sampling: str, keyframes_only: bool) -> Optional[str]:
+        try:
+            content_hash = file_content_hash(path)
+        except OSError as e:
+            logger.warning(f"Не удалось хэшировать {path} для кэша кадров: {e}")
+            return None
+        return self.make_key(content_hash, max_side, sampling, keyframes_only)
+
+    def _data_path(self, key: str) -> Path:
+        return self.root / f"{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}.npy"
+
+    def open(
+        self,
+        key: str,
+        order: str = "temporal",
+        cancel_event: Optional[threading.Event] = None,
+    ) -> Optional[OpenedVideo]:
+        """Кадры из кэша (memmap, copy-on-write) в порядке order или None при промахе."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT meta, expected, present, keyframes_only FROM frames WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE frames SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+
+        data = None
+        if row is not None:
+            try:
+                data = np.load(self._data_path(key), mmap_mode="c")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Кэш кадров: запись {key} повреждена, будет перезаписана: {e}")
+
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        meta_json, expected, present_blob, keyframes_only = row
+        meta = VideoMeta(**json.loads(meta_json))
+        present = set(np.frombuffer(present_blob, dtype=np.int32).tolist())
+        visit = coarse_to_fine_order(expected) if order == "coarse_to_fine" else range(expected)
+
+        def frames() -> Iterator[IndexedFrame]:
+            for k in visit:
+                check_cancelled(cancel_event)
+                if k in present:
+                    yield k, data[k]
+            logger.info(f"Video meta (кэш кадров): {meta}, sampled_frames={len(present)}")
+
+        return OpenedVideo(meta, int(expected), frames(), keyframes_only=bool(keyframes_only))
+
+    def record(self, key: str, opened: OpenedVideo) -> OpenedVideo:
+        """Обернуть декодер: кадры сохраняются по ходу и фиксируются, если выборка дочитана до конца."""
+        if opened.expected_frames <= 0:
+            return opened
+        recorder = _Recorder(self, key, opened)
+        return OpenedVideo(opened.meta, opened.expected_frames, recorder.frames(), keyframes_only=opened.keyframes_only)
+
+    def _commit(self, key: str, tmp: Path, path: Path, opened: OpenedVideo, present: List[int]) -> None:
+        os.replace(tmp, path)
+        nbytes = os.path.getsize(path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO frames VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    json.dumps(asdict(opened.meta)),
+                    opened.expected_frames,
+                    np.asarray(present, dtype=np.int32).tobytes(),
+                    int(opened.keyframes_only),
+                    nbytes,
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+            # Видео — крупные записи и фиксируются редко, поэтому лимит проверяется на каждой.
+            self._evict_locked()
+        logger.info(f"Кэш кадров: сохранено {len(present)} кадров ({nbytes / 1e6:.1f} МБ)")
+
+    def evict(self) -> int:
+        with self._lock:
+            return self._evict_locked()
+
+    def _evict_locked(self) -> int:
+        total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM frames").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+
+        target = int(self.max_bytes * 0.9)
+        victims = []
+        for key, nbytes in self._conn.execute("SELECT key, nbytes FROM frames ORDER BY last_access ASC"):
+            if total <= target:
+                break
+            victims.append(key)
+            total -= nbytes
+        self._conn.executemany("DELETE FROM frames WHERE key = ?", [(k,) for k in victims])
+        self._conn.commit()
+        for key in victims:
+            # Уже открытые memmap продолжают работать: файл удаляется после закрытия отображения.
+            try:
+                os.remove(self._data_path(key))
+            except OSError:
+                pass
+
+        self.evictions += len(victims)
+        logger.info(f"Кэш кадров: выселено {len(victims)} видео.")
+        return len(victims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM frames"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": int(entries),
+            "bytes": int(total),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
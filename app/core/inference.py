@@ -1,16 +1,42 @@
-from dataclasses import dataclass
-from typing import List
-
+import contextlib
+import contextvars
+import gc
+import math
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
+
+import numpy as np
 import torch
+import torch.nn.functional as F
 from PIL import Image as PILImage
 from transformers import AutoImageProcessor
 
+from app.services import tracing
 from app.services.logger import logger
-from app.config.settings import DEVICE, DTYPE, CKPT_DIR, BASE_MODEL_ID
-from app.core.model import DeepfakeSigLIP
-from app.core.model_loader import load_weights_from_checkpoint
+from app.config.settings import DEVICE, DTYPE, PRECISION, CKPT_DIR, BASE_MODEL_ID, TOKEN_MERGE
+from app.core.backends import create_backend, export_artifact_path
+from app.core.cache import ResultCache, checkpoint_fingerprint, file_content_hash
+from app.core.dedup import DEFAULT_THRESHOLD as DEDUP_THRESHOLD, FrameDeduplicator
+from app.core.frame_cache import FrameCache
+from app.core.model_loader import load_model_from_checkpoint
 from app.core.preprocess import normalize_image_to_rgb
-from app.core.video import VideoMeta, read_video_uniform_frames
+from app.core.precision import resolve_precision
+from app.core.tensor_preprocess import TensorPreprocessor
+from app.core.video import VideoMeta, check_cancelled, open_video_stream
+
+
+# (обработано кадров, всего кадров, текущая агрегированная вероятность)
+ProgressCallback = Callable[[int, int, float], None]
+
+ImageInput = Union[PILImage.Image, np.ndarray]
+
+T = TypeVar("T")
+
+# Размер батча по умолчанию, пока нет результата app.tune для этой машины.
+DEFAULT_BATCH_SIZE = 16
 
 
 @dataclass
@@ -18,6 +44,10 @@ class PredictionResult:
     label: str
     prob_deepfake: float
     confidence: float
+    # Время и память по стадиям (tracing.Trace.summary()), если трассировка включена.
+    timings: Optional[Dict[str, Any]] = field(default=None, kw_only=True)
+    # Статистика каскада разрешений (CascadeStats), если каскад включён.
+    cascade: Optional[Dict[str, Any]] = field(default=None, kw_only=True)
 
 
 @dataclass
@@ -25,60 +55,375 @@ class VideoPredictionResult(PredictionResult):
     per_frame_probs: List[float]
     meta: VideoMeta
     agg_method: str
+    # True — оценка по ключевым кадрам (быстрый triage), а не полной выборке.
+    triage: bool = False
+    # Сколько кадров реально прошло через модель (при adaptive/бюджете может быть меньше выборки).
+    frames_used: int = 0
+    early_stopped: bool = False
+    # Кадры, получившие вероятность почти одинакового кадра без прогона модели (dedup).
+    skipped_frames: int = 0
+
+
+@dataclass(frozen=True)
+class CascadeConfig:
+    """
+    Каскад разрешений: сначала оценка на low_side (позиционные эмбеддинги
+    интерполируются), повторно в полном разрешении — только элементы с
+    |p - threshold| < band.
+    """
+
+    low_side: int = 256
+    band: float = 0.15
+
+    def tag(self) -> str:
+        return f"{self.low_side}:{self.band:g}"
+
+
+@dataclass
+class CascadeStats:
+    threshold: float
+    low_size: Tuple[int, int]
+    items: int = 0
+    escalated: int = 0
+
+    @property
+    def escalation_rate(self) -> float:
+        return self.escalated / self.items if self.items else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {**asdict(self), "escalation_rate": round(self.escalation_rate, 4)}
+
+
+# Статистика каскада текущего вызова predict/predict_video (или cascade_scope).
+_current_cascade: contextvars.ContextVar[Optional[CascadeStats]] = contextvars.ContextVar(
+    "deepfake_cascade", default=None
+)
 
 
 class DeepfakeClassifier:
-    def __init__(self):
+    # Каскад разрешений (None — всегда полное разрешение).
+    cascade: Optional[CascadeConfig] = None
+    # Размер батча, когда вызывающий не указал свой (app.core.autotune.apply_tuned его меняет).
+    batch_size: int = DEFAULT_BATCH_SIZE
+    # Потолок батча после нехватки памяти: больше него батчи не собираются до конца жизни объекта.
+    oom_batch_cap: Optional[int] = None
+
+    def __init__(
+        self,
+        cache: Optional[ResultCache] = None,
+        preprocess: str = "tensor",
+        precision: Optional[str] = None,
+        backend: str = "eager",
+        compile_mode: Optional[str] = None,
+        ckpt_dir: Optional[str] = None,
+        frame_cache: Optional[FrameCache] = None,
+        token_merge: Optional[float] = None,
+        cascade: Optional[CascadeConfig] = None,
+    ):
+        """
+        preprocess: "tensor" — векторизованная предобработка в torch (ядро PIL, в пределах одного
+        уровня яркости от AutoImageProcessor и быстрее него, см. app.bench.preprocess_parity),
+        "processor" — AutoImageProcessor, как при обучении.
+        precision: режим из PRECISION_MODES (по умолчанию PRECISION из настроек); "auto" — DTYPE,
+        "bf16-autocast" — веса fp32 + torch.autocast в bf16, "int8" — динамическое квантование (CPU).
+        backend: "eager", "compile" (torch.compile, режим compile_mode) или "export" — граф
+        torch.export, сохраняемый рядом с чекпоинтом и переиспользуемый при следующих запусках.
+        ckpt_dir: каталог чекпоинта (по умолчанию CKPT_DIR из настроек).
+        frame_cache: дисковый кэш кадров выборки — повторный анализ видео без декодирования.
+        token_merge: доля токенов ViT, объединяемых в каждом слое (ToMe, app.core.token_merging;
+        по умолчанию TOKEN_MERGE из настроек). Быстрее на CPU ценой небольшого сдвига вероятностей.
+        cascade: каскад разрешений — полное разрешение только для неуверенных оценок (CascadeConfig).
+        """
+        self.ckpt_dir = ckpt_dir or CKPT_DIR
+        model_dir = ckpt_dir or BASE_MODEL_ID
         logger.info("Инициализация DeepfakeClassifier...")
-        logger.info(f"Model path: {BASE_MODEL_ID}")
+        logger.info(f"Model path: {model_dir}")
+
+        self.policy = resolve_precision(precision or PRECISION, DEVICE, DTYPE)
+        self.device = self.policy.device
+        self.dtype = self.policy.weight_dtype
+        self.precision = self.policy.name
+        logger.info(f"Точность: {self.precision} (веса {self.dtype}, autocast {self.policy.autocast_dtype})")
 
-        self.device = DEVICE
-        self.dtype = DTYPE
+        self.cache = cache
+        self.frame_cache = frame_cache
+        self._device_sync = _device_synchronizer(self.device)
 
         logger.info("Загрузка AutoImageProcessor...")
-        self.processor = AutoImageProcessor.from_pretrained(CKPT_DIR)
+        self.processor = AutoImageProcessor.from_pretrained(self.ckpt_dir)
         logger.info("Processor загружен.")
 
+        self.tensor_preprocessor: Optional[TensorPreprocessor] = None
+        if preprocess == "tensor":
+            try:
+                self.tensor_preprocessor = TensorPreprocessor(self.ckpt_dir, pin_memory=self.device == "cuda")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Тензорная предобработка недоступна, используется AutoImageProcessor: {e}")
+                preprocess = "processor"
+        self.preprocess = preprocess
+
         logger.info("Создание DeepfakeSigLIP модели...")
-        self.model = DeepfakeSigLIP(BASE_MODEL_ID).to(self.device, dtype=self.dtype)
+        model = load_model_from_checkpoint(model_dir, self.ckpt_dir, dtype=self.dtype)
+        self.model = self.policy.finalize_model(self.policy.prepare_model(model))
+        self.token_merge = TOKEN_MERGE if token_merge is None else token_merge
+        self.model.token_merge_ratio = self.token_merge
+        if self.token_merge > 0:
+            logger.info(f"Слияние токенов ViT: {self.token_merge:.0%} токенов за слой")
+
+        self.cascade = cascade
+        if cascade is not None:
+            logger.info(
+                f"Каскад разрешений: {'x'.join(map(str, self._cascade_size()))}, "
+                f"полное разрешение при |p - threshold| < {cascade.band:g}"
+            )
+
+        example = self.policy.cast_inputs(torch.zeros(2, 3, *self._input_size()))
+        graph = self._backend_graph()
+        self.backend = create_backend(
+            graph,
+            backend,
+            self.policy,
+            example,
+            artifact_path=(
+                export_artifact_path(self.ckpt_dir, self.policy, type(graph).__name__, self.token_merge)
+                if backend == "export" else None
+            ),
+            compile_mode=compile_mode,
+        )
 
-        logger.info("Загрузка весов...")
-        load_weights_from_checkpoint(self.model, CKPT_DIR)
+        self.model_fingerprint = ""
+        if cache is not None:
+            self.model_fingerprint = f"{checkpoint_fingerprint(self.ckpt_dir)}:{self._variant_tag()}"
 
         logger.info("DeepfakeClassifier инициализирован.")
 
+    def _backend_graph(self) -> torch.nn.Module:
+        """Модуль, который оборачивает бэкенд; его выход обрабатывает _infer_batch."""
+        return self.model
+
+    def _input_size(self) -> Tuple[int, int]:
+        if self.tensor_preprocessor is not None:
+            return self.tensor_preprocessor.height, self.tensor_preprocessor.width
+        size = self.processor.size
+        return int(size["height"]), int(size["width"])
+
+    def _variant_tag(self) -> str:
+        """Настройки, влияющие на вероятности: входят в ключ кэша результатов."""
+        tag = f"pre={self.preprocess}:prec={self.precision}"
+        if self.token_merge > 0:
+            tag += f":tome={self.token_merge:g}"
+        if self.cascade is not None:
+            tag += f":cascade={self.cascade.tag()}"
+        return tag
+
+    def _cascade_size(self) -> Tuple[int, int]:
+        """Разрешение первого прохода: low_side по длинной стороне, кратно размеру патча."""
+        height, width = self._input_size()
+        vision_config = getattr(self.model.backbone.config, "vision_config", self.model.backbone.config)
+        patch = int(vision_config.patch_size)
+        scale = min(1.0, self.cascade.low_side / max(height, width))
+        return max(patch, int(height * scale) // patch * patch), max(patch, int(width * scale) // patch * patch)
+
+    @contextlib.contextmanager
+    def cascade_scope(self, threshold: float = 0.5) -> Iterator[Optional[CascadeStats]]:
+        """
+        Порог каскада и общая статистика для всех predict_batch внутри блока
+        (None, если каскад выключен). Вложенный блок использует внешний.
+        """
+        if self.cascade is None:
+            yield None
+            return
+        outer = _current_cascade.get()
+        if outer is not None:
+            yield outer
+            return
+        stats = CascadeStats(threshold=threshold, low_size=self._cascade_size())
+        token = _current_cascade.set(stats)
+        try:
+            yield stats
+        finally:
+            _current_cascade.reset(token)
+
+    def _cascade_variant(self) -> str:
+        """Результат каскада зависит от порога вызова — он входит в ключ кэша."""
+        stats = _current_cascade.get() if self.cascade is not None else None
+        return f":cascade_thr={stats.threshold:g}" if stats is not None else ""
+
+    def _cache_key(self, source, variant: str = "") -> Optional[str]:
+        if self.cache is None or source is None:
+            return None
+        try:
+            content_hash = file_content_hash(source)
+        except OSError as e:
+            logger.warning(f"Не удалось хэшировать {source} для кэша: {e}")
+            return None
+        return ResultCache.make_key(content_hash, self.model_fingerprint, variant)
+
     @torch.no_grad()
-    def predict(self, image: PILImage.Image, threshold=0.5) -> PredictionResult:
-        probs = self.predict_batch([image])
+    def predict(
+        self,
+        image: ImageInput,
+        threshold=0.5,
+        source: Optional[Path] = None,
+    ) -> PredictionResult:
+        sources = [source] if source is not None else None
+        with tracing.collect() as trace, self.cascade_scope(threshold) as cascade:
+            probs = self.predict_batch([image], sources=sources)
         prob = probs[0]
 
         label = "deepfake" if prob >= threshold else "real"
         confidence = prob if label == "deepfake" else (1 - prob)
-        return PredictionResult(label, prob, confidence)
+        return PredictionResult(
+            label,
+            prob,
+            confidence,
+            timings=trace.summary() if trace else None,
+            cascade=cascade.summary() if cascade else None,
+        )
 
     @torch.no_grad()
-    def predict_batch(self, images: List[PILImage.Image], batch_size: int = 16) -> List[float]:
+    def predict_batch(
+        self,
+        images: Sequence[ImageInput],
+        batch_size: Optional[int] = None,
+        sources: Optional[Sequence[Optional[Path]]] = None,
+    ) -> List[float]:
         """
         Батч-инференс, значительно быстрее для видео.
+        batch_size — по умолчанию self.batch_size.
+        sources — пути исходных файлов для кэша результатов (если кэш включён).
         """
         if not images:
             return []
+        batch_size = batch_size or self.batch_size
+
+        if self.cache is None or sources is None:
+            return self._infer_batch(images, batch_size)
+
+        keys = [self._cache_key(src, "image" + self._cascade_variant()) for src in sources]
+        probs: List[Optional[float]] = [None] * len(images)
+        missing: List[int] = []
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                probs[i] = cached.prob_deepfake
+            else:
+                missing.append(i)
+
+        if missing:
+            fresh = self._infer_batch([images[i] for i in missing], batch_size)
+            for i, prob in zip(missing, fresh):
+                probs[i] = prob
+                if keys[i] is not None:
+                    self.cache.put(keys[i], prob)
+
+        return [float(p) for p in probs]
+
+    def _preprocess(self, images: Sequence[ImageInput]) -> torch.Tensor:
+        if self.tensor_preprocessor is not None:
+            return self.tensor_preprocessor(images)
+        chunk = [normalize_image_to_rgb(im) for im in images]
+        with tracing.span("preprocess.processor", items=len(chunk)):
+            return self.processor(images=chunk, return_tensors="pt")["pixel_values"]
+
+    def _to_device(self, images: Sequence[ImageInput]) -> torch.Tensor:
+        """Предобработка и копирование host→device (cast_inputs) с замерами стадий."""
+        pixel_values = self._preprocess(images)
+        with tracing.span("h2d", items=len(images), sync=self._device_sync):
+            return self.policy.cast_inputs(pixel_values)
+
+    def _run_batches(
+        self,
+        images: Sequence[ImageInput],
+        batch_size: int,
+        run: Callable[[Sequence[ImageInput]], T],
+    ) -> List[T]:
+        """
+        run(chunk) по батчам не больше batch_size. При нехватке памяти батч
+        делится пополам и повторяется, а уменьшенный размер становится
+        потолком (oom_batch_cap) для следующих вызовов: видео досчитывается
+        мелкими батчами вместо ошибки.
+        """
+        if self.oom_batch_cap is not None:
+            batch_size = min(batch_size, self.oom_batch_cap)
+        out: List[T] = []
+        start = 0
+        while start < len(images):
+            chunk = images[start : start + batch_size]
+            try:
+                out.append(run(chunk))
+            except Exception as e:
+                if len(chunk) <= 1 or not _is_out_of_memory(e):
+                    raise
+                failed = len(chunk)
+            else:
+                start += len(chunk)
+                continue
+            # Вне except: трейсбек с тензорами неудачного батча уже освобождён.
+            batch_size = failed // 2
+            self.oom_batch_cap = batch_size
+            _release_memory(self.device)
+            logger.warning(f"Нехватка памяти на батче из {failed} кадров: повтор батчами по {batch_size}.")
+        return out
+
+    def _forward_probs(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        with tracing.span("model.forward", items=len(pixel_values), sync=self._device_sync), self.policy.autocast():
+            logits = self.backend(pixel_values)  # [B, 1]
+        return torch.sigmoid(logits.float()).squeeze(-1).cpu()  # [B]
+
+    def _cascade_probs(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """
+        Первый проход на уменьшенной копии уже нормализованного батча (ресайз
+        линеен, так что это то же, что ресайз кадров до нормализации), затем
+        полное разрешение для вероятностей в полосе неуверенности.
+        Уменьшенный вход идёт через eager-модель: графы compile/export
+        собраны под полное разрешение.
+        """
+        stats = _current_cascade.get()
+        threshold = stats.threshold if stats is not None else 0.5
+        low_size = stats.low_size if stats is not None else self._cascade_size()
+
+        with tracing.span("model.forward_low", items=len(pixel_values), sync=self._device_sync), self.policy.autocast():
+            low = F.interpolate(pixel_values, size=low_size, mode="bilinear", antialias=True, align_corners=False)
+            logits = self.model(low, interpolate_pos_encoding=True)
+        probs = torch.sigmoid(logits.float()).squeeze(-1).cpu()
+
+        uncertain = ((probs - threshold).abs() < self.cascade.band).nonzero().squeeze(-1)
+        if len(uncertain):
+            probs[uncertain] = self._forward_probs(pixel_values[uncertain.to(pixel_values.device)])
+        if stats is not None:
+            stats.items += len(probs)
+            stats.escalated += len(uncertain)
+        return probs
 
-        probs: List[float] = []
+    @torch.no_grad()
+    def _infer_batch(self, images: Sequence[ImageInput], batch_size: int) -> List[float]:
         self.model.eval()
 
-        for start in range(0, len(images), batch_size):
-            chunk = images[start : start + batch_size]
-            chunk = [normalize_image_to_rgb(im) for im in chunk]
-            inputs = self.processor(images=chunk, return_tensors="pt")
+        def run(chunk: Sequence[ImageInput]) -> List[float]:
+            pixel_values = self._to_device(chunk)
+            if self.cascade is not None:
+                p = self._cascade_probs(pixel_values)
+            else:
+                p = self._forward_probs(pixel_values)
+            return [float(x) for x in p.tolist()]
 
-            pixel_values = inputs["pixel_values"].to(self.device, dtype=torch.float16)
+        return [p for probs in self._run_batches(images, batch_size, run) for p in probs]
 
-            logits = self.model(pixel_values)  # [B, 1]
-            p = torch.sigmoid(logits.float()).squeeze(-1)  # [B]
-            probs.extend([float(x) for x in p.detach().cpu().tolist()])
+    @torch.no_grad()
+    def extract_features(self, images: Sequence[ImageInput], batch_size: Optional[int] = None) -> np.ndarray:
+        """Pooled-признаки backbone до головы: [N, D] float32 (для FeatureStore)."""
 
-        return probs
+        def run(chunk: Sequence[ImageInput]) -> np.ndarray:
+            pixel_values = self._to_device(chunk)
+            with tracing.span("model.features", items=len(chunk), sync=self._device_sync), self.policy.autocast():
+                feats = self.model.pooled_features(pixel_values)
+            return feats.float().cpu().numpy()
+
+        out = self._run_batches(images, batch_size or self.batch_size, run)
+        if not out:
+            return np.empty((0, self.model.norm.normalized_shape[0]), dtype=np.float32)
+        return np.concatenate(out)
 
     @torch.no_grad()
     def predict_video(
@@ -87,16 +432,127 @@ class DeepfakeClassifier:
         threshold: float = 0.5,
         agg_method: str = "median_of_means",
         chunk_count: int = 8,
-        batch_size: int = 16,
+        batch_size: Optional[int] = None,
         max_side: int = 768,
+        progress_cb: Optional[ProgressCallback] = None,
+        cancel_event: Optional[threading.Event] = None,
+        queue_depth: Optional[int] = None,
+        sampling: str = "auto",
+        triage: bool = False,
+        adaptive: bool = False,
+        confidence_level: float = 0.95,
+        max_frames: Optional[int] = None,
+        time_budget_sec: Optional[float] = None,
+        dedup: bool = False,
+        dedup_threshold: float = DEDUP_THRESHOLD,
     ) -> VideoPredictionResult:
-        frames, meta = read_video_uniform_frames(video_path, max_side=max_side)
-
-        per_frame_probs = self.predict_batch(frames, batch_size=batch_size)
-
-        prob = _aggregate_probs(per_frame_probs, method=agg_method, chunk_count=chunk_count)
-        label = "deepfake" if prob >= threshold else "real"
-        confidence = prob if label == "deepfake" else (1.0 - prob)
+        """
+        Кадры декодируются в фоновом потоке и поступают батчами через очередь
+        глубиной queue_depth (по умолчанию 2 * batch_size), так что декодирование
+        и инференс идут параллельно.
+        progress_cb вызывается после каждого батча кадров; cancel_event прерывает
+        декодирование и инференс исключением AnalysisCancelled.
+        triage=True — оценка только по ключевым кадрам для первичного отсева;
+        итог помечается флагом triage.
+        adaptive=True — кадры берутся «от грубого к точному», и анализ
+        останавливается, как только решение относительно threshold не может
+        измениться с уровнем доверия confidence_level. max_frames и
+        time_budget_sec ограничивают число кадров и время работы.
+        dedup=True — почти одинаковые кадры (средняя разница яркости меньше
+        dedup_threshold) получают вероятность первого такого кадра без прогона
+        модели; per_frame_probs по-прежнему содержит значение для каждого кадра.
+        batch_size — по умолчанию self.batch_size.
+        """
+        batch_size = batch_size or self.batch_size
+        with tracing.collect() as trace, self.cascade_scope(threshold) as cascade:
+            variant = (
+                f"video:max_side={max_side}"
+                + (":triage" if triage else "")
+                + (f":dedup={dedup_threshold:g}" if dedup else "")
+                + self._cascade_variant()
+            )
+            key = self._cache_key(video_path, variant)
+            cached = self.cache.get(key) if key is not None else None
+
+            used_triage = triage
+            early_stopped = False
+            skipped_frames = 0
+            if cached is not None and cached.per_frame_probs is not None and cached.meta is not None:
+                per_frame_probs, meta = cached.per_frame_probs, cached.meta
+            else:
+                # С бюджетом кадры тоже берутся «от грубого к точному», чтобы обрезанная выборка покрывала всё видео.
+                budgeted = max_frames is not None or time_budget_sec is not None
+                order = "coarse_to_fine" if (adaptive or budgeted) else "temporal"
+                started = time.perf_counter()
+
+                indexed_probs: List[Tuple[int, float]] = []
+                per_frame_probs = []
+                deduplicator = FrameDeduplicator(dedup_threshold) if dedup else None
+                with open_video_stream(
+                    video_path,
+                    max_side=max_side,
+                    cancel_event=cancel_event,
+                    queue_depth=queue_depth if queue_depth is not None else 2 * batch_size,
+                    sampling=sampling,
+                    keyframes_only=triage,
+                    order=order,
+                    frame_cache=self.frame_cache,
+                ) as stream:
+                    meta = stream.meta
+                    used_triage = stream.keyframes_only
+                    population = stream.expected_frames
+                    looks = max(1, math.ceil(population / batch_size))
+
+                    for batch in stream.indexed_batches(batch_size):
+                        check_cancelled(cancel_event)
+                        if max_frames is not None:
+                            batch = batch[: max(0, max_frames - len(indexed_probs))]
+                        frames = [frame for _, frame in batch]
+                        if deduplicator is not None:
+                            probs = deduplicator.predict(
+                                frames, lambda fresh: self.predict_batch(fresh, batch_size=batch_size)
+                            )
+                        else:
+                            probs = self.predict_batch(frames, batch_size=batch_size)
+                        indexed_probs.extend(zip((k for k, _ in batch), probs))
+                        per_frame_probs = [p for _, p in sorted(indexed_probs)]
+
+                        running = _aggregate_probs(per_frame_probs, method=agg_method, chunk_count=chunk_count)
+                        if progress_cb is not None:
+                            total = max(population, len(per_frame_probs))
+                            progress_cb(len(per_frame_probs), total, running)
+
+                        if len(per_frame_probs) >= population:
+                            break
+                        if max_frames is not None and len(per_frame_probs) >= max_frames:
+                            early_stopped = True
+                            break
+                        if time_budget_sec is not None and time.perf_counter() - started >= time_budget_sec:
+                            early_stopped = True
+                            break
+                        if adaptive and _decision_is_settled(
+                            per_frame_probs, running, threshold, population, confidence_level, looks
+                        ):
+                            early_stopped = True
+                            break
+
+                if deduplicator is not None:
+                    skipped_frames = deduplicator.skipped
+                    logger.info(
+                        f"Дедупликация кадров: пропущено {skipped_frames} из {deduplicator.frames} кадров."
+                    )
+                if early_stopped:
+                    logger.info(
+                        f"Адаптивная выборка: использовано {len(per_frame_probs)} из {population} кадров."
+                    )
+
+            prob = _aggregate_probs(per_frame_probs, method=agg_method, chunk_count=chunk_count)
+            # Усечённую выборку не кэшируем: она зависит от порога и бюджета.
+            if key is not None and cached is None and used_triage == triage and not early_stopped:
+                self.cache.put(key, prob, per_frame_probs=per_frame_probs, meta=meta)
+
+            label = "deepfake" if prob >= threshold else "real"
+            confidence = prob if label == "deepfake" else (1.0 - prob)
 
         return VideoPredictionResult(
             label=label,
@@ -105,9 +561,71 @@ class DeepfakeClassifier:
             per_frame_probs=per_frame_probs,
             meta=meta,
             agg_method=agg_method,
+            triage=used_triage,
+            frames_used=len(per_frame_probs),
+            early_stopped=early_stopped,
+            skipped_frames=skipped_frames,
+            timings=trace.summary() if trace else None,
+            cascade=cascade.summary() if cascade else None,
         )
 
 
+def _device_synchronizer(device: str) -> Optional[Callable[[], None]]:
+    """Синхронизация для замеров стадий: без неё время асинхронных ядер GPU попадает в следующую стадию."""
+    if device == "cuda":
+        return torch.cuda.synchronize
+    if device == "mps":
+        return torch.mps.synchronize
+    return None
+
+
+def _is_out_of_memory(e: BaseException) -> bool:
+    if isinstance(e, (MemoryError, torch.cuda.OutOfMemoryError)):
+        return True
+    # CPU-аллокатор torch и MPS сообщают о нехватке памяти обычным RuntimeError.
+    message = str(e).lower()
+    return isinstance(e, RuntimeError) and ("out of memory" in message or "can't allocate memory" in message)
+
+
+def _release_memory(device: str) -> None:
+    gc.collect()
+    if device == "cuda":
+        torch.cuda.empty_cache()
+    elif device == "mps":
+        torch.mps.empty_cache()
+
+
+def _decision_is_settled(
+    probs: List[float],
+    running: float,
+    threshold: float,
+    population: int,
+    confidence_level: float,
+    looks: int,
+) -> bool:
+    """
+    Последовательный тест: доверительный интервал Хёффдинга–Серфлинга для
+    среднего по выборке без возвращения из population кадров. Уровень ошибки
+    делится на число проверок (looks), чтобы многократные «подглядывания»
+    не раздували его. Решение считается устойчивым, если интервал целиком по
+    одну сторону порога и текущий агрегат с ним согласен.
+    """
+    n = len(probs)
+    if n == 0 or population <= 0:
+        return False
+
+    delta = max(1e-12, (1.0 - confidence_level) / looks)
+    finite_pop = max(0.0, 1.0 - (n - 1) / population)
+    radius = math.sqrt(finite_pop * math.log(2.0 / delta) / (2.0 * n))
+    mean = sum(probs) / n
+
+    if mean - radius >= threshold and running >= threshold:
+        return True
+    if mean + radius < threshold and running < threshold:
+        return True
+    return False
+
+
 def _aggregate_probs(probs: List[float], method: str, chunk_count: int = 8) -> float:
     if not probs:
         return 0.0
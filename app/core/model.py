@@ -1,3 +1,5 @@
+from typing import Optional
+
 import torch
 import torch.nn as nn
 from transformers import AutoModel
@@ -6,15 +8,20 @@ from app.services.logger import logger
 
 
 class DeepfakeSigLIP(nn.Module):
-    def __init__(self, model_dir: str):
+    def __init__(self, model_dir: Optional[str] = None, config=None):
+        """config — собрать backbone из конфигурации без чтения весов (их загружает model_loader)."""
         super().__init__()
 
-        logger.info(f"Загрузка backbone из {model_dir} (только локальные файлы)...")
-        self.backbone = AutoModel.from_pretrained(
-            model_dir,
-            local_files_only=True
-        )
-        logger.info("Backbone успешно загружен.")
+        if config is not None:
+            logger.info("Создание backbone из конфигурации...")
+            self.backbone = AutoModel.from_config(config)
+        else:
+            logger.info(f"Загрузка backbone из {model_dir} (только локальные файлы)...")
+            self.backbone = AutoModel.from_pretrained(
+                model_dir,
+                local_files_only=True
+            )
+            logger.info("Backbone успешно загружен.")
 
         for p in self.backbone.parameters():
             p.requires_grad = False
@@ -30,16 +37,46 @@ class DeepfakeSigLIP(nn.Module):
         self.norm = nn.LayerNorm(feat_dim)
         self.classifier = nn.Linear(feat_dim, 1)
 
+        # Доля токенов, объединяемых в каждом слое ViT (app.core.token_merging); 0 — выключено.
+        self.token_merge_ratio = 0.0
+
     @torch.no_grad()
-    def forward(self, pixel_values):
-        out = self.backbone.vision_model(pixel_values=pixel_values)
+    def pooled_features(self, pixel_values, interpolate_pos_encoding: bool = False):
+        """
+        Пулированные признаки backbone до головы (norm + classifier): [B, feat_dim].
+        interpolate_pos_encoding — вход другого разрешения, чем при обучении (каскад).
+        """
+        if self.token_merge_ratio > 0:
+            from app.core.token_merging import merged_pooled_features
 
-        if getattr(out, "image_embeds", None) is not None:
-            feats = out.image_embeds
-        elif getattr(out, "pooler_output", None) is not None:
-            feats = out.pooler_output
+            return merged_pooled_features(
+                self.backbone.vision_model, pixel_values, self.token_merge_ratio, interpolate_pos_encoding
+            )
+
+        if interpolate_pos_encoding:
+            out = self.backbone.vision_model(pixel_values=pixel_values, interpolate_pos_encoding=True)
         else:
-            feats = out.last_hidden_state.mean(dim=1)
+            out = self.backbone.vision_model(pixel_values=pixel_values)
+
+        if getattr(out, "image_embeds", None) is not None:
+            return out.image_embeds
+        if getattr(out, "pooler_output", None) is not None:
+            return out.pooler_output
+        return out.last_hidden_state.mean(dim=1)
 
-        feats = self.norm(feats)
+    @torch.no_grad()
+    def forward(self, pixel_values, interpolate_pos_encoding: bool = False):
+        feats = self.norm(self.pooled_features(pixel_values, interpolate_pos_encoding))
         return self.classifier(feats)
+
+
+class PooledFeatures(nn.Module):
+    """Модуль, чей forward — pooled_features модели (для бэкендов compile/export)."""
+
+    def __init__(self, model: DeepfakeSigLIP):
+        super().__init__()
+        self.model = model
+
+    @torch.no_grad()
+    def forward(self, pixel_values):
+        return self.model.pooled_features(pixel_values)
@@ -1,34 +1,221 @@
+import contextlib
+import hashlib
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
 import torch
+import torch.nn as nn
 
 from app.services.logger import logger
+from app.services.memory import peak_rss_mb
 
 
-def load_weights_from_checkpoint(model, ckpt_dir: str):
-    logger.info("Поиск весов модели...")
-    paths = [
-        "model.safetensors",
-        "pytorch_model.bin",
-        "adapter_model.safetensors",
-        "adapter_model.bin",
-    ]
-
-    for fname in paths:
+# Имена параметров DeepfakeSigLIP вне backbone; остальные ключи без префикса считаются весами backbone.
+_HEAD_PREFIXES = ("backbone.", "norm.", "classifier.")
+
+
+@contextlib.contextmanager
+def params_on_meta():
+    """
+    Параметры, создаваемые внутри блока, живут на meta-устройстве и не занимают
+    память. Буферы (например, position_ids, которых нет в чекпоинте) остаются
+    настоящими.
+    """
+    original = nn.Module.register_parameter
+
+    def register_parameter(module, name, param):
+        original(module, name, param)
+        if param is not None:
+            param_cls = type(param)
+            kwargs = dict(param.__dict__, requires_grad=param.requires_grad)
+            module._parameters[name] = param_cls(param.to(torch.device("meta")), **kwargs)
+
+    nn.Module.register_parameter = register_parameter
+    try:
+        yield
+    finally:
+        nn.Module.register_parameter = original
+
+
+def _map_key(key: str) -> str:
+    # Чекпоинт самого SiglipModel (без головы) хранит ключи без префикса backbone.
+    return key if key.startswith(_HEAD_PREFIXES) else f"backbone.{key}"
+
+
+def checkpoint_weight_files(ckpt_dir: str) -> List[str]:
+    """Файлы весов чекпоинта в порядке приоритета: один safetensors, шарды по индексу, .bin/adapter."""
+    single = os.path.join(ckpt_dir, "model.safetensors")
+    if os.path.exists(single):
+        return [single]
+
+    index_path = os.path.join(ckpt_dir, "model.safetensors.index.json")
+    if os.path.exists(index_path):
+        with open(index_path, encoding="utf-8") as f:
+            shards = sorted(set(json.load(f)["weight_map"].values()))
+        return [os.path.join(ckpt_dir, name) for name in shards]
+
+    for fname in ("pytorch_model.bin", "adapter_model.safetensors", "adapter_model.bin"):
         full = os.path.join(ckpt_dir, fname)
         if os.path.exists(full):
-            logger.info(f"Файл найден: {full}")
+            return [full]
+    return []
+
+
+def _cast(tensor: torch.Tensor, dtype: Optional[torch.dtype]) -> torch.Tensor:
+    if dtype is not None and tensor.is_floating_point() and tensor.dtype != dtype:
+        return tensor.to(dtype)
+    return tensor
+
+
+def iter_file_tensors(
+    path: str,
+    dtype: Optional[torch.dtype] = None,
+    select: Optional[Callable[[str], bool]] = None,
+) -> Iterator[Tuple[str, torch.Tensor]]:
+    if path.endswith(".safetensors"):
+        from safetensors import safe_open
+
+        with safe_open(path, framework="pt", device="cpu") as f:
+            for key in f.keys():
+                name = _map_key(key)
+                if select is None or select(name):
+                    yield name, _cast(f.get_tensor(key), dtype)
+    else:
+        raw = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+        for key, tensor in raw.items():
+            name = _map_key(key)
+            if select is None or select(name):
+                yield name, _cast(tensor, dtype)
+
+
+def iter_checkpoint_tensors(
+    ckpt_dir: str,
+    dtype: Optional[torch.dtype] = None,
+    select: Optional[Callable[[str], bool]] = None,
+) -> Iterator[Tuple[str, torch.Tensor]]:
+    """
+    Тензоры чекпоинта по одному (ключи в именах DeepfakeSigLIP). select — фильтр
+    по имени: непрошенные тензоры не читаются с диска.
+    """
+    for path in checkpoint_weight_files(ckpt_dir):
+        yield from iter_file_tensors(path, dtype, select)
+
+
+def vision_tensor_digests(ckpt_dir: str) -> Dict[str, str]:
+    """Хэши тензоров vision-backbone, по одному тензору: сравнение без второй копии весов в памяти."""
+    digests: Dict[str, str] = {}
+    select = lambda k: k.startswith("backbone.vision_model.")  # noqa: E731
+    for name, tensor in iter_checkpoint_tensors(ckpt_dir, select=select):
+        raw = tensor.contiguous().view(-1).view(torch.uint8).numpy()
+        digests[name] = f"{tensor.dtype}:{tuple(tensor.shape)}:" + hashlib.blake2b(raw, digest_size=16).hexdigest()
+    return digests
+
+
+def backbone_fingerprint(ckpt_dir: str) -> str:
+    """Отпечаток только vision-backbone: не меняется при переобучении головы."""
+    h = hashlib.blake2b(digest_size=12)
+    for name, digest in sorted(vision_tensor_digests(ckpt_dir).items()):
+        h.update(f"{name}={digest};".encode())
+    return h.hexdigest()
+
+
+def _read_state_dict(ckpt_dir: str, dtype: Optional[torch.dtype], max_workers: int) -> Optional[Dict[str, torch.Tensor]]:
+    files = checkpoint_weight_files(ckpt_dir)
+    if not files:
+        return None
+    if len(files) == 1:
+        logger.info(f"Файл найден: {files[0]}")
+        return dict(iter_file_tensors(files[0], dtype))
+
+    logger.info(f"Шардированный чекпоинт: {len(files)} файлов, чтение в {max_workers} потоков")
+    state: Dict[str, torch.Tensor] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for part in pool.map(lambda path: dict(iter_file_tensors(path, dtype)), files):
+            state.update(part)
+    return state
+
+
+def _materialize_missing(model: nn.Module, dtype: Optional[torch.dtype]) -> List[str]:
+    """
+    Параметры, оставшиеся на meta, получают инициализацию по умолчанию, как у
+    свежесозданной модели: backbone — через _init_weights transformers, голова —
+    reset_parameters модуля. Загруженные параметры того же модуля сохраняются.
+    """
+    owners: Dict[str, List[str]] = {}
+    for name, param in model.named_parameters():
+        if param.is_meta:
+            module_name, _, attr = name.rpartition(".")
+            owners.setdefault(module_name, []).append(attr)
+
+    backbone = getattr(model, "backbone", None)
+    for module_name, attrs in owners.items():
+        module = model.get_submodule(module_name)
+        loaded = {k: v for k, v in module._parameters.items() if v is not None and not v.is_meta}
+        buffers = {k: v for k, v in module._buffers.items() if v is not None}
+        module.to_empty(device="cpu", recurse=False)
+        if module_name.startswith("backbone") and hasattr(backbone, "_init_weights"):
+            backbone._init_weights(module)
+        elif hasattr(module, "reset_parameters"):
+            module.reset_parameters()
+        else:
+            raise ValueError(f"Нет в чекпоинте и нечем инициализировать: {module_name}.{attrs}")
+        module._parameters.update(loaded)
+        module._buffers.update(buffers)
+        for attr in attrs:
+            module._parameters[attr] = nn.Parameter(_cast(module._parameters[attr].detach(), dtype), requires_grad=False)
+    return [f"{m}.{a}" if m else a for m, attrs in owners.items() for a in attrs]
+
+
+def load_model_from_checkpoint(
+    model_dir: str,
+    ckpt_dir: str,
+    dtype: Optional[torch.dtype] = None,
+    max_workers: int = 4,
+):
+    """
+    Собрать DeepfakeSigLIP по конфигурации с параметрами на meta-устройстве и
+    один раз материализовать их прямо из memory-mapped safetensors
+    (load_state_dict(assign=True)), приводя к dtype по одному тензору.
+    Параметры backbone, которых нет в ckpt_dir (например, чекпоинт только с
+    головой или адаптером), берутся из весов model_dir; оставшиеся получают
+    инициализацию по умолчанию, как при load_state_dict(strict=False).
+    """
+    from transformers import AutoConfig
+
+    from app.core.model import DeepfakeSigLIP
+
+    started = time.perf_counter()
+    config = AutoConfig.from_pretrained(model_dir, local_files_only=True)
+    with params_on_meta():
+        model = DeepfakeSigLIP(config=config)
+
+    logger.info("Поиск весов модели...")
+    state = _read_state_dict(ckpt_dir, dtype, max_workers)
+    if state is None:
+        raise FileNotFoundError(f"Файл весов не найден в {ckpt_dir}")
 
-            if fname.endswith(".safetensors"):
-                from safetensors.torch import load_file
+    missing, unexpected = model.load_state_dict(state, strict=False, assign=True)
+    del state
 
-                state = load_file(full)
-            else:
-                state = torch.load(full, map_location="cpu")
+    missing_backbone = {k for k in missing if k.startswith("backbone.")}
+    if missing_backbone and os.path.abspath(model_dir) != os.path.abspath(ckpt_dir):
+        base = dict(iter_checkpoint_tensors(model_dir, dtype, select=missing_backbone.__contains__))
+        if base:
+            logger.info(f"Из базовой модели {model_dir} взято тензоров backbone: {len(base)}")
+            model.load_state_dict(base, strict=False, assign=True)
+        del base
 
-            missing, unexpected = model.load_state_dict(state, strict=False)
-            logger.info(
-                f"Веса загружены. MISSING={len(missing)}, UNEXPECTED={len(unexpected)}"
-            )
-            return
+    initialized = _materialize_missing(model, dtype)
+    if initialized:
+        logger.warning(
+            f"Нет в чекпоинте ({len(initialized)}), инициализация по умолчанию: {initialized[:5]}"
+        )
 
-    logger.error("ОШИБКА: файл весов не найден в директории.")
+    logger.info(
+        f"Веса загружены. MISSING={len(missing)}, UNEXPECTED={len(unexpected)}; "
+        f"холодный старт модели {time.perf_counter() - started:.2f} с, пиковый RSS {peak_rss_mb():.0f} МБ"
+    )
+    return model
@@ -0,0 +1,107 @@
+import contextlib
+import sys
+from dataclasses import dataclass
+from typing import Optional
+
+import torch
+import torch.nn as nn
+
+from app.core.quantization import quantize_dynamic_int8
+from app.services.logger import logger
+
+
+PRECISION_MODES = ("auto", "fp32", "fp16", "bf16", "bf16-autocast", "fp16-autocast", "int8")
+
+_DTYPE_NAMES = {torch.float32: "fp32", torch.float16: "fp16", torch.bfloat16: "bf16"}
+
+# Устройства, на которых режим имеет смысл (не эмулируется медленно и поддерживается torch).
+_SUPPORTED_DEVICES = {
+    "fp32": ("cpu", "cuda", "mps"),
+    "fp16": ("cuda", "mps"),
+    "bf16": ("cpu", "cuda"),
+    "bf16-autocast": ("cpu", "cuda"),
+    "fp16-autocast": ("cuda", "mps"),
+    "int8": ("cpu",),
+}
+
+
+def cpu_supports_bf16() -> bool:
+    """Есть ли у CPU аппаратный bf16 (AVX512-BF16 или AMX); без него bf16 на CPU эмулируется."""
+    if sys.platform != "linux":
+        return False
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    flags = set(line.split(":", 1)[1].split())
+                    return bool(flags & {"avx512_bf16", "amx_bf16"})
+    except OSError:
+        pass
+    return False
+
+
+@dataclass(frozen=True)
+class PrecisionPolicy:
+    """
+    Единая настройка точности: dtype весов и входов, опциональный torch.autocast
+    и int8-квантование. Входные pixel_values всегда приводятся к dtype весов.
+    """
+
+    name: str
+    device: str
+    weight_dtype: torch.dtype
+    autocast_dtype: Optional[torch.dtype] = None
+    quantize_int8: bool = False
+
+    def prepare_model(self, model: nn.Module) -> nn.Module:
+        return model.to(self.device, dtype=self.weight_dtype)
+
+    def finalize_model(self, model: nn.Module) -> nn.Module:
+        """Вызывается после загрузки весов."""
+        if self.quantize_int8:
+            model = quantize_dynamic_int8(model)
+        return model.eval()
+
+    def cast_inputs(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return pixel_values.to(self.device, dtype=self.weight_dtype, non_blocking=True)
+
+    def autocast(self):
+        if self.autocast_dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type=self.device, dtype=self.autocast_dtype)
+
+
+def resolve_precision(mode: str, device: str, default_dtype: torch.dtype) -> PrecisionPolicy:
+    """
+    mode: один из PRECISION_MODES. "auto" — default_dtype (DTYPE из настроек).
+    Режим, не поддерживаемый устройством, заменяется на fp32 с предупреждением;
+    int8 всегда переводит модель на CPU.
+    """
+    if mode not in PRECISION_MODES:
+        raise ValueError(f"Неизвестный режим точности: {mode}. Допустимо: {', '.join(PRECISION_MODES)}")
+
+    if mode == "auto":
+        mode = _DTYPE_NAMES.get(default_dtype, "fp32")
+
+    if mode == "int8" and device != "cpu":
+        logger.warning(f"int8-квантование работает только на CPU, {device} не используется.")
+        device = "cpu"
+
+    if device not in _SUPPORTED_DEVICES[mode]:
+        logger.warning(f"Режим точности {mode} не поддерживается на {device}, используется fp32.")
+        mode = "fp32"
+
+    if mode.startswith("bf16") and device == "cpu" and not cpu_supports_bf16():
+        logger.warning("CPU без AVX512-BF16/AMX: bf16 будет эмулироваться и может работать медленнее fp32.")
+
+    if mode == "fp16":
+        return PrecisionPolicy(mode, device, torch.float16)
+    if mode == "bf16":
+        return PrecisionPolicy(mode, device, torch.bfloat16)
+    if mode == "bf16-autocast":
+        return PrecisionPolicy(mode, device, torch.float32, autocast_dtype=torch.bfloat16)
+    if mode == "fp16-autocast":
+        return PrecisionPolicy(mode, device, torch.float32, autocast_dtype=torch.float16)
+    if mode == "int8":
+        return PrecisionPolicy(mode, device, torch.float32, quantize_int8=True)
+    return PrecisionPolicy(mode, device, torch.float32)
@@ -1,12 +1,25 @@
+from pathlib import Path
+
 import numpy as np
 from PIL import Image as PILImage
 
+from app.services import tracing
+
+
+IMAGE_EXTS = {
+    ".png", ".jpg", ".jpeg", ".bmp", ".webp", ".tiff", ".tif", ".jfif"
+}
+
+
+def is_image_path(path: Path) -> bool:
+    return path.suffix.lower() in IMAGE_EXTS
 
 
 def _to_uint8(arr: np.ndarray) -> np.ndarray:
-    arr = np.nan_to_num(arr, nan=0, posinf=255, neginf=0)
+    # uint8 не бывает NaN/inf: возвращаем как есть, без копии от nan_to_num.
     if arr.dtype == np.uint8:
         return arr
+    arr = np.nan_to_num(arr, nan=0, posinf=255, neginf=0)
     if np.issubdtype(arr.dtype, np.floating):
         if arr.max() <= 1.0:
             arr *= 255
@@ -19,6 +32,11 @@ def _to_uint8(arr: np.ndarray) -> np.ndarray:
 
 
 def normalize_image_to_rgb(img_in):
+    with tracing.span("preprocess.to_rgb", items=1):
+        return _normalize_image_to_rgb(img_in)
+
+
+def _normalize_image_to_rgb(img_in):
     if isinstance(img_in, PILImage.Image):
         img = img_in
     else:
@@ -0,0 +1,31 @@
+import torch
+import torch.nn as nn
+
+from app.services.logger import logger
+
+
+def quantize_dynamic_int8(model: nn.Module) -> nn.Module:
+    """
+    Динамическое int8-квантование Linear-слоёв (только CPU): веса хранятся в int8,
+    активации квантуются на лету. Квантуются проекции внимания и MLP энкодера,
+    голова пулинга vision_model и classifier; патч-эмбеддинг (Conv2d) и
+    LayerNorm остаются в float32.
+    """
+    engines = torch.backends.quantized.supported_engines
+    if torch.backends.quantized.engine not in engines or torch.backends.quantized.engine == "none":
+        for engine in ("x86", "fbgemm", "qnnpack"):
+            if engine in engines:
+                torch.backends.quantized.engine = engine
+                break
+    logger.info(f"Динамическое int8-квантование (engine={torch.backends.quantized.engine})...")
+
+    model.float().eval()
+    targets = {"backbone.vision_model", "classifier"}
+    for name in targets:
+        parent_name, _, attr = name.rpartition(".")
+        parent = model.get_submodule(parent_name) if parent_name else model
+        module = getattr(parent, attr)
+        quantized = torch.ao.quantization.quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8)
+        setattr(parent, attr, quantized)
+
+    return model
@@ -0,0 +1,242 @@
+import json
+import math
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image as PILImage
+
+from app.core.preprocess import _to_uint8, normalize_image_to_rgb
+from app.services import tracing
+
+
+ImageLike = Union[PILImage.Image, np.ndarray]
+
+def _bilinear(x: float) -> float:
+    x = abs(x)
+    return 1.0 - x if x < 1.0 else 0.0
+
+
+def _bicubic(x: float, a: float = -0.5) -> float:
+    # Ядро PIL (a=-0.5), а не torch bicubic (a=-0.75).
+    x = abs(x)
+    if x < 1.0:
+        return ((a + 2.0) * x - (a + 3.0)) * x * x + 1.0
+    if x < 2.0:
+        return (((x - 5.0) * x + 8.0) * x - 4.0) * a
+    return 0.0
+
+
+# Коды PIL.Image.Resampling -> (имя, ядро, радиус носителя); None — nearest через F.interpolate.
+_RESAMPLE_FILTERS: Dict[int, Tuple[str, Optional[Callable[[float], float]], float]] = {
+    0: ("nearest", None, 0.0),
+    2: ("bilinear", _bilinear, 1.0),
+    3: ("bicubic", _bicubic, 2.0),
+}
+
+
+# Выходов на блок ленты и строк на чанк горизонтального прохода: чанк uint8 -> float32
+# помещается в кэш, а не материализуется целиком.
+_BAND_BLOCK = 16
+_ROW_CHUNK = 256
+
+
+def _resample_bands(
+    in_size: int,
+    out_size: int,
+    kernel: Callable[[float], float],
+    support: float,
+    channels: int = 1,
+) -> List[Tuple[int, int, torch.Tensor]]:
+    """
+    Коэффициенты ресайза одной оси, как precompute_coeffs в PIL (Resample.c): при
+    уменьшении ядро растягивается в in/out раз (антиалиасинг), у каждого выхода —
+    короткое окно входа. Выходы идут подряд блоками по _BAND_BLOCK; блок — это
+    (начало, конец окна входа, веса [окно, выходы блока]), так что проход —
+    несколько маленьких матричных умножений вместо плотной матрицы [out, in].
+    channels > 1 — оси с чередующимися каналами (HWC): веса расширяются по каналам.
+    """
+    scale = in_size / out_size
+    filterscale = max(scale, 1.0)
+    support = support * filterscale
+    bounds: List[Tuple[int, int]] = []
+    rows: List[List[float]] = []
+    for xx in range(out_size):
+        center = (xx + 0.5) * scale
+        xmin = max(int(center - support + 0.5), 0)
+        xmax = min(int(center + support + 0.5), in_size)
+        row = [kernel((x - center + 0.5) / filterscale) for x in range(xmin, xmax)]
+        total = math.fsum(row)
+        bounds.append((xmin, xmax))
+        rows.append([v / total for v in row] if total != 0.0 else [0.0] * len(row))
+
+    bands: List[Tuple[int, int, torch.Tensor]] = []
+    eye = torch.eye(channels, dtype=torch.float64)
+    for o0 in range(0, out_size, _BAND_BLOCK):
+        o1 = min(o0 + _BAND_BLOCK, out_size)
+        start = bounds[o0][0]
+        stop = max(xmax for _, xmax in bounds[o0:o1])
+        weights = torch.zeros(stop - start, o1 - o0, dtype=torch.float64)
+        for xx in range(o0, o1):
+            xmin, xmax = bounds[xx]
+            weights[xmin - start:xmax - start, xx - o0] = torch.tensor(rows[xx], dtype=torch.float64)
+        bands.append((start * channels, stop * channels, torch.kron(weights, eye).float()))
+    return bands
+
+
+def _as_rgb_uint8(img: ImageLike) -> np.ndarray:
+    """Привести кадр к HWC uint8 RGB; PIL-изображения идут через normalize_image_to_rgb (EXIF, альфа)."""
+    if isinstance(img, PILImage.Image):
+        # np.array, а не asarray: torch.from_numpy не принимает read-only буфер PIL без предупреждения.
+        return np.array(normalize_image_to_rgb(img))
+
+    arr = _to_uint8(np.asarray(img))
+    if arr.ndim == 2:
+        return np.repeat(arr[:, :, None], 3, axis=2)
+    if arr.shape[2] == 1:
+        return np.repeat(arr, 3, axis=2)
+    if arr.shape[2] == 4:
+        # Как в normalize_image_to_rgb: прозрачное — на чёрный фон.
+        alpha = arr[:, :, 3:4].astype(np.uint16)
+        return ((arr[:, :, :3].astype(np.uint16) * alpha + 127) // 255).astype(np.uint8)
+    return arr
+
+
+def _writable(arr: np.ndarray) -> np.ndarray:
+    """Кадры из PIL, memmap-кэша и декодеров бывают read-only; torch.from_numpy требует запись."""
+    arr = np.ascontiguousarray(arr)
+    return arr if arr.flags.writeable else arr.copy()
+
+
+class TensorPreprocessor:
+    """
+    Векторизованная замена AutoImageProcessor: батчевый resize и rescale/normalize
+    в torch по параметрам preprocessor_config.json, запись в переиспользуемый
+    буфер pixel_values. Результат валиден до следующего вызова.
+
+    Ресайз повторяет PIL: те же коэффициенты фильтра, сначала проход по ширине,
+    затем по высоте, с округлением в uint8 после каждого прохода. Кадры остаются
+    в HWC, проход — умножения на закэшированные блоки ленты коэффициентов.
+    """
+
+    def __init__(self, ckpt_dir: str, pin_memory: bool = False):
+        with open(os.path.join(ckpt_dir, "preprocessor_config.json"), encoding="utf-8") as f:
+            cfg = json.load(f)
+
+        size = cfg.get("size") or {}
+        if "height" not in size or "width" not in size:
+            raise ValueError(f"Неподдерживаемый формат size в preprocessor_config: {size}")
+        self.height = int(size["height"])
+        self.width = int(size["width"])
+        self.do_resize = bool(cfg.get("do_resize", True))
+
+        resample = int(cfg.get("resample", 2))
+        if resample not in _RESAMPLE_FILTERS:
+            raise ValueError(f"Неподдерживаемый resample={resample} для тензорной предобработки")
+        self.mode, self._kernel, self._support = _RESAMPLE_FILTERS[resample]
+        self._bands: Dict[Tuple[int, int, int], List[Tuple[int, int, torch.Tensor]]] = {}
+
+        rescale = float(cfg.get("rescale_factor", 1 / 255)) if cfg.get("do_rescale", True) else 1.0
+        if cfg.get("do_normalize", True):
+            mean = torch.tensor(cfg.get("image_mean", [0.5, 0.5, 0.5]), dtype=torch.float32)
+            std = torch.tensor(cfg.get("image_std", [0.5, 0.5, 0.5]), dtype=torch.float32)
+        else:
+            mean = torch.zeros(3)
+            std = torch.ones(3)
+        # (x * rescale - mean) / std == x * scale + shift
+        self._scale = (rescale / std).view(1, 3, 1, 1)
+        self._shift = (-mean / std).view(1, 3, 1, 1)
+
+        self.pin_memory = pin_memory
+        self._buffer = torch.empty(0, 3, self.height, self.width, dtype=torch.float32)
+
+    def _output(self, n: int) -> torch.Tensor:
+        if self._buffer.shape[0] < n:
+            self._buffer = torch.empty(
+                n, 3, self.height, self.width, dtype=torch.float32, pin_memory=self.pin_memory
+            )
+        return self._buffer[:n]
+
+    def _axis_bands(self, in_size: int, out_size: int, channels: int = 1) -> List[Tuple[int, int, torch.Tensor]]:
+        key = (in_size, out_size, channels)
+        bands = self._bands.get(key)
+        if bands is None:
+            bands = self._bands[key] = _resample_bands(in_size, out_size, self._kernel, self._support, channels)
+        return bands
+
+    def _resize(self, x: torch.Tensor) -> torch.Tensor:
+        """[N, H, W, C] uint8 -> [N, height, width, C] float32 со значениями 0..255."""
+        n, in_h, in_w, c = x.shape
+        if not self.do_resize or (in_h, in_w) == (self.height, self.width):
+            return x.float()
+        if self._kernel is None:
+            x = F.interpolate(x.permute(0, 3, 1, 2).float(), size=(self.height, self.width), mode="nearest")
+            return x.permute(0, 2, 3, 1)
+
+        # Как PIL: ширина, затем высота, с квантованием в uint8 после каждого прохода.
+        rows = x.reshape(n * in_h, in_w * c)
+        if in_w != self.width:
+            bands = self._axis_bands(in_w, self.width, c)
+            out = torch.empty(n * in_h, self.width * c)
+            for r in range(0, rows.shape[0], _ROW_CHUNK):
+                chunk = rows[r:r + _ROW_CHUNK].float()
+                torch.cat([torch.mm(chunk[:, a:b], w) for a, b, w in bands], dim=1, out=out[r:r + _ROW_CHUNK])
+            rows = out.clamp_(0, 255).round_()
+        else:
+            rows = rows.float()
+
+        x = rows.view(n, in_h, self.width * c)
+        if in_h != self.height:
+            bands = self._axis_bands(in_h, self.height)
+            x = torch.cat([torch.matmul(w.T, x[:, a:b]) for a, b, w in bands], dim=1).clamp_(0, 255).round_()
+        return x.view(n, self.height, self.width, c)
+
+    def _resized(self, images: Union[Sequence[ImageLike], np.ndarray]) -> torch.Tensor:
+        """Ресайз: [N, H, W, 3] float32 со значениями 0..255."""
+        if isinstance(images, np.ndarray) and images.ndim == 4 and images.dtype == np.uint8 and images.shape[3] == 3:
+            return self._resize(torch.from_numpy(_writable(images)))
+
+        arrays = [_as_rgb_uint8(im) for im in images]
+        groups: Dict[tuple, List[int]] = {}
+        for i, arr in enumerate(arrays):
+            groups.setdefault(arr.shape, []).append(i)
+
+        out: Optional[torch.Tensor] = None
+        for idxs in groups.values():
+            batch = np.stack([arrays[i] for i in idxs]) if len(idxs) > 1 else _writable(arrays[idxs[0]][None])
+            x = self._resize(torch.from_numpy(batch))
+            if len(idxs) == len(arrays):
+                return x
+            if out is None:
+                out = torch.empty(len(arrays), self.height, self.width, 3)
+            out.index_copy_(0, torch.tensor(idxs), x)
+        return out
+
+    @torch.no_grad()
+    def __call__(self, images: Union[Sequence[ImageLike], np.ndarray]) -> torch.Tensor:
+        """images: список PIL/HWC-массивов или готовый батч NHWC uint8. Возвращает [N, 3, H, W] float32."""
+        with tracing.span("preprocess.resize", items=len(images)):
+            x = self._resized(images)
+        with tracing.span("preprocess.normalize", items=len(images)):
+            out = self._output(x.shape[0])
+            torch.mul(x.permute(0, 3, 1, 2), self._scale, out=out).add_(self._shift)
+        return out
+
+    @torch.no_grad()
+    def resize_uint8(
+        self,
+        images: Union[Sequence[ImageLike], np.ndarray],
+        out: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Только ресайз: батч NHWC uint8 размера модели (в 4 раза компактнее pixel_values).
+        Ресайз и так квантуется в uint8, поэтому __call__ от результата даёт те же pixel_values.
+        """
+        with tracing.span("preprocess.resize", items=len(images)):
+            x = self._resized(images)
+        if out is None:
+            return x.to(torch.uint8).numpy()
+        torch.from_numpy(out).copy_(x)
+        return out
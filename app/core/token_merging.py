@@ -0,0 +1,146 @@
+"""
+Слияние токенов (ToMe, Bolya et al., 2023) для vision-энкодера SigLIP без дообучения.
+
+В каждом слое после self-attention часть токенов объединяется с самыми
+похожими (двудольное сопоставление по ключам attention): токены делятся на
+чётные/нечётные, у каждого чётного ищется ближайший нечётный, и ratio
+текущих токенов с самыми высокими сходствами усредняются в пару с учётом
+размера (сколько исходных патчей в токене). Внимание и пулинг-голова
+учитывают размер через log(size) в логитах (proportional attention), так что
+pooler_output остаётся согласованным с исходной моделью.
+
+Прямой проход собирается из подмодулей SiglipVisionModel (embeddings,
+encoder.layers, post_layernorm, head) и не зависит от того, что возвращают
+слои энкодера в конкретной версии transformers; веса и state_dict не меняются.
+"""
+from __future__ import annotations
+
+from typing import Callable, Tuple
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+# Двудольное сопоставление объединяет не больше половины токенов за слой.
+MAX_RATIO = 0.5
+
+
+def merged_tokens_per_layer(num_tokens: int, num_layers: int, ratio: float) -> Tuple[int, ...]:
+    """Сколько токенов объединяется в каждом слое при данном ratio (для отчётов)."""
+    out = []
+    n = num_tokens
+    for _ in range(num_layers):
+        r = _tokens_to_merge(n, ratio)
+        out.append(r)
+        n -= r
+    return tuple(out)
+
+
+def _tokens_to_merge(num_tokens: int, ratio: float) -> int:
+    return min(int(num_tokens * ratio), num_tokens // 2)
+
+
+def bipartite_soft_matching(metric: torch.Tensor, r: int) -> Callable[[torch.Tensor], torch.Tensor]:
+    """
+    metric [B, N, C] -> функция merge(x [B, N, C']) -> [B, N - r, C'], которая
+    суммирует r чётных токенов в их ближайших нечётных соседей.
+    """
+    with torch.no_grad():
+        metric = metric / metric.norm(dim=-1, keepdim=True)
+        a, b = metric[..., ::2, :], metric[..., 1::2, :]
+        scores = a @ b.transpose(-1, -2)
+
+        node_max, node_idx = scores.max(dim=-1)
+        edge_idx = node_max.argsort(dim=-1, descending=True)[..., None]
+        unm_idx = edge_idx[..., r:, :]
+        src_idx = edge_idx[..., :r, :]
+        dst_idx = node_idx[..., None].gather(dim=-2, index=src_idx)
+
+    def merge(x: torch.Tensor) -> torch.Tensor:
+        src, dst = x[..., ::2, :], x[..., 1::2, :]
+        n, t1, c = src.shape
+        unm = src.gather(dim=-2, index=unm_idx.expand(n, t1 - r, c))
+        src = src.gather(dim=-2, index=src_idx.expand(n, r, c))
+        dst = dst.scatter_reduce(-2, dst_idx.expand(n, r, c), src, reduce="sum")
+        return torch.cat([unm, dst], dim=1)
+
+    return merge
+
+
+def _merge_weighted(
+    merge: Callable[[torch.Tensor], torch.Tensor], x: torch.Tensor, size: torch.Tensor
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Среднее токенов, взвешенное по числу исходных патчей."""
+    x = merge(x * size)
+    size = merge(size)
+    return x / size, size
+
+
+def _size_bias(size: torch.Tensor, dtype: torch.dtype) -> torch.Tensor:
+    """log(size) по ключам: [B, 1, 1, N] для scaled_dot_product_attention."""
+    return size.log()[:, None, None, :, 0].to(dtype)
+
+
+def _layer_forward(layer: nn.Module, x: torch.Tensor, size: torch.Tensor, ratio: float):
+    """SiglipEncoderLayer с proportional attention и слиянием токенов между attention и MLP."""
+    attn = layer.self_attn
+    batch, tokens, dim = x.shape
+    heads = attn.num_heads
+    head_dim = dim // heads
+
+    h = layer.layer_norm1(x)
+    q = attn.q_proj(h).view(batch, tokens, heads, head_dim).transpose(1, 2)
+    k = attn.k_proj(h).view(batch, tokens, heads, head_dim).transpose(1, 2)
+    v = attn.v_proj(h).view(batch, tokens, heads, head_dim).transpose(1, 2)
+    out = F.scaled_dot_product_attention(q, k, v, attn_mask=_size_bias(size, q.dtype), scale=attn.scale)
+    x = x + attn.out_proj(out.transpose(1, 2).reshape(batch, tokens, dim))
+
+    r = _tokens_to_merge(tokens, ratio)
+    if r > 0:
+        # Метрика сходства — ключи, усреднённые по головам.
+        x, size = _merge_weighted(bipartite_soft_matching(k.mean(dim=1), r), x, size)
+
+    x = x + layer.mlp(layer.layer_norm2(x))
+    return x, size
+
+
+def _pool(vision_model: nn.Module, x: torch.Tensor, size: torch.Tensor) -> torch.Tensor:
+    """Пулинг как в SiglipVisionModel, но с весами токенов по их размеру."""
+    if not getattr(vision_model, "use_head", False):
+        return (x * size).sum(dim=1) / size.sum(dim=1)
+
+    head = vision_model.head
+    batch = x.shape[0]
+    probe = head.probe.repeat(batch, 1, 1)
+    heads = head.attention.num_heads
+    # Маска MultiheadAttention: [B * heads, 1, N], прибавляется к логитам.
+    bias = size.log()[..., 0][:, None, :].repeat_interleave(heads, dim=0).to(x.dtype)
+    h = head.attention(probe, x, x, attn_mask=bias, need_weights=False)[0]
+    h = h + head.mlp(head.layernorm(h))
+    return h[:, 0]
+
+
+def merged_pooled_features(
+    vision_model: nn.Module,
+    pixel_values: torch.Tensor,
+    ratio: float,
+    interpolate_pos_encoding: bool = False,
+) -> torch.Tensor:
+    """
+    pooler_output vision_model со слиянием ratio токенов в каждом слое: [B, hidden].
+    ratio=0 даёт тот же результат, что и обычный прямой проход (с точностью до
+    реализации attention).
+    """
+    if not 0.0 <= ratio <= MAX_RATIO:
+        raise ValueError(f"token merge ratio должен быть в [0, {MAX_RATIO}], получено {ratio}")
+    encoder = getattr(vision_model, "encoder", None)
+    if encoder is None or not hasattr(encoder, "layers"):
+        raise ValueError(f"Слияние токенов не поддерживает {type(vision_model).__name__}")
+
+    x = vision_model.embeddings(pixel_values, interpolate_pos_encoding=interpolate_pos_encoding)
+    size = torch.ones(x.shape[0], x.shape[1], 1, dtype=x.dtype, device=x.device)
+    for layer in encoder.layers:
+        x, size = _layer_forward(layer, x, size, ratio)
+    x = vision_model.post_layernorm(x)
+    return _pool(vision_model, x, size)
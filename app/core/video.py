@@ -2,15 +2,25 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Tuple
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
 
-import tempfile
+import bisect
+import contextvars
+import json
+import queue
+import re
 import subprocess
+import threading
+import time
 
-from PIL import Image as PILImage
+import numpy as np
 
+from app.services import tracing
 from app.services.logger import logger
 
+if TYPE_CHECKING:
+    from app.core.frame_cache import FrameCache
+
 
 VIDEO_EXTS = {
     ".mp4", ".mov", ".mkv", ".avi", ".webm", ".m4v", ".mpg", ".mpeg", ".3gp"
@@ -21,6 +31,15 @@ def is_video_path(path: Path) -> bool:
     return path.suffix.lower() in VIDEO_EXTS
 
 
+class AnalysisCancelled(RuntimeError):
+    """Анализ прерван пользователем."""
+
+
+def check_cancelled(cancel_event: Optional[threading.Event]) -> None:
+    if cancel_event is not None and cancel_event.is_set():
+        raise AnalysisCancelled("Анализ отменён.")
+
+
 @dataclass(frozen=True)
 class VideoMeta:
     duration_sec: float
@@ -38,57 +57,481 @@ def _pick_num_samples(duration_sec: float) -> int:
     return 128
 
 
-def _run_ffmpeg_transcode_to_mp4(src: Path) -> Path:
-    tmp_dir = Path(tempfile.mkdtemp(prefix="deepfake_video_"))
-    dst = tmp_dir / f"{src.stem}_normalized.mp4"
+# Общий лимит на работу ffmpeg и лимит на «тишину» — время без нового кадра.
+FFMPEG_TIMEOUT_SEC = 900.0
+FFMPEG_STALL_TIMEOUT_SEC = 60.0
+_FFPROBE_TIMEOUT_SEC = 30.0
+
+_SHOWINFO_PTS = re.compile(r"Parsed_showinfo.*\bn:\s*\d+.*\bpts_time:\s*([-+0-9.eE]+|nan)")
+
+
+def _parse_rate(value: Optional[str]) -> float:
+    if not value or value == "0/0":
+        return 0.0
+    num, _, den = value.partition("/")
+    try:
+        return float(num) / float(den) if den else float(num)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _ffprobe_video(path: Path) -> dict:
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=width,height,avg_frame_rate,r_frame_rate,nb_frames,duration:format=duration",
+        "-of", "json",
+        str(path),
+    ]
+    proc = subprocess.run(cmd, capture_output=True, timeout=_FFPROBE_TIMEOUT_SEC, check=True)
+    info = json.loads(proc.stdout or b"{}")
+    streams = info.get("streams") or []
+    if not streams:
+        raise RuntimeError(f"ffprobe: видеопоток не найден в {path}")
+    return {"stream": streams[0], "format": info.get("format") or {}}
+
+
+def _select_expr(target_ts: List[float]) -> str:
+    """Выражение select: первый кадр с t >= T для каждой цели T (как линейный проход PyAV)."""
+    terms = [f"gte(t,{t:.6f})*not(gte(prev_t,{t:.6f}))" for t in target_ts]
+    return "+".join(terms)
+
+
+class _FFmpegWatchdog(threading.Thread):
+    """Убивает ffmpeg при общем таймауте, зависании без кадров или отмене анализа."""
+
+    def __init__(self, proc: subprocess.Popen, timeout_sec: float, stall_sec: float, cancel_event):
+        super().__init__(name="ffmpeg-watchdog", daemon=True)
+        self.proc = proc
+        self.deadline = time.monotonic() + timeout_sec
+        self.stall_sec = stall_sec
+        self.cancel_event = cancel_event
+        self.last_progress = time.monotonic()
+        self.reason: Optional[str] = None
+        self._done = threading.Event()
+
+    def progress(self) -> None:
+        self.last_progress = time.monotonic()
+
+    def run(self) -> None:
+        while not self._done.wait(0.2):
+            now = time.monotonic()
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                self.reason = "cancelled"
+            elif now >= self.deadline:
+                self.reason = "таймаут ffmpeg"
+            elif now - self.last_progress >= self.stall_sec:
+                self.reason = f"ffmpeg не выдаёт кадры {self.stall_sec:.0f} с"
+            if self.reason is not None:
+                self.proc.kill()
+                return
+
+    def stop(self) -> None:
+        self._done.set()
+
+
+def _open_ffmpeg_pipe(
+    path: Path,
+    max_side: int,
+    cancel_event: Optional[threading.Event] = None,
+    timeout_sec: float = FFMPEG_TIMEOUT_SEC,
+    stall_sec: float = FFMPEG_STALL_TIMEOUT_SEC,
+) -> OpenedVideo:
+    """
+    Последний запасной путь: ffmpeg сам выбирает кадры для целевых моментов
+    (фильтр select), уменьшает их до max_side и отдаёт rawvideo rgb24 в pipe,
+    который читается прямо в массивы — без промежуточного файла.
+    Номера кадров берутся из pts_time фильтра showinfo (stderr).
+    """
+    probe = _ffprobe_video(path)
+    stream, fmt = probe["stream"], probe["format"]
+
+    width, height = int(stream.get("width") or 0), int(stream.get("height") or 0)
+    if width <= 0 or height <= 0:
+        raise RuntimeError(f"ffprobe: неизвестный размер кадра {width}x{height}")
+    fps = _parse_rate(stream.get("avg_frame_rate")) or _parse_rate(stream.get("r_frame_rate"))
+    total_frames = int(stream.get("nb_frames") or 0) if str(stream.get("nb_frames", "")).isdigit() else 0
+    try:
+        duration_sec = float(stream.get("duration") or fmt.get("duration") or 0.0)
+    except ValueError:
+        duration_sec = 0.0
+    if duration_sec <= 0.0 and total_frames > 0 and fps > 0.0:
+        duration_sec = total_frames / fps
+    if duration_sec <= 0.0:
+        duration_sec = 10.0
+
+    n_samples = _pick_num_samples(duration_sec)
+    target_ts = [duration_sec * (k + 0.5) / n_samples for k in range(n_samples)]
+    meta = VideoMeta(duration_sec=float(duration_sec), fps=float(fps), total_frames=int(total_frames))
 
+    new_w, new_h = _resize_keep_aspect(width, height, max_side)
+    frame_bytes = new_w * new_h * 3
     cmd = [
-        "ffmpeg", "-y",
-        "-i", str(src),
-        "-c:v", "libx264",
-        "-pix_fmt", "yuv420p",
-        "-movflags", "+faststart",
-        str(dst),
+        "ffmpeg", "-hide_banner", "-nostdin", "-nostats", "-loglevel", "info",
+        # Размеры из ffprobe и кадры PyAV/OpenCV — без учёта поворота из метаданных.
+        "-noautorotate",
+        "-i", str(path),
+        "-map", "0:v:0",
+        "-vf", f"select='{_select_expr(target_ts)}',showinfo,scale={new_w}:{new_h}:flags=area",
+        "-vsync", "passthrough",
+        "-frames:v", str(n_samples),
+        "-f", "rawvideo", "-pix_fmt", "rgb24",
+        "pipe:1",
     ]
+    logger.info(f"FFmpeg pipe: {n_samples} кадров {new_w}x{new_h} из {path}")
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    times: "queue.Queue[Optional[float]]" = queue.Queue()
+    stderr_tail: List[str] = []
+
+    def read_stderr() -> None:
+        for raw in iter(proc.stderr.readline, b""):
+            line = raw.decode("utf-8", "replace")
+            m = _SHOWINFO_PTS.search(line)
+            if m:
+                times.put(float(m.group(1)))
+            else:
+                stderr_tail.append(line.rstrip())
+                del stderr_tail[:-20]
+        times.put(None)
+
+    stderr_thread = threading.Thread(target=read_stderr, name="ffmpeg-stderr", daemon=True)
+    stderr_thread.start()
+    watchdog = _FFmpegWatchdog(proc, timeout_sec, stall_sec, cancel_event)
+    watchdog.start()
+
+    use_times = True
+
+    def next_time() -> Optional[float]:
+        nonlocal use_times
+        if not use_times:
+            return None
+        try:
+            # showinfo пишет строку до того, как кадр попадёт в pipe, так что ждать долго не нужно.
+            t = times.get(timeout=5.0)
+        except queue.Empty:
+            t = None
+        if t is None:
+            logger.warning("ffmpeg pipe: нет pts_time от showinfo, кадры сопоставляются с целями по порядку.")
+            use_times = False
+        return t
+
+    def frames() -> Iterator[IndexedFrame]:
+        sampled = 0
+        next_target = 0
+        try:
+            while next_target < n_samples:
+                frame = np.empty((new_h, new_w, 3), dtype=np.uint8)
+                view = memoryview(frame).cast("B")
+                got = 0
+                while got < frame_bytes:
+                    n = proc.stdout.readinto(view[got:])
+                    if not n:
+                        break
+                    got += n
+                    watchdog.progress()
+                if got < frame_bytes:
+                    break
+                check_cancelled(cancel_event)
+
+                t = next_time()
+                # Кадр закрывает все цели до его времени; без pts_time — по одной цели на кадр.
+                covered = [next_target] if t is None else [
+                    k for k in range(next_target, n_samples) if target_ts[k] <= t + 1e-6
+                ] or [next_target]
+                for k in covered:
+                    sampled += 1
+                    yield k, frame
+                next_target = covered[-1] + 1
+        finally:
+            watchdog.stop()
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            try:
+                proc.wait(timeout=5.0)
+            except subprocess.TimeoutExpired:
+                logger.warning("ffmpeg не завершился после kill")
+            stderr_thread.join(timeout=5.0)
+            proc.stderr.close()
+
+        if watchdog.reason == "cancelled":
+            check_cancelled(cancel_event)
+        if watchdog.reason is not None:
+            raise TimeoutError(f"ffmpeg остановлен: {watchdog.reason}")
+        if sampled == 0 and proc.returncode:
+            raise RuntimeError(f"ffmpeg завершился с кодом {proc.returncode}: {' | '.join(stderr_tail[-3:])}")
+        logger.info(f"Video meta (ffmpeg pipe): {meta}, sampled_frames={sampled}")
+
+    return OpenedVideo(meta, n_samples, frames())
+
+
+class _StreamError:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+_END = object()
+
+# (номер целевого кадра в равномерной выборке, кадр)
+# Кадр — RGB-массив HxWx3 uint8.
+Frame = np.ndarray
+IndexedFrame = Tuple[int, Frame]
+
+
+@dataclass
+class OpenedVideo:
+    meta: VideoMeta
+    expected_frames: int
+    frames: Iterator[IndexedFrame]
+    keyframes_only: bool = False
+
+
+def coarse_to_fine_order(n: int) -> List[int]:
+    """Порядок обхода n целей «от грубого к точному»: бит-реверсная (van der Corput) перестановка."""
+    if n <= 1:
+        return list(range(n))
+    bits = (n - 1).bit_length()
+    order = []
+    for i in range(1 << bits):
+        r = int(f"{i:0{bits}b}"[::-1], 2)
+        if r < n:
+            order.append(r)
+    return order
+
+
+class FrameStream:
+    """
+    Декодирование видео в отдельном потоке с ограниченной очередью кадров.
+    Потребитель забирает кадры (или батчи) по мере готовности, поэтому
+    декодирование и инференс перекрываются, а память ограничена глубиной очереди.
+    """
+
+    def __init__(self, opened: OpenedVideo, queue_depth: int = 32):
+        self.meta = opened.meta
+        self.expected_frames = opened.expected_frames
+        self.keyframes_only = opened.keyframes_only
+        self._frames = opened.frames
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, queue_depth))
+        self._stop = threading.Event()
+        # Поток декодера наследует контекст, чтобы его спаны попали в Trace запроса.
+        context = contextvars.copy_context()
+        self._thread = threading.Thread(target=context.run, args=(self._produce,), name="video-decoder", daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
 
-    logger.info(f"FFmpeg transcode: {' '.join(cmd)}")
+    def _produce(self) -> None:
+        try:
+            while True:
+                with tracing.span("video.decode") as span:
+                    frame = next(self._frames, _END)
+                    if frame is not _END:
+                        span.add_items(1)
+                if frame is _END:
+                    break
+                if not self._put(frame):
+                    return
+        except BaseException as e:
+            self._put(_StreamError(e))
+            return
+        finally:
+            close = getattr(self._frames, "close", None)
+            if close is not None:
+                close()
+        self._put(_END)
+
+    def __iter__(self) -> Iterator[Frame]:
+        for _, frame in self.iter_indexed():
+            yield frame
+
+    def iter_indexed(self) -> Iterator[IndexedFrame]:
+        """Кадры вместе с номером в равномерной выборке (важно при order="coarse_to_fine")."""
+        while True:
+            try:
+                item = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if not self._thread.is_alive() and self._queue.empty():
+                    return
+                continue
+            if item is _END:
+                return
+            if isinstance(item, _StreamError):
+                raise item.exc
+            yield item
+
+    def batches(self, batch_size: int) -> Iterator[List[Frame]]:
+        for batch in self.indexed_batches(batch_size):
+            yield [frame for _, frame in batch]
+
+    def indexed_batches(self, batch_size: int) -> Iterator[List[IndexedFrame]]:
+        batch: List[IndexedFrame] = []
+        for item in self.iter_indexed():
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self) -> "FrameStream":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _prime(opened: OpenedVideo) -> OpenedVideo:
+    """Декодировать первый кадр сразу, чтобы ошибки бэкенда всплыли до запуска потока."""
     try:
-        subprocess.run(cmd, check=True, capture_output=True)
-    except Exception as e:
-        logger.error(f"FFmpeg transcode failed: {e}")
-        raise
+        first = next(opened.frames)
+    except StopIteration:
+        opened.frames = iter(())
+        return opened
+    opened.frames = _chain_first(first, opened.frames)
+    return opened
 
-    return dst
 
+def _chain_first(first: IndexedFrame, frames: Iterator[IndexedFrame]) -> Iterator[IndexedFrame]:
+    try:
+        yield first
+        yield from frames
+    finally:
+        frames.close()
 
-def read_video_uniform_frames(
-    path: Path,
-    max_side: int = 768,
-    prefer_pyav: bool = True,
-    allow_ffmpeg_fallback: bool = True,
-) -> Tuple[List[PILImage.Image], VideoMeta]:
 
+def _open_first_available(
+    path: Path,
+    max_side: int,
+    prefer_pyav: bool,
+    cancel_event: Optional[threading.Event],
+    sampling: str = "auto",
+    keyframes_only: bool = False,
+    order: str = "temporal",
+) -> OpenedVideo:
     if prefer_pyav:
         try:
-            return _read_with_pyav(path, max_side=max_side)
+            return _prime(_open_pyav(
+                path,
+                max_side=max_side,
+                cancel_event=cancel_event,
+                sampling=sampling,
+                keyframes_only=keyframes_only,
+                order=order,
+            ))
+        except AnalysisCancelled:
+            raise
         except Exception as e:
             logger.warning(f"PyAV read failed, fallback to OpenCV. Reason: {e}")
 
+    if keyframes_only:
+        logger.warning("OpenCV не умеет пропускать не-ключевые кадры: triage-режим отключён.")
+    return _prime(_open_opencv(path, max_side=max_side, cancel_event=cancel_event, order=order, sampling=sampling))
+
+
+def _open_with_fallbacks(
+    path: Path,
+    max_side: int,
+    prefer_pyav: bool,
+    allow_ffmpeg_fallback: bool,
+    cancel_event: Optional[threading.Event],
+    sampling: str,
+    keyframes_only: bool,
+    order: str,
+) -> OpenedVideo:
     try:
-        return _read_with_opencv(path, max_side=max_side)
+        opened = _open_first_available(
+            path, max_side, prefer_pyav, cancel_event, sampling, keyframes_only, order
+        )
+    except AnalysisCancelled:
+        raise
     except Exception as e:
-        logger.warning(f"OpenCV read failed. Reason: {e}")
+        if not allow_ffmpeg_fallback:
+            raise RuntimeError("Unable to decode video with available backends.") from e
+        logger.warning(f"OpenCV read failed, fallback to ffmpeg pipe. Reason: {e}")
+        check_cancelled(cancel_event)
+        if keyframes_only:
+            logger.warning("ffmpeg pipe не поддерживает triage: берётся полная выборка.")
+        if order != "temporal":
+            logger.warning("ffmpeg pipe отдаёт кадры только по порядку времени.")
+        try:
+            opened = _prime(_open_ffmpeg_pipe(path, max_side, cancel_event=cancel_event))
+        except AnalysisCancelled:
+            raise
+        except Exception as ffmpeg_error:
+            raise RuntimeError("Unable to decode video with available backends.") from ffmpeg_error
+    return opened
 
-    if allow_ffmpeg_fallback:
-        normalized = _run_ffmpeg_transcode_to_mp4(path)
-        if prefer_pyav:
-            try:
-                return _read_with_pyav(normalized, max_side=max_side)
-            except Exception as e:
-                logger.warning(f"PyAV read after ffmpeg failed. Reason: {e}")
-        return _read_with_opencv(normalized, max_side=max_side)
 
-    raise RuntimeError("Unable to decode video with available backends.")
+def open_video_stream(
+    path: Path,
+    max_side: int = 768,
+    prefer_pyav: bool = True,
+    allow_ffmpeg_fallback: bool = True,
+    cancel_event: Optional[threading.Event] = None,
+    queue_depth: int = 32,
+    sampling: str = "auto",
+    keyframes_only: bool = False,
+    order: str = "temporal",
+    frame_cache: Optional["FrameCache"] = None,
+) -> FrameStream:
+    """
+    sampling управляет стратегией PyAV и OpenCV: "auto", "seek" или "linear".
+    keyframes_only — быстрый triage: декодируются только ключевые кадры
+    (проверить, включился ли режим, можно по stream.keyframes_only).
+    order="coarse_to_fine" отдаёт кадры в порядке coarse_to_fine_order
+    (номера кадров — через stream.iter_indexed()).
+    frame_cache — кэш кадров выборки: при попадании видео не декодируется,
+    при промахе полная выборка сохраняется по ходу декодирования.
+    """
+    cache_key = None
+    if frame_cache is not None:
+        with tracing.span("video.frame_cache_open"):
+            cache_key = frame_cache.key_for(path, max_side, sampling, keyframes_only)
+            cached = frame_cache.open(cache_key, order=order, cancel_event=cancel_event) if cache_key else None
+        if cached is not None:
+            return FrameStream(cached, queue_depth=queue_depth)
+
+    with tracing.span("video.open"):
+        opened = _open_with_fallbacks(
+            path, max_side, prefer_pyav, allow_ffmpeg_fallback, cancel_event, sampling, keyframes_only, order
+        )
+
+    if cache_key is not None:
+        opened = frame_cache.record(cache_key, opened)
+    return FrameStream(opened, queue_depth=queue_depth)
+
+
+def read_video_uniform_frames(
+    path: Path,
+    max_side: int = 768,
+    prefer_pyav: bool = True,
+    allow_ffmpeg_fallback: bool = True,
+    cancel_event: Optional[threading.Event] = None,
+    sampling: str = "auto",
+    keyframes_only: bool = False,
+) -> Tuple[List[Frame], VideoMeta]:
+    with open_video_stream(
+        path,
+        max_side=max_side,
+        prefer_pyav=prefer_pyav,
+        allow_ffmpeg_fallback=allow_ffmpeg_fallback,
+        cancel_event=cancel_event,
+        sampling=sampling,
+        keyframes_only=keyframes_only,
+    ) as stream:
+        return list(stream), stream.meta
 
 
 def _resize_keep_aspect(w: int, h: int, max_side: int) -> Tuple[int, int]:
@@ -98,7 +541,66 @@ def _resize_keep_aspect(w: int, h: int, max_side: int) -> Tuple[int, int]:
     return int(round(w * scale)), int(round(h * scale))
 
 
-def _read_with_opencv(path: Path, max_side: int) -> Tuple[List[PILImage.Image], VideoMeta]:
+def _read_with_opencv(
+    path: Path,
+    max_side: int,
+    cancel_event: Optional[threading.Event] = None,
+    sampling: str = "auto",
+) -> Tuple[List[Frame], VideoMeta]:
+    opened = _open_opencv(path, max_side, cancel_event=cancel_event, sampling=sampling)
+    return [frame for _, frame in opened.frames], opened.meta
+
+
+# keyint по умолчанию у x264: оценка GOP, когда индекс ключевых кадров недоступен.
+_DEFAULT_GOP_FRAMES = 250
+
+
+def _opencv_frame_count_ok(path: Path, total_frames: int) -> bool:
+    """
+    Дёшево проверить CAP_PROP_FRAME_COUNT: кадр total-1 должен читаться, а
+    следующий за ним — нет. Контейнеры без индекса и битые файлы часто врут.
+    """
+    import cv2
+
+    if total_frames <= 0:
+        return False
+    cap = cv2.VideoCapture(str(path))
+    try:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, total_frames - 1)
+        return bool(cap.grab()) and not cap.grab()
+    except cv2.error:
+        return False
+    finally:
+        cap.release()
+
+
+def _choose_opencv_sampling(path: Path, fps: float, total_frames: int, n_samples: int) -> str:
+    """
+    Линейный grab() декодирует весь промежуток между целями. Seek в OpenCV
+    сбрасывает декодер и идёт от предыдущего ключевого кадра — на практике
+    порядка целого GOP на цель, поэтому seek выбирается при шаге больше 2 GOP.
+    """
+    gop_sec = _safe_keyframe_interval(path)
+    gop_frames = gop_sec * fps if gop_sec and fps > 0 else float(_DEFAULT_GOP_FRAMES)
+    spacing = total_frames / max(n_samples, 1)
+    mode = "seek" if spacing > 2 * gop_frames else "linear"
+    logger.info(f"OpenCV sampling: {mode} (GOP≈{gop_frames:.0f} кадров, шаг выборки {spacing:.1f} кадров)")
+    return mode
+
+
+def _open_opencv(
+    path: Path,
+    max_side: int,
+    cancel_event: Optional[threading.Event] = None,
+    order: str = "temporal",
+    sampling: str = "auto",
+) -> OpenedVideo:
+    """
+    sampling: "seek" — CAP_PROP_POS_FRAMES перед каждой целью, "linear" — проход
+    grab() с retrieve() только целевых кадров, "auto" — выбор по GOP.
+    Если число кадров из контейнера не подтверждается, поток читается целиком
+    через прореживаемый резервуар и выборка строится по фактическому числу кадров.
+    """
     import cv2
 
     cap = cv2.VideoCapture(str(path))
@@ -114,85 +616,354 @@ def _read_with_opencv(path: Path, max_side: int) -> Tuple[List[PILImage.Image],
     if duration_sec <= 0:
         duration_sec = max(1.0, total_frames / max(fps, 1.0))
 
-    n_samples = min(_pick_num_samples(duration_sec), max(total_frames, 1))
+    count_ok = _opencv_frame_count_ok(path, total_frames)
+    if not count_ok:
+        logger.warning(f"OpenCV: число кадров ({total_frames}) не подтвердилось, выборка по полному проходу.")
+        n_samples = _pick_num_samples(duration_sec)
+        sampling = "reservoir"
+    else:
+        n_samples = min(_pick_num_samples(duration_sec), total_frames)
+        if sampling == "auto":
+            sampling = "seek" if order == "coarse_to_fine" else _choose_opencv_sampling(
+                path, fps, total_frames, n_samples
+            )
     idxs = _uniform_indices(total_frames, n_samples)
 
-    frames: List[PILImage.Image] = []
     w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
     h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
     new_w, new_h = _resize_keep_aspect(w, h, max_side) if w and h else (0, 0)
 
-    for i in idxs:
-        cap.set(cv2.CAP_PROP_POS_FRAMES, int(i))
-        ok, bgr = cap.read()
-        if not ok or bgr is None:
-            continue
-        if new_w and new_h and (new_w != bgr.shape[1] or new_h != bgr.shape[0]):
+    meta = VideoMeta(duration_sec=float(duration_sec), fps=float(fps), total_frames=int(total_frames))
+
+    def to_rgb(bgr: np.ndarray) -> Frame:
+        nonlocal new_w, new_h
+        if not (new_w and new_h):
+            new_w, new_h = _resize_keep_aspect(bgr.shape[1], bgr.shape[0], max_side)
+        if new_w != bgr.shape[1] or new_h != bgr.shape[0]:
             bgr = cv2.resize(bgr, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+    def seek_frames() -> Iterator[IndexedFrame]:
+        visit = coarse_to_fine_order(len(idxs)) if order == "coarse_to_fine" else range(len(idxs))
+        for k in visit:
+            check_cancelled(cancel_event)
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(idxs[k]))
+            ok, bgr = cap.read()
+            if ok and bgr is not None:
+                yield k, to_rgb(bgr)
+
+    def linear_frames() -> Iterator[IndexedFrame]:
+        # grab() только декодирует; конвертация и копирование — лишь для целевых кадров.
+        i = 0
+        k = 0
+        while k < len(idxs):
+            check_cancelled(cancel_event)
+            if not cap.grab():
+                break
+            if i == idxs[k]:
+                ok, bgr = cap.retrieve()
+                if ok and bgr is not None:
+                    yield k, to_rgb(bgr)
+                k += 1
+            i += 1
+
+    def reservoir_frames() -> Iterator[IndexedFrame]:
+        # Храним кадры с шагом stride; при 2n кадрах отбрасываем каждый второй и удваиваем шаг,
+        # так что память ограничена 2n кадрами при любой длине потока.
+        stride = 1
+        kept: List[IndexedFrame] = []
+        i = 0
+        while True:
+            check_cancelled(cancel_event)
+            if not cap.grab():
+                break
+            if i % stride == 0:
+                ok, bgr = cap.retrieve()
+                if ok and bgr is not None:
+                    kept.append((i, to_rgb(bgr)))
+                if len(kept) >= 2 * n_samples:
+                    kept = kept[::2]
+                    stride *= 2
+            i += 1
+        if not kept:
+            return
+        logger.info(f"OpenCV: фактически {i} кадров (контейнер сообщал {total_frames})")
+        positions = [pos for pos, _ in kept]
+        for k, target in enumerate(_uniform_indices(i, n_samples)):
+            j = min(bisect.bisect_left(positions, target), len(kept) - 1)
+            if j > 0 and target - positions[j - 1] < positions[j] - target:
+                j -= 1
+            yield k, kept[j][1]
+
+    strategies = {"seek": seek_frames, "linear": linear_frames, "reservoir": reservoir_frames}
+    if sampling not in strategies:
+        raise ValueError(f"Неизвестная стратегия выборки OpenCV: {sampling}")
+    if order == "coarse_to_fine" and sampling != "seek":
+        logger.info(f"OpenCV {sampling}: кадры отдаются по порядку времени, а не coarse_to_fine.")
+
+    def frames() -> Iterator[IndexedFrame]:
+        sampled = 0
+        try:
+            for item in strategies[sampling]():
+                sampled += 1
+                yield item
+        finally:
+            cap.release()
+        logger.info(f"Video meta (OpenCV, {sampling}): {meta}, sampled_frames={sampled}")
 
-        rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
-        frames.append(PILImage.fromarray(rgb))
+    return OpenedVideo(meta, n_samples, frames())
 
-    cap.release()
 
-    meta = VideoMeta(duration_sec=float(duration_sec), fps=float(fps), total_frames=int(total_frames))
-    logger.info(f"Video meta (OpenCV): {meta}, sampled_frames={len(frames)}")
-    return frames, meta
+def _read_with_pyav(
+    path: Path,
+    max_side: int,
+    cancel_event: Optional[threading.Event] = None,
+    sampling: str = "auto",
+) -> Tuple[List[Frame], VideoMeta]:
+    opened = _open_pyav(path, max_side, cancel_event=cancel_event, sampling=sampling)
+    return [frame for _, frame in opened.frames], opened.meta
+
+
+def _frame_time(frame) -> Optional[float]:
+    if frame.pts is None or frame.time_base is None:
+        return None
+    return float(frame.pts * frame.time_base)
 
 
-def _read_with_pyav(path: Path, max_side: int) -> Tuple[List[PILImage.Image], VideoMeta]:
+def _pyav_frame_to_array(frame, max_side: int) -> Frame:
+    # Масштабирование и перевод в RGB за один проход libswscale, без PIL.resize.
+    new_w, new_h = _resize_keep_aspect(frame.width, frame.height, max_side)
+    return frame.reformat(width=new_w, height=new_h, format="rgb24", interpolation="AREA").to_ndarray()
+
+
+def _probe_keyframe_interval(path: Path, max_packets: int = 600) -> Optional[float]:
+    """Оценить расстояние между ключевыми кадрами (сек) по пакетам в начале потока, без декодирования."""
     import av
 
-    container = av.open(str(path))
-    stream = next((s for s in container.streams if s.type == "video"), None)
-    if stream is None:
-        raise RuntimeError("No video stream found.")
+    with av.open(str(path)) as container:
+        stream = next((s for s in container.streams if s.type == "video"), None)
+        if stream is None or stream.time_base is None:
+            return None
+
+        key_ts: List[float] = []
+        last_ts: Optional[float] = None
+        for i, packet in enumerate(container.demux(stream)):
+            if i >= max_packets:
+                break
+            if packet.pts is None:
+                continue
+            t = float(packet.pts * stream.time_base)
+            last_ts = t if last_ts is None else max(last_ts, t)
+            if packet.is_keyframe:
+                key_ts.append(t)
+
+    if len(key_ts) >= 2:
+        return (key_ts[-1] - key_ts[0]) / (len(key_ts) - 1)
+    if key_ts and last_ts is not None:
+        # Второй ключевой кадр не встретился — интервал не меньше просмотренного отрезка.
+        return max(last_ts - key_ts[0], 0.0)
+    return None
+
+
+def _keyframe_timestamps(path: Path) -> List[float]:
+    """Времена всех ключевых кадров по индексу пакетов (демультиплексирование без декодирования)."""
+    import av
 
-    fps = float(stream.average_rate) if stream.average_rate is not None else 0.0
-    if stream.duration is not None and stream.time_base is not None:
-        duration_sec = float(stream.duration * stream.time_base)
-    else:
-        duration_sec = 0.0
+    with av.open(str(path)) as container:
+        stream = next((s for s in container.streams if s.type == "video"), None)
+        if stream is None or stream.time_base is None:
+            return []
+        key_ts = [
+            float(packet.pts * stream.time_base)
+            for packet in container.demux(stream)
+            if packet.is_keyframe and packet.pts is not None
+        ]
+    return sorted(key_ts)
 
-    total_frames = int(stream.frames) if stream.frames else 0
-    if duration_sec <= 0.0 and total_frames > 0 and fps > 0.0:
-        duration_sec = total_frames / fps
-    if duration_sec <= 0.0:
-        duration_sec = 10.0
 
-    n_samples = _pick_num_samples(duration_sec)
+def _safe_keyframe_interval(path: Path) -> Optional[float]:
+    try:
+        return _probe_keyframe_interval(path)
+    except Exception as e:
+        logger.warning(f"Не удалось оценить GOP: {e}")
+        return None
 
-    target_ts = [duration_sec * (k + 0.5) / n_samples for k in range(n_samples)]
 
-    frames: List[PILImage.Image] = []
-    next_target_i = 0
+def _choose_pyav_sampling(path: Path, duration_sec: float, n_samples: int) -> Tuple[str, Optional[float]]:
+    gop_sec = _safe_keyframe_interval(path)
 
-    for frame in container.decode(video=0):
+    if gop_sec is None or gop_sec <= 0.0:
+        return "linear", gop_sec
+
+    # Seek декодирует в среднем полGOPа на кадр, линейный проход — весь промежуток между целями.
+    spacing_sec = duration_sec / max(n_samples, 1)
+    mode = "seek" if spacing_sec > gop_sec else "linear"
+    logger.info(f"PyAV sampling: {mode} (GOP≈{gop_sec:.2f}s, шаг выборки {spacing_sec:.2f}s)")
+    return mode, gop_sec
+
+
+def _pyav_linear_frames(container, stream, target_ts: List[float], max_side: int, cancel_event) -> Iterator[IndexedFrame]:
+    next_target_i = 0
+    for frame in container.decode(stream):
+        check_cancelled(cancel_event)
         if next_target_i >= len(target_ts):
             break
-        if frame.pts is not None and frame.time_base is not None:
-            t = float(frame.pts * frame.time_base)
-        else:
-            t = None
+        t = _frame_time(frame)
         if t is None:
             continue
         if t < target_ts[next_target_i]:
             continue
 
-        img = frame.to_image()
-        w, h = img.size
-        new_w, new_h = _resize_keep_aspect(w, h, max_side)
-        if (new_w, new_h) != (w, h):
-            img = img.resize((new_w, new_h))
-        frames.append(img)
-
         next_target_i += 1
+        yield next_target_i - 1, _pyav_frame_to_array(frame, max_side)
+
+
+def _pyav_seek_frames(
+    container,
+    stream,
+    target_ts: List[float],
+    max_side: int,
+    cancel_event,
+    gop_sec: float,
+    visit: Optional[List[int]] = None,
+) -> Iterator[IndexedFrame]:
+    decoder = None
+    last_t = float("-inf")
+
+    for k in (visit if visit is not None else range(len(target_ts))):
+        target = target_ts[k]
+        check_cancelled(cancel_event)
+
+        # Если цель впереди в пределах текущего GOP, дешевле докрутить вперёд, чем искать заново.
+        if decoder is None or target <= last_t or target - last_t > gop_sec:
+            container.seek(int(round(target / stream.time_base)), stream=stream, backward=True, any_frame=False)
+            decoder = container.decode(stream)
+
+        for frame in decoder:
+            check_cancelled(cancel_event)
+            t = _frame_time(frame)
+            if t is None:
+                continue
+            last_t = t
+            if t >= target:
+                yield k, _pyav_frame_to_array(frame, max_side)
+                break
+        else:
+            # Поток кончился раньше цели; следующая цель начнёт с нового seek.
+            decoder = None
 
-    container.close()
+
+def _open_pyav(
+    path: Path,
+    max_side: int,
+    cancel_event: Optional[threading.Event] = None,
+    sampling: str = "auto",
+    keyframes_only: bool = False,
+    order: str = "temporal",
+) -> OpenedVideo:
+    """
+    sampling: "linear" — декодировать поток подряд, "seek" — прыгать к ключевому
+    кадру перед каждой целью, "auto" — выбрать по GOP.
+    keyframes_only: декодер пропускает не-ключевые кадры (skip_frame="NONKEY"),
+    выборка равномерна среди ключевых кадров.
+    order: "temporal" или "coarse_to_fine" (требует seek).
+    """
+    import av
+
+    container = av.open(str(path))
+    try:
+        stream = next((s for s in container.streams if s.type == "video"), None)
+        if stream is None:
+            raise RuntimeError("No video stream found.")
+
+        fps = float(stream.average_rate) if stream.average_rate is not None else 0.0
+        if stream.duration is not None and stream.time_base is not None:
+            duration_sec = float(stream.duration * stream.time_base)
+        else:
+            duration_sec = 0.0
+
+        total_frames = int(stream.frames) if stream.frames else 0
+        if duration_sec <= 0.0 and total_frames > 0 and fps > 0.0:
+            duration_sec = total_frames / fps
+        if duration_sec <= 0.0:
+            duration_sec = 10.0
+    except Exception:
+        container.close()
+        raise
+
+    n_samples = _pick_num_samples(duration_sec)
+
+    target_ts = [duration_sec * (k + 0.5) / n_samples for k in range(n_samples)]
 
     meta = VideoMeta(duration_sec=float(duration_sec), fps=float(fps), total_frames=int(total_frames))
-    logger.info(f"Video meta (PyAV): {meta}, sampled_frames={len(frames)}")
-    return frames, meta
+
+    gop_sec: Optional[float] = None
+    if keyframes_only:
+        try:
+            key_ts = _keyframe_timestamps(path)
+        except Exception:
+            container.close()
+            raise
+        if key_ts:
+            picked = _uniform_indices(len(key_ts), min(n_samples, len(key_ts)))
+            target_ts = [key_ts[i] for i in sorted(set(picked))]
+            n_samples = len(target_ts)
+            # Если ключевых кадров немного, их дешевле декодировать подряд, чем искать каждый.
+            sampling = "linear" if len(key_ts) <= 2 * n_samples else "seek"
+            gop_sec = 0.0
+            stream.codec_context.skip_frame = "NONKEY"
+            logger.info(f"Triage: {n_samples} из {len(key_ts)} ключевых кадров ({sampling})")
+        else:
+            logger.warning("Ключевые кадры не найдены в индексе: triage-режим отключён.")
+            keyframes_only = False
+
+    visit: Optional[List[int]] = None
+    if order == "coarse_to_fine":
+        visit = coarse_to_fine_order(n_samples)
+        if sampling == "auto":
+            sampling, gop_sec = "seek", _safe_keyframe_interval(path)
+
+    if sampling == "auto":
+        sampling, gop_sec = _choose_pyav_sampling(path, duration_sec, n_samples)
+    if stream.time_base is None:
+        sampling = "linear"
+
+    def frames() -> Iterator[IndexedFrame]:
+        nonlocal container, stream, sampling
+        sampled = 0
+        try:
+            if sampling == "seek":
+                try:
+                    for item in _pyav_seek_frames(
+                        container, stream, target_ts, max_side, cancel_event,
+                        gop_sec=gop_sec if gop_sec is not None else 0.0,
+                        visit=visit,
+                    ):
+                        sampled += 1
+                        yield item
+                except AnalysisCancelled:
+                    raise
+                except Exception as e:
+                    if sampled:
+                        raise
+                    # Поток без индекса/не поддерживает seek — начинаем заново линейно.
+                    logger.warning(f"PyAV seek failed, fallback to linear decode. Reason: {e}")
+                    container.close()
+                    container = av.open(str(path))
+                    stream = next(s for s in container.streams if s.type == "video")
+                    if keyframes_only:
+                        stream.codec_context.skip_frame = "NONKEY"
+                    sampling = "linear"
+
+            if sampling == "linear":
+                for item in _pyav_linear_frames(container, stream, target_ts, max_side, cancel_event):
+                    sampled += 1
+                    yield item
+        finally:
+            container.close()
+        logger.info(f"Video meta (PyAV, {sampling}): {meta}, sampled_frames={sampled}")
+
+    return OpenedVideo(meta, n_samples, frames(), keyframes_only=keyframes_only)
 
 
 def _uniform_indices(total_frames: int, n_samples: int) -> List[int]:
@@ -0,0 +1,195 @@
+"""
+Кэш признаков backbone и пересчёт корпуса новыми головами без прогона ViT.
+
+    python -m app.features extract /data/ingest --store features/
+    python -m app.features rescore --store features/ --head new_head.safetensors \\
+        --head models/.../checkpoint-700 --out rescored.jsonl
+
+extract сохраняет pooled-признаки изображений и кадров видео (выборка та же,
+что у predict_video) и пропускает файлы, чьи признаки уже есть. rescore читает
+шарды через memory-map и считает вероятности всех голов одним matmul на шард.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from app.scan import iter_media_paths
+from app.services.logger import logger
+
+
+def run_extract(
+    targets: List[str],
+    store_root: Path,
+    batch_size: Optional[int] = None,
+    image_chunk: int = 64,
+    max_side: int = 768,
+    precision: Optional[str] = None,
+) -> int:
+    import numpy as np
+    from PIL import Image as PILImage
+
+    from app.config.settings import AUTOTUNE_PATH
+    from app.core.autotune import apply_tuned
+    from app.core.cache import file_content_hash
+    from app.core.feature_store import FeatureStore, StoredMedia
+    from app.core.inference import DeepfakeClassifier
+    from app.core.video import is_video_path, open_video_stream
+
+    classifier = DeepfakeClassifier(precision=precision)
+    if batch_size is None:
+        apply_tuned(classifier, AUTOTUNE_PATH)
+        batch_size = classifier.batch_size
+    store = FeatureStore.for_classifier(store_root, classifier)
+    logger.info(f"Хранилище признаков: {store.dir}")
+
+    pending: List[tuple] = []
+
+    def flush_images() -> None:
+        if not pending:
+            return
+        feats = classifier.extract_features([img for _, _, img in pending], batch_size=batch_size)
+        for (path, content_hash, _), row in zip(pending, feats):
+            store.add(StoredMedia(content_hash, path, "image", 0), [content_hash], row[None])
+        pending.clear()
+
+    added = 0
+    started = time.perf_counter()
+    try:
+        for path in iter_media_paths(targets):
+            try:
+                content_hash = file_content_hash(path)
+            except OSError as e:
+                logger.warning(f"Не удалось прочитать {path}: {e}")
+                continue
+            if store.has_media(content_hash):
+                continue
+
+            try:
+                if is_video_path(path):
+                    keys, frames = [], []
+                    with open_video_stream(path, max_side=max_side) as stream:
+                        for batch in stream.indexed_batches(batch_size):
+                            keys.extend(FeatureStore.frame_key(content_hash, k) for k, _ in batch)
+                            frames.append(classifier.extract_features([f for _, f in batch], batch_size=batch_size))
+                    if frames:
+                        store.add(StoredMedia(content_hash, str(path), "video", len(keys)), keys, np.concatenate(frames))
+                else:
+                    with PILImage.open(path) as img:
+                        img.load()
+                        pending.append((str(path), content_hash, img.copy()))
+                    if len(pending) >= image_chunk:
+                        flush_images()
+            except Exception as e:
+                logger.error(f"Ошибка извлечения признаков {path}: {e}")
+                continue
+            added += 1
+        flush_images()
+    finally:
+        store.close()
+
+    logger.info(f"Признаки извлечены: {added} файлов за {time.perf_counter() - started:.1f} с")
+    return added
+
+
+def run_rescore(
+    store_root: Path,
+    heads: List[str],
+    out_path: Optional[Path] = None,
+    store_key: Optional[str] = None,
+    threshold: float = 0.5,
+    agg_method: str = "median_of_means",
+) -> int:
+    from app.core.feature_store import FeatureStore, list_stores, rescore
+
+    keys = list_stores(store_root)
+    if store_key is None:
+        if len(keys) != 1:
+            raise SystemExit(f"В {store_root} хранилищ: {len(keys)} ({', '.join(keys) or '-'}); укажите --backbone")
+        store_key = keys[0]
+    elif store_key not in keys:
+        raise SystemExit(f"Хранилище {store_key} не найдено в {store_root}")
+
+    store = FeatureStore(store_root, store_key)
+    try:
+        names, results = rescore(store, heads, agg_method=agg_method)
+    finally:
+        store.close()
+
+    out = open(out_path, "w", encoding="utf-8") if out_path is not None else sys.stdout
+    try:
+        for media, probs in results:
+            record = {
+                "path": media.path,
+                "type": media.kind,
+                "content_hash": media.content_hash,
+                "prob_deepfake": dict(zip(names, probs)),
+                "label": {n: ("deepfake" if p >= threshold else "real") for n, p in zip(names, probs)},
+            }
+            if media.kind == "video":
+                record["frames"] = media.frames
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return len(results)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from app.config.settings import FEATURE_STORE_DIR
+    from app.core.precision import PRECISION_MODES
+
+    parser = argparse.ArgumentParser(
+        prog="python -m app.features",
+        description="Кэш признаков SigLIP2 и пересчёт корпуса новыми головами.",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    extract = sub.add_parser("extract", help="Извлечь и сохранить признаки backbone.")
+    extract.add_argument("targets", nargs="+", help="Каталоги, glob-шаблоны или файлы.")
+    extract.add_argument("--store", type=Path, default=Path(FEATURE_STORE_DIR))
+    extract.add_argument("--batch-size", type=int, default=None,
+                         help="По умолчанию — из python -m app.tune, иначе 16.")
+    extract.add_argument("--image-chunk", type=int, default=64)
+    extract.add_argument("--max-side", type=int, default=768)
+    extract.add_argument("--precision", choices=PRECISION_MODES, default=None)
+
+    rescore = sub.add_parser("rescore", help="Посчитать вероятности новыми головами по сохранённым признакам.")
+    rescore.add_argument("--store", type=Path, default=Path(FEATURE_STORE_DIR))
+    rescore.add_argument("--backbone", default=None,
+                         help="Ключ хранилища, если в --store их несколько.")
+    rescore.add_argument("--head", action="append", required=True,
+                         help="Каталог чекпоинта или файл весов головы (norm.*, classifier.*); можно несколько.")
+    rescore.add_argument("--out", type=Path, default=None, help="JSONL (по умолчанию stdout).")
+    rescore.add_argument("--threshold", type=float, default=0.5)
+    rescore.add_argument("--agg", default="median_of_means",
+                         help="Агрегация кадров видео: median_of_means, mean, trimmed_mean.")
+    args = parser.parse_args(argv)
+    logger.info("=== Приложение запущено ===")
+
+    if args.command == "extract":
+        run_extract(
+            args.targets,
+            args.store,
+            batch_size=args.batch_size,
+            image_chunk=args.image_chunk,
+            max_side=args.max_side,
+            precision=args.precision,
+        )
+    else:
+        run_rescore(
+            args.store,
+            args.head,
+            out_path=args.out,
+            store_key=args.backbone,
+            threshold=args.threshold,
+            agg_method=args.agg,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,12 @@
-from app.ui.app import main
+import sys
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--startup-report" in sys.argv:
+        # Включается до импорта GUI, чтобы учесть время всех импортов.
+        from app.services.startup import startup_report
+
+        startup_report.enable()
+
+    from app.ui.app import main
+
+    main()
@@ -0,0 +1,543 @@
+"""
+Headless пакетное сканирование каталогов без GUI.
+
+    python -m app.scan /data/ingest "/mnt/extra/**/*.mp4" --out scan.jsonl --workers 4
+
+Каждый файл даёт одну JSONL-запись, записи пишутся по мере готовности.
+Выходной файл одновременно служит чекпоинтом: при повторном запуске с тем же
+``--out`` уже обработанные пути пропускаются.
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from app.core.dedup import DEFAULT_THRESHOLD as DEDUP_THRESHOLD
+from app.core.preprocess import is_image_path
+from app.core.video import is_video_path
+from app.services import tracing
+from app.services.logger import logger
+
+
+_classifier = None
+
+
+def _is_media_path(path: Path) -> bool:
+    return is_image_path(path) or is_video_path(path)
+
+
+def iter_media_paths(targets: Iterable[str]) -> Iterator[Path]:
+    """Обойти каталоги, glob-шаблоны и отдельные файлы, отдавая медиафайлы."""
+    for target in targets:
+        if os.path.isdir(target):
+            for root, dirs, files in os.walk(target):
+                dirs.sort()
+                for name in sorted(files):
+                    path = Path(root) / name
+                    if _is_media_path(path):
+                        yield path
+        elif glob.has_magic(target):
+            for name in sorted(glob.iglob(target, recursive=True)):
+                path = Path(name)
+                if path.is_file() and _is_media_path(path):
+                    yield path
+        elif os.path.isfile(target):
+            yield Path(target)
+        else:
+            logger.warning(f"Путь не найден: {target}")
+
+
+def load_checkpoint(out_path: Path, retry_errors: bool = False) -> Set[str]:
+    """Прочитать уже записанные результаты и вернуть множество готовых путей."""
+    done: Set[str] = set()
+    if not out_path.exists():
+        return done
+
+    with open(out_path, "rb+") as f:
+        data = f.read()
+        # Процесс мог быть убит посреди записи — отрезаем неполную строку.
+        if data and not data.endswith(b"\n"):
+            cut = data.rfind(b"\n") + 1
+            f.truncate(cut)
+            data = data[:cut]
+            logger.warning(f"Отброшена неполная запись в конце {out_path}")
+
+    for line in data.splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if retry_errors and "error" in record:
+            continue
+        done.add(record["path"])
+
+    return done
+
+
+def _init_worker(
+    num_threads: int,
+    cache_path: Optional[str],
+    cache_max_mb: float,
+    server_socket: Optional[str] = None,
+    precision: Optional[str] = None,
+    backend: str = "eager",
+    frame_cache_dir: Optional[str] = None,
+    frame_cache_max_mb: float = 4096.0,
+    trace: bool = False,
+    autotune_path: Optional[str] = None,
+    token_merge: Optional[float] = None,
+    cascade_side: Optional[int] = None,
+    cascade_band: float = 0.15,
+    heads: Optional[List[str]] = None,
+    combine: str = "mean",
+    head_weights: Optional[List[float]] = None,
+    threshold: float = 0.5,
+) -> None:
+    global _classifier
+
+    import torch
+
+    if trace:
+        tracing.enable()
+
+    from app.core.cache import ResultCache
+    from app.core.frame_cache import FrameCache
+
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    cache = ResultCache(cache_path, max_size_mb=cache_max_mb) if cache_path else None
+    frame_cache = FrameCache(frame_cache_dir, max_size_mb=frame_cache_max_mb) if frame_cache_dir else None
+
+    if server_socket:
+        # Модель живёт в app.server, воркер только декодирует и ресайзит.
+        from app.server.client import RemoteClassifier
+
+        _classifier = RemoteClassifier(server_socket, cache=cache, frame_cache=frame_cache)
+    elif heads is not None:
+        from app.core.ensemble import EnsembleClassifier
+
+        # Пустой список — все checkpoint-* из PROJECT_DIR.
+        _classifier = EnsembleClassifier(
+            ckpt_dirs=heads or None,
+            combine=combine,
+            weights=head_weights,
+            vote_threshold=threshold,
+            cache=cache,
+            precision=precision,
+            backend=backend,
+            frame_cache=frame_cache,
+            token_merge=token_merge,
+        )
+    else:
+        from app.core.inference import CascadeConfig, DeepfakeClassifier
+
+        _classifier = DeepfakeClassifier(
+            cache=cache,
+            precision=precision,
+            backend=backend,
+            frame_cache=frame_cache,
+            token_merge=token_merge,
+            cascade=CascadeConfig(cascade_side, cascade_band) if cascade_side else None,
+        )
+        if autotune_path:
+            from app.core.autotune import apply_tuned
+
+            # Потоки задаёт --threads: автотюнинг подбирал их для одного процесса на всю машину.
+            apply_tuned(_classifier, autotune_path, threads=False)
+
+
+# Результат задачи воркера: JSONL-записи и сводка трассировки (None, если выключена).
+TaskResult = Tuple[List[Dict], Optional[Dict]]
+
+
+def _scan_images(paths: List[str], threshold: float, batch_size: Optional[int]) -> TaskResult:
+    from PIL import Image as PILImage
+
+    from app.core.inference import PredictionResult
+
+    records: List[Dict] = []
+    images = []
+    loaded: List[str] = []
+    for p in paths:
+        try:
+            with PILImage.open(p) as img:
+                img.load()
+                images.append(img.copy())
+            loaded.append(p)
+        except Exception as e:
+            records.append({"path": p, "type": "image", "error": repr(e)})
+
+    if not loaded:
+        return records, None
+
+    per_head: Optional[List[Dict[str, float]]] = None
+    try:
+        with tracing.collect() as trace, _classifier.cascade_scope(threshold) as cascade:
+            if hasattr(_classifier, "predict_ensemble"):
+                # Ансамбль: кроме объединённой вероятности — вероятность каждой головы (без кэша результатов).
+                ensemble = _classifier.predict_ensemble(images, batch_size=batch_size)
+                probs = ensemble.combined_probs
+                per_head = [dict(zip(ensemble.head_names, row)) for row in ensemble.per_head_probs]
+            else:
+                probs = _classifier.predict_batch(
+                    images,
+                    batch_size=batch_size,
+                    sources=[Path(p) for p in loaded],
+                )
+        if cascade is not None and cascade.items:
+            logger.info(f"Каскад: полное разрешение для {cascade.escalated} из {cascade.items} изображений")
+    except Exception as e:
+        logger.error(f"Ошибка инференса батча изображений: {e}")
+        return records + [{"path": p, "type": "image", "error": repr(e)} for p in loaded], None
+
+    for i, (p, prob) in enumerate(zip(loaded, probs)):
+        label = "deepfake" if prob >= threshold else "real"
+        confidence = prob if label == "deepfake" else (1.0 - prob)
+        result = PredictionResult(label, prob, confidence)
+        records.append({"path": p, "type": "image", **asdict(result)})
+        if per_head is not None:
+            records[-1]["per_head_probs"] = per_head[i]
+    return records, trace.summary() if trace else None
+
+
+def _scan_video(
+    path: str,
+    threshold: float,
+    batch_size: Optional[int],
+    max_side: int,
+    triage: bool,
+    adaptive: bool,
+    dedup_threshold: Optional[float] = None,
+) -> TaskResult:
+    try:
+        result = _classifier.predict_video(
+            Path(path),
+            threshold=threshold,
+            batch_size=batch_size,
+            max_side=max_side,
+            triage=triage,
+            adaptive=adaptive,
+            dedup=dedup_threshold is not None,
+            dedup_threshold=dedup_threshold if dedup_threshold is not None else DEDUP_THRESHOLD,
+        )
+    except Exception as e:
+        logger.error(f"Ошибка анализа видео {path}: {e}")
+        return [{"path": path, "type": "video", "error": repr(e)}], None
+    return [{"path": path, "type": "video", **asdict(result)}], result.timings
+
+
+def _iter_tasks(paths: Iterable[Path], done: Set[str], image_chunk: int) -> Iterator[tuple]:
+    pending_images: List[str] = []
+    for path in paths:
+        key = str(path)
+        if key in done:
+            continue
+        if is_video_path(path):
+            yield ("video", key)
+        else:
+            pending_images.append(key)
+            if len(pending_images) >= image_chunk:
+                yield ("images", pending_images)
+                pending_images = []
+    if pending_images:
+        yield ("images", pending_images)
+
+
+def _crash_records(task: tuple, error: BaseException) -> List[Dict]:
+    kind, payload = task
+    if kind == "video":
+        return [{"path": payload, "type": "video", "error": repr(error)}]
+    return [{"path": p, "type": "image", "error": repr(error)} for p in payload]
+
+
+def _split_crashed(task: tuple) -> List[tuple]:
+    """Упавшую пачку изображений дробим по одному, чтобы ошибкой пометить только виновника."""
+    kind, payload = task
+    if kind == "images" and len(payload) > 1:
+        return [("images", [p]) for p in payload]
+    return []
+
+
+def run_scan(
+    targets: List[str],
+    out_path: Path,
+    workers: int = 1,
+    threads_per_worker: int = 0,
+    threshold: float = 0.5,
+    batch_size: Optional[int] = None,
+    image_chunk: int = 64,
+    max_side: int = 768,
+    retry_errors: bool = False,
+    max_in_flight: Optional[int] = None,
+    cache_path: Optional[Path] = None,
+    cache_max_mb: float = 256.0,
+    triage: bool = False,
+    adaptive: bool = False,
+    server_socket: Optional[str] = None,
+    precision: Optional[str] = None,
+    backend: str = "eager",
+    frame_cache_dir: Optional[Path] = None,
+    frame_cache_max_mb: float = 4096.0,
+    metrics_out: Optional[Path] = None,
+    token_merge: Optional[float] = None,
+    cascade_side: Optional[int] = None,
+    cascade_band: float = 0.15,
+    dedup_threshold: Optional[float] = None,
+    heads: Optional[List[str]] = None,
+    combine: str = "mean",
+    head_weights: Optional[List[float]] = None,
+) -> int:
+    """
+    batch_size — None: из автотюнинга (AUTOTUNE_PATH) или размер по умолчанию.
+    metrics_out — включить трассировку стадий и записать гистограммы (.json или Prometheus text).
+    token_merge — доля токенов ViT, объединяемых в каждом слое (ToMe); быстрее ценой сдвига вероятностей.
+    cascade_side — каскад разрешений: сначала оценка на этом разрешении, полное — при |p - threshold| < cascade_band.
+    dedup_threshold — почти одинаковые кадры видео оцениваются один раз (None — выключено).
+    heads — ансамбль голов (EnsembleClassifier): каталоги чекпоинтов, [] — все checkpoint-*
+    из PROJECT_DIR; combine и head_weights — правило объединения и веса для "weighted".
+    """
+    from app.config.settings import AUTOTUNE_PATH
+
+    done = load_checkpoint(out_path, retry_errors=retry_errors)
+    if done:
+        logger.info(f"Чекпоинт: {len(done)} файлов уже обработано, они будут пропущены.")
+
+    tasks = _iter_tasks(iter_media_paths(targets), done, image_chunk)
+    max_in_flight = max_in_flight or max(2, workers * 2)
+
+    written = 0
+    started = time.perf_counter()
+    initargs = (
+        threads_per_worker,
+        str(cache_path) if cache_path else None,
+        cache_max_mb,
+        server_socket,
+        precision,
+        backend,
+        str(frame_cache_dir) if frame_cache_dir else None,
+        frame_cache_max_mb,
+        metrics_out is not None,
+        AUTOTUNE_PATH if batch_size is None else None,
+        token_merge,
+        cascade_side,
+        cascade_band,
+        heads,
+        combine,
+        head_weights,
+        threshold,
+    )
+
+    def new_executor() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=workers, mp_context=get_context("spawn"), initializer=_init_worker, initargs=initargs
+        )
+
+    def submit(task: tuple) -> Future:
+        kind, payload = task
+        if kind == "video":
+            return executor.submit(
+                _scan_video, payload, threshold, batch_size, max_side, triage, adaptive, dedup_threshold
+            )
+        return executor.submit(_scan_images, payload, threshold, batch_size)
+
+    executor = new_executor()
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(out_path, "a", encoding="utf-8") as out:
+
+            def write(records: List[Dict]) -> None:
+                nonlocal written
+                for record in records:
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    written += 1
+                out.flush()
+
+            in_flight: Dict[Future, tuple] = {}
+            # Задачи, бывшие в работе, когда воркер упал (segfault в декодере и т.п.):
+            # запускаются по одной, чтобы следующее падение указало на виновника.
+            suspects: List[tuple] = []
+            exhausted = False
+
+            while True:
+                if suspects:
+                    if not in_flight:
+                        task = suspects.pop(0)
+                        in_flight[submit(task)] = task
+                else:
+                    while not exhausted and len(in_flight) < max_in_flight:
+                        task = next(tasks, None)
+                        if task is None:
+                            exhausted = True
+                            break
+                        in_flight[submit(task)] = task
+
+                if not in_flight:
+                    break
+
+                wait(in_flight, return_when=FIRST_COMPLETED)
+                crashed: List[tuple] = []
+                broken: Optional[BrokenProcessPool] = None
+                for fut in [f for f in in_flight if f.done()]:
+                    task = in_flight.pop(fut)
+                    try:
+                        records, timings = fut.result()
+                    except BrokenProcessPool as e:
+                        crashed.append(task)
+                        broken = e
+                        continue
+                    tracing.metrics.observe_summary(timings)
+                    write(records)
+
+                if broken is not None:
+                    # Пул сломан целиком: незавершённые задачи тоже не вернутся.
+                    crashed.extend(in_flight.values())
+                    in_flight.clear()
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = new_executor()
+                    if len(crashed) == 1:
+                        parts = _split_crashed(crashed[0])
+                        if parts:
+                            suspects.extend(parts)
+                        else:
+                            records = _crash_records(crashed[0], broken)
+                            logger.error(f"Воркер аварийно завершился на {', '.join(r['path'] for r in records)}")
+                            write(records)
+                    else:
+                        logger.warning(
+                            f"Воркер аварийно завершился; {len(crashed)} задач будут повторены по одной."
+                        )
+                        suspects.extend(crashed)
+
+                elapsed = time.perf_counter() - started
+                logger.info(f"Обработано файлов: {written} ({written / max(elapsed, 1e-9):.2f} файл/с)")
+    except KeyboardInterrupt:
+        logger.warning("Сканирование прервано. Повторный запуск продолжит с чекпоинта.")
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    else:
+        executor.shutdown(wait=True)
+
+    logger.info(f"Сканирование завершено: записано {written} результатов в {out_path}")
+    if metrics_out is not None:
+        tracing.metrics.write(metrics_out)
+        logger.info(f"Метрики стадий записаны в {metrics_out}")
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from app.core.backends import BACKENDS
+    from app.core.ensemble import COMBINE_RULES
+    from app.core.precision import PRECISION_MODES
+
+    parser = argparse.ArgumentParser(
+        prog="python -m app.scan",
+        description="Пакетная проверка изображений и видео на дипфейки без GUI.",
+    )
+    parser.add_argument("targets", nargs="+", help="Каталоги, glob-шаблоны или файлы.")
+    parser.add_argument("--out", type=Path, default=Path("scan_results.jsonl"),
+                        help="JSONL с результатами; также используется как чекпоинт.")
+    parser.add_argument("--workers", type=int, default=1, help="Число процессов-воркеров.")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="torch-потоков на воркер (0 — по умолчанию torch).")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="По умолчанию — из python -m app.tune для этой машины, иначе 16.")
+    parser.add_argument("--image-chunk", type=int, default=64,
+                        help="Сколько изображений отправлять воркеру за одну задачу.")
+    parser.add_argument("--max-side", type=int, default=768)
+    parser.add_argument("--retry-errors", action="store_true",
+                        help="Повторить файлы, которые в чекпоинте завершились ошибкой.")
+    parser.add_argument("--cache", type=Path, default=None,
+                        help="SQLite-кэш результатов по содержимому файлов (общий для воркеров).")
+    parser.add_argument("--cache-max-mb", type=float, default=256.0)
+    parser.add_argument("--frame-cache", type=Path, default=None,
+                        help="Каталог кэша декодированных кадров видео: повторные прогоны без декодирования.")
+    parser.add_argument("--frame-cache-max-mb", type=float, default=4096.0)
+    parser.add_argument("--metrics-out", type=Path, default=None,
+                        help="Трассировка стадий: гистограммы времени в файл (.json или Prometheus text); "
+                             "в записях видео появится поле timings.")
+    parser.add_argument("--token-merge", type=float, default=None,
+                        help="Доля токенов ViT, объединяемых в каждом слое (ToMe), например 0.1; "
+                             "см. python -m app.bench.token_merging.")
+    parser.add_argument("--cascade-side", type=int, default=None,
+                        help="Каскад разрешений: первый проход на этом разрешении (например 256), "
+                             "полное — только для неуверенных оценок.")
+    parser.add_argument("--cascade-band", type=float, default=0.15,
+                        help="Полоса неуверенности вокруг --threshold для каскада.")
+    parser.add_argument("--dedup", nargs="?", type=float, const=DEDUP_THRESHOLD, default=None,
+                        metavar="THRESHOLD",
+                        help="Один прогон модели на группу почти одинаковых кадров видео "
+                             f"(средняя разница яркости меньше THRESHOLD, по умолчанию {DEDUP_THRESHOLD}).")
+    parser.add_argument("--heads", nargs="*", default=None, metavar="CKPT",
+                        help="Ансамбль голов с общим backbone: каталоги чекпоинтов (без аргументов — все "
+                             "checkpoint-* из PROJECT_DIR). В записях изображений — per_head_probs.")
+    parser.add_argument("--combine", choices=COMBINE_RULES, default="mean",
+                        help="Правило объединения голов ансамбля.")
+    parser.add_argument("--head-weights", nargs="+", type=float, default=None,
+                        help="Веса голов для --combine weighted, по одному на чекпоинт.")
+    parser.add_argument("--triage", action="store_true",
+                        help="Быстрый первичный отсев видео: оценка только по ключевым кадрам.")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Останавливать анализ видео, когда решение по порогу уже не изменится.")
+    parser.add_argument("--server", nargs="?", const="", default=None, metavar="SOCKET",
+                        help="Считать через сервер инференса app.server (без аргумента — сокет по умолчанию).")
+    parser.add_argument("--precision", choices=PRECISION_MODES, default=None,
+                        help="Режим точности (без --server); по умолчанию PRECISION из настроек.")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager",
+                        help="compile/export окупаются на больших сканах; export кэширует граф рядом с чекпоинтом.")
+    args = parser.parse_args(argv)
+    logger.info("=== Приложение запущено ===")
+    if args.heads is not None and (args.server is not None or args.cascade_side):
+        parser.error("--heads несовместим с --server и --cascade-side")
+    if args.combine == "weighted" and (
+        args.head_weights is None or (args.heads and len(args.head_weights) != len(args.heads))
+    ):
+        parser.error("--combine weighted требует --head-weights, по одному на чекпоинт из --heads")
+
+    server_socket = args.server
+    if server_socket == "":
+        from app.config.settings import INFERENCE_SOCKET_PATH
+
+        server_socket = INFERENCE_SOCKET_PATH
+
+    run_scan(
+        args.targets,
+        args.out,
+        workers=args.workers,
+        threads_per_worker=args.threads,
+        threshold=args.threshold,
+        batch_size=args.batch_size,
+        image_chunk=args.image_chunk,
+        max_side=args.max_side,
+        retry_errors=args.retry_errors,
+        cache_path=args.cache,
+        cache_max_mb=args.cache_max_mb,
+        triage=args.triage,
+        adaptive=args.adaptive,
+        server_socket=server_socket,
+        precision=args.precision,
+        backend=args.backend,
+        frame_cache_dir=args.frame_cache,
+        frame_cache_max_mb=args.frame_cache_max_mb,
+        metrics_out=args.metrics_out,
+        token_merge=args.token_merge,
+        cascade_side=args.cascade_side,
+        cascade_band=args.cascade_band,
+        dedup_threshold=args.dedup,
+        heads=args.heads,
+        combine=args.combine,
+        head_weights=args.head_weights,
+    )
+
+
+if __name__ == "__main__":
+    main()
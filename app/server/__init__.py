@@ -0,0 +1,3 @@
+from app.server.client import InferenceClient, RemoteClassifier
+
+__all__ = ["InferenceClient", "RemoteClassifier"]
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import socket
+import threading
+from multiprocessing import shared_memory, util
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from app.config.settings import INFERENCE_SOCKET_PATH
+from app.core.cache import ResultCache
+from app.core.frame_cache import FrameCache
+from app.core.inference import DeepfakeClassifier, ImageInput
+from app.core.tensor_preprocess import TensorPreprocessor
+from app.server.protocol import recv_message, send_message
+from app.services import tracing
+from app.services.logger import logger
+
+
+class InferenceClient:
+    """Соединение с app.server: кадры пишутся в собственный блок shared_memory, по сокету идёт только его имя."""
+
+    def __init__(self, socket_path: Optional[str] = None, timeout: Optional[float] = None):
+        self.socket_path = socket_path or INFERENCE_SOCKET_PATH
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(self.socket_path)
+
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._lock = threading.Lock()
+        # Воркеры пула не вызывают close() сами: освобождаем блок при выходе процесса.
+        util.Finalize(self, self.close, exitpriority=10)
+
+    def _request(self, message: dict) -> dict:
+        send_message(self._sock, message)
+        reply = recv_message(self._sock)
+        if reply is None:
+            raise ConnectionError("Сервер инференса закрыл соединение")
+        if not reply.get("ok"):
+            raise RuntimeError(f"Ошибка сервера инференса: {reply.get('error')}")
+        return reply
+
+    def info(self) -> dict:
+        with self._lock:
+            return self._request({"op": "info"})
+
+    def stats(self) -> dict:
+        with self._lock:
+            return self._request({"op": "stats"})
+
+    def _frames_buffer(self, n: int, h: int, w: int) -> np.ndarray:
+        nbytes = n * h * w * 3
+        if self._shm is None or self._shm.size < nbytes:
+            old = self._shm.size if self._shm is not None else 0
+            self._release_shm()
+            self._shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 2 * old))
+        return np.ndarray((n, h, w, 3), dtype=np.uint8, buffer=self._shm.buf)
+
+    def infer(self, images: Sequence[ImageInput], preprocessor: TensorPreprocessor) -> List[float]:
+        """Отресайзить кадры прямо в shared_memory и получить вероятности."""
+        n, h, w = len(images), preprocessor.height, preprocessor.width
+        with self._lock:
+            frames = self._frames_buffer(n, h, w)
+            preprocessor.resize_uint8(images, out=frames)
+            del frames
+            reply = self._request({"op": "infer", "shm": self._shm.name, "shape": [n, h, w, 3]})
+        return [float(p) for p in reply["probs"]]
+
+    def _release_shm(self) -> None:
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._sock.close()
+            finally:
+                self._release_shm()
+
+    def __enter__(self) -> "InferenceClient":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+class RemoteClassifier(DeepfakeClassifier):
+    """
+    Тонкий клиент с API DeepfakeClassifier: декодирование видео, ресайз и кэш
+    результатов остаются в процессе клиента, модель — одна на сервере.
+    """
+
+    def __init__(
+        self,
+        socket_path: Optional[str] = None,
+        cache: Optional[ResultCache] = None,
+        timeout: Optional[float] = None,
+        frame_cache: Optional[FrameCache] = None,
+    ):
+        self.client = InferenceClient(socket_path, timeout=timeout)
+        info = self.client.info()
+
+        self.cache = cache
+        self.frame_cache = frame_cache
+        self.preprocess = "tensor"
+        self.tensor_preprocessor = TensorPreprocessor(info["ckpt_dir"])
+        if [self.tensor_preprocessor.height, self.tensor_preprocessor.width, 3] != info["frame_shape"]:
+            raise RuntimeError(
+                f"Размер кадра клиента не совпадает с сервером: {info['frame_shape']}"
+            )
+        self.model_fingerprint = info["fingerprint"] if cache is not None else ""
+        # Запрос крупнее max_batch сервера превысил бы его батч — режем на стороне клиента.
+        self.server_max_batch = int(info.get("max_batch") or 0)
+
+        logger.info(f"RemoteClassifier подключён к {self.client.socket_path} (pid сервера {info['pid']})")
+
+    def _infer_batch(self, images: Sequence[ImageInput], batch_size: int) -> List[float]:
+        if self.server_max_batch:
+            batch_size = min(batch_size, self.server_max_batch)
+        probs: List[float] = []
+        for start in range(0, len(images), batch_size):
+            chunk = images[start : start + batch_size]
+            with tracing.span("remote.infer", items=len(chunk)):
+                probs.extend(self.client.infer(chunk, self.tensor_preprocessor))
+        return probs
+
+    def close(self) -> None:
+        self.client.close()
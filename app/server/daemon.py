@@ -0,0 +1,296 @@
+"""
+Локальный демон инференса: одна модель на машину для всех воркеров.
+
+    python -m app.server --socket /tmp/deepfake-inference.sock --max-batch 32 --max-delay-ms 5
+
+Запросы клиентов (app.server.client.RemoteClassifier) собираются в
+динамические батчи: батч уходит в модель, когда набралось max_batch кадров
+или первый запрос прождал max_delay_ms. Кадры передаются через
+multiprocessing.shared_memory уже отресайзенными до размера модели.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import queue
+import signal
+import socketserver
+import threading
+import time
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from typing import List, Optional
+
+import numpy as np
+
+from app.server.protocol import recv_message, send_message
+from app.services.logger import logger
+
+
+@dataclass
+class _Request:
+    # Представление поверх shared_memory клиента; обнуляется до ответа, чтобы блок можно было закрыть.
+    pixels: Optional[np.ndarray]
+    size: int = 0
+    done: threading.Event = field(default_factory=threading.Event)
+    probs: Optional[List[float]] = None
+    error: Optional[str] = None
+
+
+class DynamicBatcher:
+    """Склеивает одновременные запросы в батчи и прогоняет их одним потоком."""
+
+    def __init__(self, classifier, max_batch: int = 32, max_delay_ms: float = 5.0):
+        self.classifier = classifier
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000.0
+
+        self.batches = 0
+        self.frames = 0
+        self.requests = 0
+        self.busy_sec = 0.0
+
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        # Запрос, не поместившийся в предыдущий батч: открывает следующий.
+        self._carry: Optional[_Request] = None
+        self._thread = threading.Thread(target=self._loop, name="dynamic-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, pixels: np.ndarray) -> List[float]:
+        """Блокирующий вызов из потока соединения. pixels — NHWC uint8 размера модели."""
+        if pixels.shape[0] == 0:
+            return []
+        req = _Request(pixels, size=pixels.shape[0])
+        self._queue.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise RuntimeError(req.error)
+        return req.probs
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        """
+        Запросы в батч не больше max_batch кадров (больше — только если первый
+        запрос сам крупнее, его _infer_batch режет на части).
+        """
+        pending = [first]
+        size = first.size
+        deadline = time.monotonic() + self.max_delay
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                req = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if req is None:
+                # Досчитать набранное, остановиться на следующем круге.
+                self._queue.put(None)
+                break
+            if size + req.size > self.max_batch:
+                self._carry = req
+                break
+            pending.append(req)
+            size += req.size
+        return pending
+
+    def _loop(self) -> None:
+        while True:
+            first, self._carry = self._carry or self._queue.get(), None
+            if first is None:
+                return
+            pending = self._collect(first)
+
+            started = time.perf_counter()
+            probs: List[float] = []
+            error: Optional[str] = None
+            try:
+                if len(pending) == 1:
+                    batch = first.pixels
+                else:
+                    batch = np.concatenate([r.pixels for r in pending])
+                probs = self.classifier._infer_batch(batch, batch_size=self.max_batch)
+            except Exception as e:
+                logger.error(f"Ошибка инференса батча на сервере: {e}")
+                error = repr(e)
+            finally:
+                batch = None
+                first = None
+                for r in pending:
+                    r.pixels = None
+            self.busy_sec += time.perf_counter() - started
+
+            offset = 0
+            for r in pending:
+                r.error = error
+                r.probs = probs[offset : offset + r.size]
+                offset += r.size
+                r.done.set()
+
+            if error is None:
+                self.batches += 1
+                self.requests += len(pending)
+                self.frames += offset
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "frames": self.frames,
+            "mean_batch": (self.frames / self.batches) if self.batches else 0.0,
+            "busy_sec": self.busy_sec,
+        }
+
+
+class _ConnectionHandler(socketserver.BaseRequestHandler):
+    server: "InferenceServer"
+
+    def setup(self) -> None:
+        self._shm: Optional[shared_memory.SharedMemory] = None
+
+    def _attach(self, name: str) -> shared_memory.SharedMemory:
+        # Клиент держит один блок и пересоздаёт его только при росте батча.
+        if self._shm is None or self._shm.name != name:
+            self._detach()
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        return self._shm
+
+    def _detach(self) -> None:
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+
+    def _infer(self, message: dict) -> dict:
+        n, h, w, c = message["shape"]
+        if (h, w, c) != self.server.frame_shape:
+            raise ValueError(f"Ожидались кадры {self.server.frame_shape}, получено {(h, w, c)}")
+        shm = self._attach(message["shm"])
+        pixels = np.ndarray((n, h, w, c), dtype=np.uint8, buffer=shm.buf)
+        try:
+            probs = self.server.batcher.submit(pixels)
+        finally:
+            del pixels
+        return {"ok": True, "probs": probs}
+
+    def handle(self) -> None:
+        try:
+            while True:
+                message = recv_message(self.request)
+                if message is None:
+                    return
+                op = message.get("op")
+                try:
+                    if op == "infer":
+                        reply = self._infer(message)
+                    elif op == "info":
+                        reply = {"ok": True, **self.server.info()}
+                    elif op == "stats":
+                        reply = {"ok": True, **self.server.batcher.stats()}
+                    else:
+                        reply = {"ok": False, "error": f"Неизвестная операция: {op}"}
+                except Exception as e:
+                    reply = {"ok": False, "error": repr(e)}
+                send_message(self.request, reply)
+        except (ConnectionError, OSError) as e:
+            logger.warning(f"Соединение с клиентом оборвано: {e}")
+        finally:
+            self._detach()
+
+
+class InferenceServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, classifier, max_batch: int = 32, max_delay_ms: float = 5.0):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _ConnectionHandler)
+        self.socket_path = socket_path
+        self.classifier = classifier
+        self.batcher = DynamicBatcher(classifier, max_batch=max_batch, max_delay_ms=max_delay_ms)
+
+        pre = classifier.tensor_preprocessor
+        self.frame_shape = (pre.height, pre.width, 3)
+
+    def info(self) -> dict:
+        from app.config.settings import CKPT_DIR
+        from app.core.cache import checkpoint_fingerprint
+
+        return {
+            "ckpt_dir": os.path.abspath(CKPT_DIR),
+            "fingerprint": f"{checkpoint_fingerprint(CKPT_DIR)}:{self.classifier._variant_tag()}",
+            "frame_shape": list(self.frame_shape),
+            "max_batch": self.batcher.max_batch,
+            "pid": os.getpid(),
+        }
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.batcher.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from app.config.settings import INFERENCE_SOCKET_PATH
+    from app.core.backends import BACKENDS
+    from app.core.precision import PRECISION_MODES
+
+    parser = argparse.ArgumentParser(
+        prog="python -m app.server",
+        description="Локальный сервер инференса с динамическим батчингом.",
+    )
+    parser.add_argument("--socket", default=INFERENCE_SOCKET_PATH, help="Путь Unix-сокета.")
+    parser.add_argument("--max-batch", type=int, default=32, help="Максимум кадров в батче.")
+    parser.add_argument("--max-delay-ms", type=float, default=5.0,
+                        help="Сколько ждать добора батча после первого запроса.")
+    parser.add_argument("--precision", choices=PRECISION_MODES, default=None)
+    parser.add_argument("--backend", choices=BACKENDS, default="eager")
+    parser.add_argument("--compile-mode", default=None, help="mode для torch.compile (--backend compile).")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="torch-потоков (0 — по умолчанию torch).")
+    parser.add_argument("--token-merge", type=float, default=None,
+                        help="Доля токенов ViT, объединяемых в каждом слое (ToMe), например 0.1.")
+    args = parser.parse_args(argv)
+    logger.info("=== Приложение запущено ===")
+
+    import torch
+
+    from app.core.inference import DeepfakeClassifier
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    classifier = DeepfakeClassifier(
+        preprocess="tensor",
+        precision=args.precision,
+        backend=args.backend,
+        compile_mode=args.compile_mode,
+        token_merge=args.token_merge,
+    )
+    if classifier.tensor_preprocessor is None:
+        raise SystemExit("Серверу нужна тензорная предобработка (size height/width в preprocessor_config).")
+
+    server = InferenceServer(args.socket, classifier, max_batch=args.max_batch, max_delay_ms=args.max_delay_ms)
+    logger.info(
+        f"Сервер инференса слушает {args.socket} "
+        f"(max_batch={args.max_batch}, max_delay={args.max_delay_ms} мс)"
+    )
+    def _on_sigterm(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, _on_sigterm)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Остановка сервера инференса...")
+    finally:
+        server.server_close()
+        logger.info(f"Сервер остановлен: {server.batcher.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Протокол сервера инференса: сообщения JSON с 4-байтовым префиксом длины.
+Пиксели через сокет не передаются — только имя блока shared_memory и форма
+батча NHWC uint8 в нём.
+"""
+import json
+import socket
+import struct
+from typing import Optional
+
+_HEADER = struct.Struct("!I")
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+
+def send_message(sock: socket.socket, message: dict) -> None:
+    data = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> Optional[bytes]:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            return None
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def recv_message(sock: socket.socket) -> Optional[dict]:
+    """Прочитать одно сообщение; None — соединение закрыто."""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_MESSAGE_BYTES:
+        raise ValueError(f"Слишком большое сообщение: {size} байт")
+    data = _recv_exact(sock, size)
+    if data is None:
+        return None
+    return json.loads(data.decode("utf-8"))
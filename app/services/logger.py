@@ -5,7 +5,9 @@ logger.setLevel(logging.INFO)
 
 formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
 
-file_handler = logging.FileHandler("app.log", encoding="utf-8")
+# delay=True: файл открывается при первой записи, а не при импорте
+# (сообщение о запуске пишут точки входа: GUI и CLI).
+file_handler = logging.FileHandler("app.log", encoding="utf-8", delay=True)
 file_handler.setFormatter(formatter)
 file_handler.setLevel(logging.INFO)
 
@@ -15,5 +17,3 @@ stream_handler.setLevel(logging.INFO)
 
 logger.addHandler(file_handler)
 logger.addHandler(stream_handler)
-
-logger.info("=== Приложение запущено ===")
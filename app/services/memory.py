@@ -0,0 +1,61 @@
+import os
+import resource
+import sys
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS процесса в МБ."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт КБ, macOS — байты.
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def reset_peak_rss() -> bool:
+    """
+    Сбросить пик RSS процесса до текущего RSS (Linux: /proc/self/clear_refs, VmHWM).
+    False — сброс не поддерживается, ru_maxrss остаётся пиком за всю жизнь процесса.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def window_peak_rss_mb() -> float:
+    """Пиковый RSS с последнего reset_peak_rss() (VmHWM); без /proc — пик за всю жизнь процесса."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return peak_rss_mb()
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def memory_limit_mb() -> float:
+    """Доступная процессу память: лимит cgroup (контейнер), иначе физическая память машины."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                raw = f.read().strip()
+        except OSError:
+            continue
+        # cgroup v1 без лимита отдаёт огромное число вместо "max".
+        if raw != "max" and int(raw) < 1 << 60:
+            return int(raw) / (1024 * 1024)
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return float("inf")
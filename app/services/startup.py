@@ -0,0 +1,73 @@
+"""
+Отчёт о запуске GUI (python -m app.main --startup-report): время до первого
+окна и до готовности модели, тяжёлые модули, загруженные до показа окна, и
+кумулятивное время импорта пакетов верхнего уровня — как -X importtime, но
+сгруппированно.
+"""
+import builtins
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+# Модули, которые не должны импортироваться до показа окна.
+HEAVY_MODULES = ("torch", "transformers", "av", "cv2", "safetensors")
+
+
+class StartupReport:
+    def __init__(self):
+        self.enabled = False
+        self.started = time.perf_counter()
+        self.marks: List[Tuple[str, float]] = []
+        self.heavy_at: Dict[str, List[str]] = {}
+        self.import_times: Dict[str, float] = {}
+        self._original_import = None
+        self._depth: Dict[str, int] = {}
+
+    def enable(self) -> None:
+        if self.enabled:
+            return
+        self.enabled = True
+        self.started = time.perf_counter()
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        top = name.partition(".")[0]
+        # Меряем только первый (внешний) импорт ещё не загруженного пакета.
+        if level != 0 or top in sys.modules or self._depth.get(top):
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        self._depth[top] = 1
+        started = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            self._depth[top] = 0
+            self.import_times[top] = self.import_times.get(top, 0.0) + time.perf_counter() - started
+
+    def mark(self, name: str) -> None:
+        if not self.enabled:
+            return
+        self.marks.append((name, time.perf_counter() - self.started))
+        self.heavy_at[name] = [m for m in HEAVY_MODULES if m in sys.modules]
+
+    def format(self, top: int = 15) -> str:
+        lines = ["=== Отчёт о запуске ==="]
+        for name, elapsed in self.marks:
+            heavy = ", ".join(self.heavy_at.get(name, [])) or "-"
+            lines.append(f"{name:>16}: {elapsed * 1000:8.1f} мс  (тяжёлые модули: {heavy})")
+        lines.append("Импорт пакетов (кумулятивно, мс):")
+        for module, elapsed in sorted(self.import_times.items(), key=lambda kv: -kv[1])[:top]:
+            lines.append(f"{elapsed * 1000:10.1f}  {module}")
+        return "\n".join(lines)
+
+    def disable(self) -> Optional[str]:
+        if not self.enabled:
+            return None
+        builtins.__import__ = self._original_import
+        self.enabled = False
+        return self.format()
+
+
+startup_report = StartupReport()
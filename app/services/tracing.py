@@ -0,0 +1,299 @@
+"""
+Спаны стадий конвейера (декодирование, ресайз, предобработка, копирование на
+устройство, forward) с временем, числом элементов (кадров) и пиковым RSS.
+
+По умолчанию выключено: span() возвращает общий пустой контекст-менеджер,
+и цена — один вызов функции. Включается enable() или DEEPFAKE_TRACE=1.
+
+    with tracing.collect() as trace:          # отчёт по одному запросу
+        with tracing.span("model.forward", items=len(batch)):
+            ...
+    trace.summary()                           # {"stages": {...}, "peak_rss_mb": ...}
+
+Итоги запросов (и спаны вне collect()) копятся в metrics — гистограммы
+по стадиям с экспортом в Prometheus text format или JSON.
+"""
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from app.services.memory import reset_peak_rss, window_peak_rss_mb
+
+
+# Границы корзин гистограммы времени стадии, секунды.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = os.environ.get("DEEPFAKE_TRACE", "") not in ("", "0")
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("deepfake_trace", default=None)
+
+# Число открытых collect(): пик RSS сбрасывается, только когда ни один запрос не собирается.
+_active_traces = 0
+_active_lock = threading.Lock()
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+    def add_items(self, n: int) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """Суммы по стадиям одного запроса; пополняется из любых потоков, унаследовавших контекст."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.seconds: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.items: Dict[str, int] = {}
+        self.peak_rss_mb = 0.0
+
+    def add(self, stage: str, seconds: float, items: int, rss_mb: float) -> None:
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+            self.items[stage] = self.items.get(stage, 0) + items
+            self.peak_rss_mb = max(self.peak_rss_mb, rss_mb)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            stages = {}
+            for stage, seconds in self.seconds.items():
+                items = self.items[stage]
+                stages[stage] = {
+                    "seconds": round(seconds, 6),
+                    "calls": self.calls[stage],
+                    "items": items,
+                    "items_per_sec": round(items / seconds, 3) if items and seconds > 0 else None,
+                }
+            return {
+                "wall_seconds": round(time.perf_counter() - self.started, 6),
+                "peak_rss_mb": round(self.peak_rss_mb, 1),
+                "stages": stages,
+            }
+
+
+class _Span:
+    __slots__ = ("stage", "items", "sync", "started")
+
+    def __init__(self, stage: str, items: int, sync: Optional[Callable[[], None]]):
+        self.stage = stage
+        self.items = items
+        self.sync = sync
+
+    def add_items(self, n: int) -> None:
+        self.items += n
+
+    def __enter__(self) -> "_Span":
+        if self.sync is not None:
+            self.sync()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.sync is not None:
+            self.sync()
+        elapsed = time.perf_counter() - self.started
+        rss = window_peak_rss_mb()
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(self.stage, elapsed, self.items, rss)
+        else:
+            metrics.observe(self.stage, elapsed, self.items, rss)
+
+
+def span(stage: str, items: int = 0, sync: Optional[Callable[[], None]] = None):
+    """
+    Замер стадии. items — число обработанных элементов (кадров) для items/s;
+    можно дополнить по ходу через add_items(). sync — функция синхронизации
+    устройства (например, torch.cuda.synchronize) для честного времени на GPU.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(stage, items, sync)
+
+
+@contextlib.contextmanager
+def collect() -> Iterator[Optional[Trace]]:
+    """
+    Собрать спаны запроса в Trace (None, если трассировка выключена); итог уходит в metrics.
+    Вложенный collect() возвращает уже собираемый Trace внешнего запроса.
+    peak_rss_mb — пик с начала запроса (VmHWM сбрасывается на входе); при
+    параллельных запросах в одном процессе — с начала самого раннего из них.
+    """
+    if not _enabled:
+        yield None
+        return
+    outer = _current_trace.get()
+    if outer is not None:
+        yield outer
+        return
+    global _active_traces
+    with _active_lock:
+        if _active_traces == 0:
+            reset_peak_rss()
+        _active_traces += 1
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        with _active_lock:
+            _active_traces -= 1
+        metrics.observe_summary(trace.summary())
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по корзинам (верхняя граница корзины)."""
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (math.inf,), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def cumulative(self) -> List[int]:
+        out, total = [], 0
+        for n in self.counts:
+            total += n
+            out.append(total)
+        return out
+
+
+class MetricsRegistry:
+    """Гистограммы времени по стадиям (одно наблюдение — стадия одного запроса), счётчики элементов, пиковый RSS."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = tuple(buckets)
+        self.histograms: Dict[str, Histogram] = {}
+        self.items: Dict[str, int] = {}
+        self.peak_rss_mb = 0.0
+
+    def observe(self, stage: str, seconds: float, items: int = 0, rss_mb: float = 0.0) -> None:
+        with self._lock:
+            hist = self.histograms.get(stage)
+            if hist is None:
+                hist = self.histograms[stage] = Histogram(self.buckets)
+            hist.observe(seconds)
+            self.items[stage] = self.items.get(stage, 0) + items
+            self.peak_rss_mb = max(self.peak_rss_mb, rss_mb)
+
+    def observe_summary(self, summary: Optional[Dict]) -> None:
+        """Учесть Trace.summary() — в том числе пришедший из другого процесса (воркер скана)."""
+        if not summary:
+            return
+        if "wall_seconds" in summary:
+            self.observe("request", summary["wall_seconds"], 0, summary.get("peak_rss_mb", 0.0))
+        for stage, stats in summary.get("stages", {}).items():
+            self.observe(stage, stats["seconds"], stats.get("items", 0), summary.get("peak_rss_mb", 0.0))
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.items.clear()
+            self.peak_rss_mb = 0.0
+
+    def to_json(self) -> Dict:
+        with self._lock:
+            stages = {}
+            for stage, hist in sorted(self.histograms.items()):
+                stages[stage] = {
+                    "count": hist.count,
+                    "sum_seconds": round(hist.sum, 6),
+                    "items": self.items.get(stage, 0),
+                    "items_per_sec": round(self.items[stage] / hist.sum, 3) if self.items.get(stage) and hist.sum > 0 else None,
+                    "p50_seconds": hist.quantile(0.5),
+                    "p95_seconds": hist.quantile(0.95),
+                    "buckets": dict(zip([str(b) for b in hist.buckets] + ["+Inf"], hist.cumulative())),
+                }
+            return {"peak_rss_mb": round(self.peak_rss_mb, 1), "stages": stages}
+
+    def to_prometheus(self, prefix: str = "deepfake") -> str:
+        with self._lock:
+            lines = [
+                f"# HELP {prefix}_stage_seconds Wall time of a pipeline stage per request.",
+                f"# TYPE {prefix}_stage_seconds histogram",
+            ]
+            for stage, hist in sorted(self.histograms.items()):
+                label = f'stage="{stage}"'
+                for bound, n in zip(list(hist.buckets) + ["+Inf"], hist.cumulative()):
+                    le = bound if isinstance(bound, str) else repr(float(bound))
+                    lines.append(f'{prefix}_stage_seconds_bucket{{{label},le="{le}"}} {n}')
+                lines.append(f"{prefix}_stage_seconds_sum{{{label}}} {hist.sum!r}")
+                lines.append(f"{prefix}_stage_seconds_count{{{label}}} {hist.count}")
+            lines += [
+                f"# HELP {prefix}_stage_items_total Items (frames, images) processed by a stage.",
+                f"# TYPE {prefix}_stage_items_total counter",
+            ]
+            for stage, items in sorted(self.items.items()):
+                lines.append(f'{prefix}_stage_items_total{{stage="{stage}"}} {items}')
+            lines += [
+                f"# HELP {prefix}_peak_rss_megabytes Peak resident set size.",
+                f"# TYPE {prefix}_peak_rss_megabytes gauge",
+                f"{prefix}_peak_rss_megabytes {self.peak_rss_mb!r}",
+            ]
+            return "\n".join(lines) + "\n"
+
+    def write(self, path) -> None:
+        """Экспорт в файл: .json — JSON, иначе Prometheus text format."""
+        path = str(path)
+        text = json.dumps(self.to_json(), indent=2) if path.endswith(".json") else self.to_prometheus()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,67 @@
+"""
+Подбор batch_size и числа потоков для этой машины.
+
+    python -m app.tune [--batch-sizes 1 4 16 64] [--threads 8 16 32] [--precision int8]
+
+Результат сохраняется в AUTOTUNE_PATH по отпечатку машины и модели; GUI,
+app.scan и app.features подхватывают его при старте.
+"""
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import List, Optional
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from app.config.settings import AUTOTUNE_PATH
+    from app.core.autotune import DEFAULT_BATCH_SIZES
+    from app.core.backends import BACKENDS
+    from app.core.precision import PRECISION_MODES
+
+    parser = argparse.ArgumentParser(prog="python -m app.tune", description="Автотюнинг batch_size и потоков.")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=list(DEFAULT_BATCH_SIZES))
+    parser.add_argument("--threads", nargs="+", type=int, default=None,
+                        help="Числа потоков для перебора (по умолчанию 1, 2, 4, ... и все ядра).")
+    parser.add_argument("--frame-size", nargs=2, type=int, default=[768, 432], metavar=("W", "H"),
+                        help="Размер синтетических кадров (как после ресайза видео до max_side).")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--memory-budget-mb", type=float, default=None,
+                        help="Предел пикового RSS (по умолчанию 60%% лимита памяти процесса).")
+    parser.add_argument("--precision", choices=PRECISION_MODES, default=None)
+    parser.add_argument("--backend", choices=BACKENDS, default="eager")
+    parser.add_argument("--ckpt-dir", default=None)
+    parser.add_argument("--out", type=Path, default=Path(AUTOTUNE_PATH))
+    parser.add_argument("--dry-run", action="store_true", help="Только напечатать результат.")
+    args = parser.parse_args(argv)
+
+    from app.services.logger import logger
+    logger.info("=== Приложение запущено ===")
+
+    from app.core.autotune import autotune, save_tuned
+    from app.core.inference import DeepfakeClassifier
+
+    classifier = DeepfakeClassifier(precision=args.precision, backend=args.backend, ckpt_dir=args.ckpt_dir)
+    result = autotune(
+        classifier,
+        batch_sizes=args.batch_sizes,
+        thread_counts=args.threads,
+        frame_size=tuple(args.frame_size),
+        repeat=args.repeat,
+        memory_budget_mb=args.memory_budget_mb,
+    )
+
+    print(f"{'потоков':>8} {'батч':>6} {'изобр/с':>9} {'RSS, МБ':>9}")
+    for t in result.trials:
+        ips = f"{t['images_per_sec']:>9.1f}" if "images_per_sec" in t else f"{'-':>9}"
+        rss = f"{t['peak_rss_mb']:>9.0f}" if "peak_rss_mb" in t else f"{'-':>9}"
+        print(f"{t['num_threads']:>8} {t['batch_size']:>6} {ips} {rss}  {t.get('error', '')}")
+    print(f"Лучшее: batch_size={result.batch_size}, потоков {result.num_threads} ({result.images_per_sec:.1f} изобр/с)")
+
+    if not args.dry_run:
+        save_tuned(result, args.out)
+        print(f"Сохранено в {args.out} (отпечаток {result.fingerprint})")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,21 @@ from __future__ import annotations
 import sys
 from PyQt6.QtWidgets import QApplication
 
-from app.core.inference import DeepfakeClassifier
+import app.config.settings  # noqa: F401  (настройки PIL; torch здесь не импортируется)
+from app.services.logger import logger
+from app.services.startup import startup_report
 from app.ui.main_window import MainWindow
 
 
 def main():
+    logger.info("=== Приложение запущено ===")
+    startup_report.mark("imports")
     app = QApplication(sys.argv)
-    classifier = DeepfakeClassifier()
-    window = MainWindow(classifier)
+    window = MainWindow()
     window.show()
+    startup_report.mark("first_window")
+    # Модель грузится в фоне: окно доступно сразу, «Анализировать» включится по готовности.
+    window.start_model_load()
     sys.exit(app.exec())
 
 
@@ -1,36 +1,175 @@
-from app.core.inference import PredictionResult, VideoPredictionResult
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from PyQt6.QtCore import QThread
+
 from app.services.logger import logger
+from app.services.startup import startup_report
+from app.ui.inference_worker import InferenceWorker
+from app.ui.model_load_worker import ModelLoadWorker
+
+if TYPE_CHECKING:
+    from app.core.inference import PredictionResult, VideoPredictionResult
+
+
+def start_model_load(self):
+    if self.classifier is not None or self.model_thread is not None:
+        return
+
+    self.model_status_label.setText("Модель: загрузка...")
+    worker = ModelLoadWorker()
+    thread = QThread(self)
+    worker.moveToThread(thread)
+
+    thread.started.connect(worker.run)
+    worker.loaded.connect(self._on_model_loaded)
+    worker.failed.connect(self._on_model_load_failed)
+    for signal in (worker.loaded, worker.failed):
+        signal.connect(thread.quit)
+    thread.finished.connect(self._on_model_thread_finished)
+
+    self.model_worker = worker
+    self.model_thread = thread
+    thread.start()
+
+
+def _on_model_loaded(self, classifier):
+    self.classifier = classifier
+    self.model_status_label.setText("Модель: готова")
+    logger.info("Модель готова к анализу.")
+    self.update_predict_enabled()
+
+    startup_report.mark("model_ready")
+    report = startup_report.disable()
+    if report is not None:
+        print(report, flush=True)
+
+
+def _on_model_load_failed(self, message: str):
+    self.model_status_label.setText("Модель: ошибка загрузки")
+    self.status_bar.showMessage(f"Не удалось загрузить модель: {message}")
+
+
+def _on_model_thread_finished(self):
+    if self.model_thread is not None:
+        self.model_thread.deleteLater()
+    if self.model_worker is not None:
+        self.model_worker.deleteLater()
+    self.model_thread = None
+    self.model_worker = None
+
+
+def update_predict_enabled(self):
+    self.predict_btn.setEnabled(
+        self.classifier is not None
+        and self.current_media_path is not None
+        and self.inference_thread is None
+    )
 
 
 def run_prediction(self):
+    if self.classifier is None:
+        return
     if self.current_media_path is None:
         return
+    if self.inference_thread is not None:
+        return
+    if self.current_media_type != "video" and self.current_pil_image is None:
+        return
 
     logger.info("Пользователь запустил анализ.")
     threshold = self.threshold_spin.value() / 100
     self.status_bar.showMessage("Анализ...")
 
-    try:
-        if self.current_media_type == "video":
-            result = self.classifier.predict_video(
-                self.current_media_path,
-                threshold=threshold,
-                agg_method="median_of_means",
-                chunk_count=8,
-                batch_size=16,
-                max_side=768,
-            )
-            self._display_video_result(result)
-        else:
-            if self.current_pil_image is None:
-                return
-            result = self.classifier.predict(self.current_pil_image, threshold)
-            self._display_result(result)
-
-    except Exception as e:
-        logger.error(f"Ошибка инференса: {e}")
-        self.status_bar.showMessage("Ошибка анализа!")
+    worker = InferenceWorker(
+        self.classifier,
+        self.current_media_type,
+        self.current_media_path,
+        self.current_pil_image,
+        threshold,
+    )
+    thread = QThread(self)
+    worker.moveToThread(thread)
+
+    thread.started.connect(worker.run)
+    worker.progress.connect(self._on_inference_progress)
+    worker.finished.connect(self._on_inference_finished)
+    worker.failed.connect(self._on_inference_failed)
+    worker.cancelled.connect(self._on_inference_cancelled)
+    for signal in (worker.finished, worker.failed, worker.cancelled):
+        signal.connect(thread.quit)
+    thread.finished.connect(self._on_inference_thread_finished)
+
+    self.inference_worker = worker
+    self.inference_thread = thread
+
+    self.predict_btn.setEnabled(False)
+    self.cancel_btn.setVisible(True)
+    self.cancel_btn.setEnabled(True)
+    self.progress_bar.setValue(0)
+    self.progress_bar.setVisible(self.current_media_type == "video")
+
+    thread.start()
+
+
+def cancel_prediction(self):
+    if self.inference_worker is None:
         return
+    logger.info("Пользователь отменил анализ.")
+    self.inference_worker.cancel()
+    self.cancel_btn.setEnabled(False)
+    self.status_bar.showMessage("Отмена анализа...")
+
+
+def _on_inference_progress(self, done: int, total: int, running_prob: float):
+    self.progress_bar.setMaximum(max(total, 1))
+    self.progress_bar.setValue(done)
+
+    prob_pct = int(running_prob * 100)
+    self.result_label.setText(
+        f"<i>Анализ: {done}/{total} кадров</i><br>"
+        f"Текущая вероятность дипфейка: <b>{running_prob:.4f}</b> ({prob_pct}%)"
+    )
+    self.status_bar.showMessage(f"Анализ... {done}/{total} кадров")
+
+
+def _on_inference_finished(self, result):
+    from app.core.inference import VideoPredictionResult
+
+    if isinstance(result, VideoPredictionResult):
+        self._display_video_result(result)
+    else:
+        self._display_result(result)
+
+
+def _on_inference_failed(self, message: str):
+    self.status_bar.showMessage("Ошибка анализа!")
+
+
+def _on_inference_cancelled(self):
+    self.result_label.setText("Анализ отменён.")
+    self.status_bar.showMessage("Анализ отменён.")
+
+
+def _on_inference_thread_finished(self):
+    if self.inference_thread is not None:
+        self.inference_thread.deleteLater()
+    if self.inference_worker is not None:
+        self.inference_worker.deleteLater()
+    self.inference_thread = None
+    self.inference_worker = None
+
+    self.cancel_btn.setVisible(False)
+    self.progress_bar.setVisible(False)
+    self.update_predict_enabled()
+
+
+def stop_inference(self, wait: bool = False):
+    if self.inference_worker is not None:
+        self.inference_worker.cancel()
+    if wait and self.inference_thread is not None:
+        self.inference_thread.wait()
 
 
 def _display_result(self, result: PredictionResult):
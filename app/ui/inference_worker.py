@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image as PILImage
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from app.core.video import AnalysisCancelled
+from app.services.logger import logger
+
+
+class InferenceWorker(QObject):
+    """Фоновый анализ медиа: живёт в QThread, общается с GUI только сигналами."""
+
+    progress = pyqtSignal(int, int, float)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(
+        self,
+        classifier,
+        media_type: str,
+        media_path: Path,
+        pil_image: Optional[PILImage.Image],
+        threshold: float,
+    ):
+        super().__init__()
+        self.classifier = classifier
+        self.media_type = media_type
+        self.media_path = media_path
+        self.pil_image = pil_image
+        self.threshold = threshold
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def run(self):
+        try:
+            if self.media_type == "video":
+                result = self.classifier.predict_video(
+                    self.media_path,
+                    threshold=self.threshold,
+                    agg_method="median_of_means",
+                    chunk_count=8,
+                    max_side=768,
+                    progress_cb=self.progress.emit,
+                    cancel_event=self._cancel_event,
+                )
+            else:
+                result = self.classifier.predict(
+                    self.pil_image,
+                    self.threshold,
+                    source=self.media_path,
+                )
+        except AnalysisCancelled:
+            logger.info("Анализ отменён пользователем.")
+            self.cancelled.emit()
+            return
+        except Exception as e:
+            logger.error(f"Ошибка инференса: {e}")
+            self.failed.emit(str(e))
+            return
+
+        if self._cancel_event.is_set():
+            self.cancelled.emit()
+            return
+        self.finished.emit(result)
@@ -1,14 +1,14 @@
 from __future__ import annotations
 
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 from pathlib import Path
 
 from PIL import Image as PILImage
+from PyQt6.QtCore import QThread
 from PyQt6.QtMultimedia import QMediaPlayer
 from PyQt6.QtWidgets import QMainWindow
 from PyQt6.QtMultimediaWidgets import QVideoWidget
 
-from app.core.inference import DeepfakeClassifier
 from app.services.logger import logger
 
 from app.ui.ui_builder import build_ui
@@ -16,19 +16,28 @@ from app.ui.styles import apply_style
 from app.ui import media as media_ops
 from app.ui import inference_ui as inference_ops
 from app.ui import drag_drop as dnd_ops
+from app.ui.inference_worker import InferenceWorker
+from app.ui.model_load_worker import ModelLoadWorker
 
+if TYPE_CHECKING:
+    from app.core.inference import DeepfakeClassifier
 
 
 class MainWindow(QMainWindow):
-    def __init__(self, classifier: DeepfakeClassifier):
+    def __init__(self, classifier: Optional[DeepfakeClassifier] = None):
         super().__init__()
 
+        # None, пока модель грузится в фоне (см. start_model_load).
         self.classifier = classifier
         self.current_image_path: Optional[Path] = None
         self.current_pil_image: Optional[PILImage.Image] = None
         self.current_media_path: Optional[Path] = None
         self.current_media_type: Optional[str] = None
         self.video_widget: QVideoWidget
+        self.inference_thread: Optional[QThread] = None
+        self.inference_worker: Optional[InferenceWorker] = None
+        self.model_thread: Optional[QThread] = None
+        self.model_worker: Optional[ModelLoadWorker] = None
 
         self.setWindowTitle("Deepfake Detector — SigLIP2")
         self.resize(1100, 700)
@@ -39,6 +48,8 @@ class MainWindow(QMainWindow):
 
         build_ui(self)
         apply_style(self)
+        if self.classifier is not None:
+            self.model_status_label.setText("Модель: готова")
 
         self.media_player = QMediaPlayer(self)
         self.media_player.mediaStatusChanged.connect(self.on_media_status)
@@ -67,9 +78,52 @@ class MainWindow(QMainWindow):
     def _update_preview(self, path: Path):
         media_ops._update_preview(self, path)
 
+    def start_model_load(self):
+        inference_ops.start_model_load(self)
+
+    def _on_model_loaded(self, classifier):
+        inference_ops._on_model_loaded(self, classifier)
+
+    def _on_model_load_failed(self, message):
+        inference_ops._on_model_load_failed(self, message)
+
+    def _on_model_thread_finished(self):
+        inference_ops._on_model_thread_finished(self)
+
+    def update_predict_enabled(self):
+        inference_ops.update_predict_enabled(self)
+
     def run_prediction(self):
         inference_ops.run_prediction(self)
 
+    def cancel_prediction(self):
+        inference_ops.cancel_prediction(self)
+
+    def stop_inference(self, wait: bool = False):
+        inference_ops.stop_inference(self, wait=wait)
+
+    def _on_inference_progress(self, done, total, running_prob):
+        inference_ops._on_inference_progress(self, done, total, running_prob)
+
+    def _on_inference_finished(self, result):
+        inference_ops._on_inference_finished(self, result)
+
+    def _on_inference_failed(self, message):
+        inference_ops._on_inference_failed(self, message)
+
+    def _on_inference_cancelled(self):
+        inference_ops._on_inference_cancelled(self)
+
+    def _on_inference_thread_finished(self):
+        inference_ops._on_inference_thread_finished(self)
+
+    def closeEvent(self, event):
+        self.stop_inference(wait=True)
+        if self.model_thread is not None:
+            # Загрузку модели не прервать — дожидаемся, чтобы поток не уничтожился на ходу.
+            self.model_thread.wait()
+        super().closeEvent(event)
+
     def _display_result(self, result):
         inference_ops._display_result(self, result)
 
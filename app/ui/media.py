@@ -38,6 +38,8 @@ def load_media_from_path(self, path: Path):
 
 
 def load_image_from_path(self, path: Path):
+    self.stop_inference()
+
     try:
         img = PILImage.open(path)
     except Exception as e:
@@ -59,7 +61,7 @@ def load_image_from_path(self, path: Path):
     self.play_btn.setVisible(False)
     self.stop_btn.setVisible(False)
 
-    self.predict_btn.setEnabled(True)
+    self.update_predict_enabled()
     self.status_bar.showMessage("Изображение загружено.")
 
     self.play_btn.setEnabled(False)
@@ -68,6 +70,8 @@ def load_image_from_path(self, path: Path):
 
 
 def _load_video(self, path: Path):
+    self.stop_inference()
+
     self.current_media_path = path
     self.current_media_type = "video"
 
@@ -87,7 +91,7 @@ def _load_video(self, path: Path):
     self.stop_btn.setEnabled(True)
     self.play_btn.setText("▶ Play")
 
-    self.predict_btn.setEnabled(True)
+    self.update_predict_enabled()
 
     self.status_bar.showMessage("Видео загружено. Нажмите Play.")
 
@@ -107,6 +111,7 @@ def _update_preview(self, path: Path):
 
 
 def clear_interface(self):
+    self.stop_inference()
     self.media_player.stop()
     self.preview_stack.setCurrentIndex(0)
 
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from app.services.logger import logger
+
+
+class ModelLoadWorker(QObject):
+    """Фоновая загрузка DeepfakeClassifier: torch и transformers импортируются здесь, а не при старте GUI."""
+
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def run(self):
+        try:
+            from app.config.settings import (
+                AUTOTUNE_PATH,
+                FRAME_CACHE_DIR,
+                FRAME_CACHE_MAX_MB,
+                RESULT_CACHE_MAX_MB,
+                RESULT_CACHE_PATH,
+            )
+            from app.core.autotune import apply_tuned
+            from app.core.cache import ResultCache
+            from app.core.frame_cache import FrameCache
+            from app.core.inference import DeepfakeClassifier
+
+            cache = ResultCache(RESULT_CACHE_PATH, max_size_mb=RESULT_CACHE_MAX_MB)
+            frame_cache = FrameCache(FRAME_CACHE_DIR, max_size_mb=FRAME_CACHE_MAX_MB)
+            classifier = DeepfakeClassifier(cache=cache, frame_cache=frame_cache)
+            apply_tuned(classifier, AUTOTUNE_PATH)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки модели: {e}")
+            self.failed.emit(str(e))
+            return
+        self.loaded.emit(classifier)
@@ -4,6 +4,7 @@ from PyQt6.QtWidgets import (
     QGroupBox,
     QHBoxLayout,
     QLabel,
+    QProgressBar,
     QPushButton,
     QSlider,
     QSpinBox,
@@ -113,10 +114,21 @@ def build_ui(self):
     self.predict_btn.setMinimumHeight(40)
     controls_layout.addWidget(self.predict_btn, 3, 0, 1, 2)
 
+    self.cancel_btn = QPushButton("Отменить анализ")
+    self.cancel_btn.clicked.connect(self.cancel_prediction)
+    self.cancel_btn.setVisible(False)
+    self.cancel_btn.setMinimumHeight(32)
+    controls_layout.addWidget(self.cancel_btn, 4, 0, 1, 2)
+
+    self.progress_bar = QProgressBar()
+    self.progress_bar.setVisible(False)
+    self.progress_bar.setMaximumHeight(12)
+    controls_layout.addWidget(self.progress_bar, 5, 0, 1, 2)
+
     self.clear_btn = QPushButton("Очистить")
     self.clear_btn.setMinimumHeight(32)
     self.clear_btn.clicked.connect(self.clear_interface)
-    controls_layout.addWidget(self.clear_btn, 4, 0, 1, 2)
+    controls_layout.addWidget(self.clear_btn, 6, 0, 1, 2)
 
     self.threshold_spin.valueChanged.connect(self.threshold_slider.setValue)
     self.threshold_slider.valueChanged.connect(self.threshold_spin.setValue)
@@ -155,6 +167,9 @@ def build_ui(self):
     self.setStatusBar(self.status_bar)
     self.status_bar.showMessage("Готово.")
 
+    self.model_status_label = QLabel("Модель: не загружена")
+    self.status_bar.addPermanentWidget(self.model_status_label)
+
     video_controls = QHBoxLayout()
 
     self.play_btn = QPushButton("▶ Play")
@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.bench.suite import build_tiny_checkpoint
+from app.core import backends
+from app.core.backends import BACKENDS
+from app.core.inference import DeepfakeClassifier
+
+TOLERANCE = 1e-4
+
+
+@pytest.fixture(scope="module")
+def ckpt_dir(tmp_path_factory):
+    # tiny_siglip_config() со случайными весами во временном каталоге чекпоинта.
+    return str(build_tiny_checkpoint(tmp_path_factory.mktemp("ckpt")))
+
+
+@pytest.fixture(scope="module")
+def frames():
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, size=(48 + 7 * i, 80, 3), dtype=np.uint8) for i in range(5)]
+
+
+def _classifier(ckpt_dir: str, backend: str) -> DeepfakeClassifier:
+    return DeepfakeClassifier(backend=backend, precision="fp32", ckpt_dir=ckpt_dir, token_merge=0.0)
+
+
+@pytest.fixture(scope="module")
+def reference(ckpt_dir, frames):
+    return _classifier(ckpt_dir, "eager").predict_batch(frames)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backend_matches_eager(ckpt_dir, frames, reference, backend):
+    clf = _classifier(ckpt_dir, backend)
+    if backend == "compile" and clf.backend.name != backend:
+        pytest.skip("torch.compile недоступен на этой машине")
+    assert clf.backend.name == backend
+
+    # Батч из одного кадра и неполный хвост: проверяется динамическая размерность batch.
+    probs = clf.predict_batch(frames[:1], batch_size=4) + clf.predict_batch(frames[1:], batch_size=3)
+    np.testing.assert_allclose(probs, reference, atol=TOLERANCE)
+
+
+def test_export_artifact_reused(ckpt_dir, frames, reference, monkeypatch):
+    first = _classifier(ckpt_dir, "export")
+    assert first.backend.name == "export"
+    path = first.backend.path
+    assert os.path.dirname(path) == os.path.join(ckpt_dir, backends.EXPORT_DIRNAME)
+    mtime = os.stat(path).st_mtime_ns
+
+    def no_export(*args, **kwargs):
+        raise AssertionError("повторный экспорт вместо загрузки сохранённого графа")
+
+    monkeypatch.setattr(backends, "export_model", no_export)
+    second = _classifier(ckpt_dir, "export")
+    # При ошибке загрузки create_backend откатился бы на eager.
+    assert second.backend.name == "export"
+    assert second.backend.path == path
+    assert os.stat(path).st_mtime_ns == mtime
+    np.testing.assert_allclose(second.predict_batch(frames), reference, atol=TOLERANCE)
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+import torch
+from PIL import Image as PILImage
+from transformers import AutoImageProcessor
+
+from app.bench.preprocess_parity import synthetic_images
+from app.bench.suite import build_tiny_checkpoint
+from app.core.preprocess import _to_uint8, normalize_image_to_rgb
+from app.core.tensor_preprocess import TensorPreprocessor
+
+# Один уровень яркости в нормализованных единицах (mean = std = 0.5) плюс запас на float32.
+ONE_LEVEL = 2 / 255 + 1e-5
+
+
+@pytest.fixture(scope="module")
+def ckpt_dir(tmp_path_factory):
+    # 224, а не 64 по умолчанию: на маленьком входе расхождения ресайза почти не видно.
+    return str(build_tiny_checkpoint(tmp_path_factory.mktemp("ckpt"), image_size=224))
+
+
+@pytest.fixture(scope="module")
+def processor(ckpt_dir):
+    return AutoImageProcessor.from_pretrained(ckpt_dir)
+
+
+@pytest.fixture
+def tensor_pre(ckpt_dir):
+    return TensorPreprocessor(ckpt_dir)
+
+
+def _frame(h: int, w: int, seed: int = 0) -> np.ndarray:
+    """Градиент с шумом: HWC uint8, как кадр видео."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:h, 0:w]
+    base = np.stack([xx * 255 // max(w - 1, 1), yy * 255 // max(h - 1, 1), (3 * xx + yy) % 256], axis=2)
+    return np.clip(base + rng.integers(-20, 21, size=(h, w, 3)), 0, 255).astype(np.uint8)
+
+
+def _reference(processor, images) -> torch.Tensor:
+    pil = [normalize_image_to_rgb(im) for im in images]
+    return processor(images=pil, return_tensors="pt")["pixel_values"].float()
+
+
+def _assert_close(actual: torch.Tensor, expected: torch.Tensor) -> None:
+    assert actual.shape == expected.shape
+    diff = (actual - expected).abs()
+    assert float(diff.max()) <= ONE_LEVEL
+    assert float(diff.mean()) <= 1e-3
+
+
+@pytest.mark.parametrize(
+    "size",
+    [(224, 224), (480, 640), (720, 1280), (768, 432), (97, 1301), (333, 517), (61, 45)],
+)
+def test_uint8_hwc_matches_processor(processor, tensor_pre, size):
+    frame = _frame(*size)
+    _assert_close(tensor_pre([frame]), _reference(processor, [frame]))
+
+
+def test_batched_frames_match_processor(processor, tensor_pre):
+    frames = np.stack([_frame(301, 457, seed) for seed in range(4)])
+    out = tensor_pre(frames).clone()
+    _assert_close(out, _reference(processor, list(frames)))
+    # Батч NHWC и список тех же кадров дают одно и то же.
+    assert torch.equal(out, tensor_pre(list(frames)))
+
+
+def test_mixed_sizes_and_modes_match_processor(processor, tensor_pre):
+    images = synthetic_images()
+    assert any(isinstance(im, PILImage.Image) and im.mode == "RGBA" for im in images)
+    _assert_close(tensor_pre(images), _reference(processor, images))
+
+
+def test_resize_uint8_roundtrip(tensor_pre):
+    frames = np.stack([_frame(180, 320, seed) for seed in range(3)])
+    resized = tensor_pre.resize_uint8(frames)
+    assert resized.shape == (3, 224, 224, 3) and resized.dtype == np.uint8
+
+    out = np.empty_like(resized)
+    assert tensor_pre.resize_uint8(list(frames), out=out) is out
+    np.testing.assert_array_equal(out, resized)
+    assert torch.equal(tensor_pre(resized).clone(), tensor_pre(frames))
+
+
+def test_to_uint8_returns_uint8_input_as_is():
+    frame = _frame(40, 50)
+    frame.flags.writeable = False
+    assert _to_uint8(frame) is frame
+
+
+@pytest.mark.parametrize(
+    "arr, expected",
+    [
+        (np.array([[0.0, 0.5, 1.0]], dtype=np.float32), [[0, 127, 255]]),
+        (np.array([[np.nan, np.inf, -np.inf]], dtype=np.float32), [[0, 255, 0]]),
+        (np.array([[0, 32768, 65535]], dtype=np.uint16), [[0, 127, 255]]),
+    ],
+)
+def test_to_uint8_converts_other_dtypes(arr, expected):
+    original = arr.copy()
+    np.testing.assert_array_equal(_to_uint8(arr), np.array(expected, dtype=np.uint8))
+    np.testing.assert_array_equal(arr, original)
+
+
+def test_read_only_uint8_frames(processor, tensor_pre):
+    # Кадры из memmap-кэша и PIL приходят read-only: uint8-путь их не копирует и не меняет.
+    frames = np.stack([_frame(120, 160, seed) for seed in range(2)])
+    original = frames.copy()
+    frames.flags.writeable = False
+    _assert_close(tensor_pre(frames), _reference(processor, list(original)))
+    _assert_close(tensor_pre(list(frames)), _reference(processor, list(original)))
+    np.testing.assert_array_equal(frames, original)
+
+
+def test_float_frame_matches_uint8(tensor_pre):
+    frame = _frame(90, 130)
+    expected = tensor_pre([frame]).clone()
+    assert float((tensor_pre([frame.astype(np.float32) / 255]) - expected).abs().max()) <= ONE_LEVEL